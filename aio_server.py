@@ -0,0 +1,338 @@
+# asyncio gRPC server (grpc.aio), used by server.py with CO2_GRPC_ASYNC=1
+# -------------------------------
+# The threaded server of server.py holds one of its CO2_IO_THREADS threads for every request in progress, also while the
+# request only waits (for a ridge fit, a compute worker, a flush of the append log or the next chunk of an upload),
+# so with all threads busy even a cache hit queues up behind them.
+# Here every request is a coroutine on one event loop instead:
+#   - what is already in memory is answered right away on the loop: cache hits of the insight RPCs (most of them,
+#     see materializer.py), invalid requests, and the snapshot of a loaded dataset
+#   - only the real work (parsing, appends, insight computations, building big responses) goes to a pool of
+#     CO2_IO_THREADS threads, which then only limits how much of that runs at once
+#   - concurrent cache misses of the same insight share one computation
+# A waiting request costs a few KB of memory instead of a thread, so how many can be in progress at once is set by
+# CO2_GRPC_MAX_CONCURRENT_RPCS (see grpc_settings.py), which can be much higher here than for the threaded server.
+# The RPCs, responses, caches and settings are the ones of server.py.
+
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+
+from protos import service_pb2
+from protos import service_pb2_grpc
+from grpc_settings import GRPC_PORT, GRPC_PROCESSES, MAX_CONCURRENT_RPCS, server_options
+from insight_cache import insight_cache
+from server import (
+    IO_THREADS, SCAN_TOP_DAYS, SCAN_TOP_FACILITIES, STREAM_FACILITIES, CO2AnalyticsService,
+    added_rows, capture_efficiency_response, compress_message, compress_response, compressed_handler, computed_insight,
+    csv_message, fleet_insights_response, fleet_scan_response, insights_response, rpc_finished, serialized_handler,
+    storage_efficiency_response, timed_handler, upload_failed,
+)
+
+STOP_GRACE_SECONDS = 5  # requests in progress get this long to finish when the server stops
+
+logger = logging.getLogger(__name__)
+
+_END = object()  # end of an async iterator, see blocking_iterator()
+
+
+class AsyncCO2AnalyticsService(CO2AnalyticsService):
+    """The service of server.py with async RPCs: in-memory answers on the event loop, blocking work on `executor`.
+
+    Every RPC of the parent class is overridden here, and so is _dataset(), which is a coroutine in this class.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self._computing = {}  # cache key -> computation of an insight in progress, shared by the requests waiting for it
+
+    async def _blocking(self, function, *args, **kwargs):
+        # function(*args, **kwargs) on a thread of the executor; it must not touch the request context
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def _dataset(self, dataset_id, context, write=False):
+        store = self._store(dataset_id, context, write)
+        if store is None:
+            return None, None
+        # the first call after a restart (or after the dataset was unloaded) loads the saved dataset, on a worker thread
+        snapshot = store.snapshot() if store.loaded else await self._blocking(store.snapshot)
+        return store, self._loaded_snapshot(store, snapshot, context)
+
+    async def UploadCSV(self, request, context):
+        logger.debug("Received UploadCSV request")
+        store = self._store(request.dataset_id, context, write=True)
+        if store is None:
+            return service_pb2.UploadCSVResponse(status="failed", message="error")
+
+        try:
+            await self._blocking(store.load_stream, [request.file_content])
+        except Exception as e:
+            return upload_failed(e, context, service_pb2.UploadCSVResponse)
+        return service_pb2.UploadCSVResponse(status="success", message=f"CSV uploaded and saved to {store.csv_path}")
+
+    async def UploadCSVStream(self, request_iterator, context):
+        logger.debug("Received UploadCSVStream request")
+        started = time.perf_counter()
+        first = await next_item(request_iterator)  # the dataset_id of the first chunk names the dataset
+        store = self._store(first.dataset_id if first is not _END else "", context, write=True)
+        if store is None:
+            return service_pb2.UploadCSVStreamResponse(status="failed", message="error")
+        # the worker thread parses the chunks while the loop keeps receiving the next ones
+        chunks = itertools.chain([first] if first is not _END else [], blocking_iterator(request_iterator, asyncio.get_running_loop()))
+        try:
+            snapshot, bytes_received = await self._blocking(store.load_stream, (chunk.data for chunk in chunks))
+        except Exception as e:
+            return upload_failed(e, context, service_pb2.UploadCSVStreamResponse)
+
+        seconds = time.perf_counter() - started
+        rows = snapshot.rows
+        return service_pb2.UploadCSVStreamResponse(
+            status="success",
+            message=f"CSV uploaded and saved to {store.csv_path}",
+            rows=rows,
+            bytes_received=bytes_received,
+            seconds=seconds,
+            rows_per_second=rows / seconds if seconds else 0.0,
+            megabytes_per_second=bytes_received / 1e6 / seconds if seconds else 0.0,
+        )
+
+    async def GetCSV(self, request, context):
+        logger.debug("Received GetCSV request")
+        response = service_pb2.GetCSVResponse()
+        async for chunk in self._csv_chunks(request, context):
+            response.records.extend(chunk.records)
+        return response
+
+    async def StreamCSV(self, request, context):
+        logger.debug("Received StreamCSV request")
+        async for chunk in self._csv_chunks(request, context):
+            yield chunk
+
+    async def _csv_chunks(self, request, context):
+        store = self._store(request.dataset_id, context)
+        if store is None:
+            return
+        chunks = await self._blocking(store.csv_chunks, request.csv_name or os.path.basename(store.csv_path))
+        if chunks is None:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please check the file name.")
+            return
+        while (message := await self._blocking(next_csv_message, chunks)) is not None:
+            yield message
+
+    async def UpdateCSV(self, request, context):
+        logger.debug("Received UpdateCSV request")
+        store, snapshot = await self._dataset(request.dataset_id, context, write=True)
+        if snapshot is None:
+            return service_pb2.UpdateCSVResponse(status="failed", message="error")
+
+        new_entry = await self._blocking(added_rows, store, [request])  # waits for the append log flush off the loop
+        return service_pb2.UpdateCSVResponse(
+            status="success",
+            message=f"Data added to {store.saved_to}",
+            anomaly_flag=bool(new_entry["anomaly_flag"].iloc[0]),
+        )
+
+    async def UpdateCSVBatch(self, request, context):
+        logger.debug("Received UpdateCSVBatch request")
+        store, snapshot = await self._dataset(request.dataset_id, context, write=True)
+        if snapshot is None:
+            return service_pb2.UpdateCSVBatchResponse(status="failed", message="error", batch_id=request.batch_id)
+        return await self._blocking(self._add_batch, store, request)
+
+    async def StreamUpdateCSV(self, request_iterator, context):
+        logger.debug("Received StreamUpdateCSV request")
+        async for request in request_iterator:  # every batch is acknowledged once it is added, before the next one is read
+            store, snapshot = await self._dataset(request.dataset_id, context, write=True)
+            if snapshot is None:
+                return
+            yield await self._blocking(self._add_batch, store, request)
+
+    async def GetInsightsPlot(self, request, context):
+        logger.debug("Received GetInsightsPlot request")
+        return await self._insight("GetInsightsPlot", insights_response, service_pb2.GetInsightsResponse, request, context)
+
+    async def GetCaptureEfficiencyData(self, request, context):
+        logger.debug("Received GetEfficiencyData request")
+        return await self._insight("GetCaptureEfficiencyData", capture_efficiency_response, service_pb2.GetCaptureEfficiencyDataResponse, request, context)
+
+    async def GetStorageEfficiencyData(self, request, context):
+        logger.debug("Received GetStorageEfficiencyData request")
+        return await self._insight("GetStorageEfficiencyData", storage_efficiency_response, service_pb2.GetStorageEfficiencyDataResponse, request, context)
+
+    async def GetFleetInsights(self, request, context):
+        logger.debug("Received GetFleetInsights request")
+        store, snapshot = await self._dataset(request.dataset_id, context)
+        if snapshot is None:
+            return service_pb2.GetFleetInsightsResponse()
+        return await self._blocking(fleet_insights_response, store, snapshot, self._fleet_names(request), request.compact)
+
+    async def ScanFleet(self, request, context):
+        logger.debug("Received ScanFleet request")
+        store, snapshot = await self._dataset(request.dataset_id, context)
+        if snapshot is None:
+            return service_pb2.ScanFleetResponse()
+
+        facility_names = list(dict.fromkeys(request.facility_names)) or None  # empty = every facility
+        return await self._blocking(fleet_scan_response, store, snapshot, facility_names,
+                                    request.top_facilities or SCAN_TOP_FACILITIES, request.top_days or SCAN_TOP_DAYS)
+
+    async def StreamFleetInsights(self, request, context):
+        logger.debug("Received StreamFleetInsights request")
+        store, snapshot = await self._dataset(request.dataset_id, context)
+        if snapshot is None:
+            return
+
+        facility_names = self._fleet_names(request)
+        if facility_names is None:
+            facility_names = list(snapshot.facility_index)
+        for start in range(0, len(facility_names), STREAM_FACILITIES):  # one grouped pass per batch of facilities
+            batch = facility_names[start:start + STREAM_FACILITIES]
+            response = await self._blocking(fleet_insights_response, store, snapshot, batch, request.compact)
+            computed = {facility.facility_name: facility for facility in response.facilities}
+            for facility_name in batch:  # a facility without usable data is sent with only its name
+                yield computed.get(facility_name) or service_pb2.FacilityInsights(facility_name=facility_name)
+
+    async def _insight(self, endpoint, build_response, response_type, request, context):
+        # a cache hit is answered on the loop, a miss is computed on a worker thread (once for all requests waiting for it)
+        store, snapshot = await self._dataset(request.dataset_id, context)
+        if snapshot is None:
+            return response_type()
+        key, dates = self._insight_key(endpoint, request, snapshot, context)
+        if key is None:
+            return response_type()
+        cached = insight_cache.get(key)
+        if cached is not None:
+            return cached
+
+        computing = self._computing.get(key)
+        if computing is None:
+            computing = self._computing[key] = asyncio.ensure_future(
+                self._blocking(computed_insight, key, build_response, store, snapshot, request, dates))
+            computing.add_done_callback(lambda _: self._computing.pop(key, None))
+        data = await asyncio.shield(computing)  # a cancelled request does not cancel the computation the others wait for
+        if data is None:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("No data available for this facility.")
+            return response_type()
+        return data
+
+
+async def next_item(iterator):
+    # the next item of an async iterator, _END after the last one
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+def blocking_iterator(iterator, loop):
+    # the items of an async iterator for code running on a worker thread, each one awaited on the event loop
+    while (item := asyncio.run_coroutine_threadsafe(next_item(iterator), loop).result()) is not _END:
+        yield item
+
+
+def next_csv_message(chunks):
+    # the next GetCSVResponse of a csv_chunks() iterator, None after the last one
+    chunk = next(chunks, None)
+    return None if chunk is None else csv_message(chunk)
+
+
+# The interceptors of server.py, for async handlers_________________________
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """Times every RPC into the co2_grpc_request_seconds histogram, by method and status code."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return timed_handler(await continuation(handler_call_details), handler_call_details, timed_rpc, timed_stream_rpc)
+
+
+class AsyncSerializedResponseInterceptor(grpc.aio.ServerInterceptor):
+    """Lets handlers return already serialized response bytes (from the insight cache) as they are."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return serialized_handler(await continuation(handler_call_details))
+
+
+class AsyncCompressionInterceptor(grpc.aio.ServerInterceptor):
+    """Gzips the responses of GZIP_MIN_BYTES and more (see grpc_settings.py), smaller ones are sent as they are."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return compressed_handler(await continuation(handler_call_details), compressed_rpc, compressed_stream_rpc)
+
+
+def timed_rpc(behavior, method):
+    async def timed(request, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = await behavior(request, context)
+            failed = False
+            return response
+        finally:
+            rpc_finished(started, method, context, failed)
+    return timed
+
+
+def timed_stream_rpc(behavior, method):
+    async def timed(request, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            async for response in behavior(request, context):
+                yield response
+            failed = False
+        finally:
+            rpc_finished(started, method, context, failed)
+    return timed
+
+
+def compressed_rpc(behavior):
+    async def compressed(request, context):
+        return compress_response(context, await behavior(request, context))
+    return compressed
+
+
+def compressed_stream_rpc(behavior):
+    async def compressed(request, context):
+        context.set_compression(grpc.Compression.Gzip)
+        async for response in behavior(request, context):
+            yield compress_message(context, response)
+    return compressed
+
+
+def server_interceptors():
+    return [AsyncMetricsInterceptor(), AsyncSerializedResponseInterceptor(), AsyncCompressionInterceptor()]
+#___________________________
+
+
+def create_server(io_threads=IO_THREADS, address=f"[::]:{GRPC_PORT}", reuse_port=GRPC_PROCESSES > 1):
+    """A grpc.aio server of the service with the settings of grpc_settings.py, listening on `address`, and its port.
+
+    Call it with an event loop running. `io_threads` threads do the blocking work.
+    """
+    executor = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="co2-aio-worker")
+    server = grpc.aio.server(
+        interceptors=server_interceptors(),
+        options=server_options(reuse_port),
+        maximum_concurrent_rpcs=MAX_CONCURRENT_RPCS if MAX_CONCURRENT_RPCS > 0 else None,
+    )
+    service_pb2_grpc.add_CO2AnalyticsServiceServicer_to_server(AsyncCO2AnalyticsService(executor), server)
+    port = server.add_insecure_port(address)
+    return server, port
+
+
+async def serve(io_threads=IO_THREADS, address=f"[::]:{GRPC_PORT}", reuse_port=GRPC_PROCESSES > 1, started=None):
+    """Run a grpc.aio server until it is stopped (or the task is cancelled), calling started(port) once it listens."""
+    server, port = create_server(io_threads, address, reuse_port)
+    await server.start()
+    if started is not None:
+        started(port)
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(STOP_GRACE_SECONDS)
@@ -0,0 +1,208 @@
+# Write-ahead log of appended rows
+# -------------------------------
+# Every batch of rows added with UpdateCSV / update_csv is first written to this log, and only acknowledged once the
+# log is flushed to disk. Writes are grouped ("group commit"): a background thread flushes everything that came in
+# since the last flush at once, when FLUSH_ROWS rows are waiting or FLUSH_MS milliseconds after the oldest one arrived,
+# so many concurrent writers share one fsync instead of paying for one each.
+#
+# The rows are only saved into the dataset files (csv or columnar_store.py) later, when the dataset store merges them
+# into its main frame. After that the log is checkpointed: the checkpoint file records the sequence number of the
+# last saved batch and the log segments holding them are removed. On a restart, batches after the checkpoint are replayed.
+#
+# If a flush fails (e.g. the disk is full), its rows are not durable: the writers waiting for it and every later write() or
+# wait() raise an OSError instead of hanging, until the process is restarted and replays what did reach the disk.
+#
+# Layout of the directory:
+#   segment-<first seq>.log   one JSON line per batch: {"seq": n, "rows": {column: [values]}}
+#   checkpoint                sequence number of the last batch already saved in the dataset files
+
+import glob
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+LOG_DIR = "./dataset_log"
+FLUSH_ROWS = 1000  # flush as soon as this many rows are waiting
+FLUSH_MS = 5       # otherwise flush this long after the oldest waiting row arrived
+
+
+class AppendLog:
+    """Durable, group-committed log of appended row batches, numbered by a sequence number that never goes back."""
+
+    def __init__(self, directory=LOG_DIR, flush_rows=FLUSH_ROWS, flush_ms=FLUSH_MS):
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_ms / 1000
+        self._checkpoint_path = os.path.join(directory, "checkpoint")
+        self._condition = threading.Condition()  # guards the pending lines and sequence numbers
+        self._io_lock = threading.Lock()          # guards the open segment file, writers never wait for it
+        self._pending = []          # JSON lines not written yet
+        self._pending_rows = 0
+        self._oldest_pending = 0.0  # time.monotonic() of the first pending batch
+        self._file = None
+        self._written_seq = 0       # last sequence number written to a segment file, guarded by _io_lock
+        self._flusher = None
+        self._error = None          # the exception of a failed flush, raised to every writer from then on
+        self.flushed_seq = None     # read from disk on first use, see _recover()
+        self.last_seq = None
+        self._read_to = {}          # segment path -> (byte offset, seq) of the last whole batch replay() read in it
+
+    def write(self, rows, columns=None):
+        """Queue one batch of rows and return its sequence number. It is durable once wait(seq) returns.
+
+        With `columns` only those columns are written, in that order (columns the rows do not have as missing values).
+        """
+        values = dict(zip(rows.columns, rows.to_numpy(dtype=object).T.tolist()))  # (to_dict and reindex are slower)
+        if columns is not None:
+            values = {column: values.get(column, [None] * len(rows)) for column in columns}
+        encoded = json.dumps(values, default=str)
+        with self._condition:
+            self._recover()
+            self._raise_error()
+            self.last_seq += 1
+            self._pending.append(f'{{"seq": {self.last_seq}, "rows": {encoded}}}\n')
+            if not self._pending_rows:
+                self._oldest_pending = time.monotonic()
+            self._pending_rows += len(rows)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="append-log-flusher", daemon=True)
+                self._flusher.start()
+            self._condition.notify_all()
+            return self.last_seq
+
+    def wait(self, seq):
+        """Block until the batch `seq` (and every batch before it) is flushed to disk."""
+        with self._condition:
+            self._recover()
+            while self.flushed_seq < seq:
+                self._raise_error()
+                self._condition.wait()
+
+    def checkpoint(self, seq):
+        """Every batch up to `seq` is saved in the dataset files: remember that, and drop the log segments holding them."""
+        self.wait(seq)
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            os.makedirs(self.directory, exist_ok=True)
+            partial = self._checkpoint_path + ".part"
+            with open(partial, "w") as f:
+                f.write(str(seq))
+            os.replace(partial, self._checkpoint_path)  # write the checkpoint before removing anything
+            for path in self._segment_paths():
+                if self._segment_seq(path) <= seq:
+                    os.remove(path)
+
+    def current_seq(self):
+        """Sequence number of the last batch written so far."""
+        with self._condition:
+            self._recover()
+            return self.last_seq
+
+    def saved_seq(self):
+        """Sequence number of the last batch saved in the dataset files (0 if none)."""
+        try:
+            with open(self._checkpoint_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def replay(self, after_seq=0):
+        """(seq, rows) of every batch in the log after `after_seq`, oldest first.
+
+        Only reads the files, so it can also be used by processes that never write (see compute_pool.py).
+        A half-written last line (a crash in the middle of a flush) is ignored.
+        Segments whose batches are all up to `after_seq` are skipped, and in the others reading starts after the last batch
+        an earlier replay() read if that one is up to `after_seq` too: a reader following the log (DatasetStore.catch_up)
+        only reads and parses the batches written since it last looked.
+        """
+        batches = []
+        paths = self._segment_paths()
+        for path in list(self._read_to):
+            if path not in paths:
+                del self._read_to[path]  # removed by a checkpoint
+        for position, path in enumerate(paths):
+            if position + 1 < len(paths) and _first_seq(paths[position + 1]) - 1 <= after_seq:
+                continue
+            offset, seq = self._read_to.get(path, (0, 0))
+            if seq > after_seq:
+                offset = 0  # asked for batches before the ones read last time
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    offset += len(line)
+                    self._read_to[path] = (offset, record["seq"])
+                    if record["seq"] > after_seq:
+                        batches.append((record["seq"], pd.DataFrame(record["rows"])))
+        return batches
+
+    def _recover(self):
+        # must be called with the condition held: continue numbering after whatever is already on disk
+        if self.last_seq is None:
+            batches = self.replay(self.saved_seq())
+            self.last_seq = batches[-1][0] if batches else self.saved_seq()
+            self.flushed_seq = self._written_seq = self.last_seq
+
+    def _flush_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                while self._pending_rows < self.flush_rows:  # group commit: wait a little for more writers
+                    remaining = self._oldest_pending + self.flush_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                lines, seq = self._pending, self.last_seq
+                self._pending, self._pending_rows = [], 0
+
+            try:
+                with self._io_lock:  # new batches keep queueing up while this one is written
+                    if self._file is None:
+                        os.makedirs(self.directory, exist_ok=True)
+                        self._file = open(os.path.join(self.directory, f"segment-{seq - len(lines) + 1:012d}.log"), "a")
+                    self._file.write("".join(lines))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._written_seq = seq
+            except Exception as e:  # wake the writers with the error, or they would wait for this flush forever
+                with self._condition:
+                    self._error = e
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                self.flushed_seq = seq
+                self._condition.notify_all()
+
+    def _raise_error(self):
+        # must be called with the condition held
+        if self._error is not None:
+            raise OSError(f"The append log could not be written to disk: {self._error}") from self._error
+
+    def _segment_paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, "segment-*.log")))
+
+    def _segment_seq(self, path):
+        # must be called with _io_lock held: sequence number of the last batch in a segment,
+        # one before the first of the next segment, or the last one written
+        paths = self._segment_paths()
+        position = paths.index(path)
+        if position + 1 < len(paths):
+            return _first_seq(paths[position + 1]) - 1
+        return self._written_seq
+
+
+def _first_seq(path):
+    # sequence number of the first batch in a segment, from its name
+    return int(os.path.basename(path)[8:-4])
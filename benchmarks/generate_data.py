@@ -0,0 +1,79 @@
+# Synthetic fleet data for the benchmarks
+# -------------------------------
+# Writes csv files with the same columns as GlobalInput (see protos/service.proto), for any number of rows and facilities.
+# Rows are generated in chunks, so even 50M-row files only need the memory of one chunk.
+# The same arguments and seed always give the same file.
+#
+#   python -m benchmarks.generate_data --rows 1000000 --facilities 500 --out fleet.csv
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["date", "facility_id", "facility_name", "country", "region", "storage_site_type",
+           "co2_emitted_tonnes", "co2_captured_tonnes", "co2_stored_tonnes",
+           "capture_efficiency_percent", "storage_integrity_percent"]
+COUNTRIES = [("NO", "EU"), ("NL", "EU"), ("GB", "EU"), ("US", "NA"), ("CA", "NA"), ("AU", "APAC")]
+SITE_TYPES = ["saline", "depleted_oil_field", "depleted_gas_field", "basalt"]
+CHUNK_ROWS = 1_000_000
+
+
+def fleet_chunk(start_row, rows, facilities, total_rows, days=120, start_date="2024-01-01",
+                missing_fraction=0.02, seed=0):
+    """Rows start_row .. start_row + rows of a fleet of `total_rows` readings, spread evenly over `days` days.
+
+    Readings go round the facilities (row i belongs to facility i % facilities), so the file is in date order
+    like a stream of sensor readings, and every facility gets about total_rows / facilities of them.
+    """
+    rng = np.random.default_rng([seed, start_row])  # each chunk has its own stream: same result whatever the chunk size
+    index = np.arange(start_row, start_row + rows)
+    facility = index % facilities
+    per_facility = max(1, -(-total_rows // facilities))
+    day = (index // facilities) * days // per_facility
+    dates = (np.datetime64(start_date, "D") + day).astype(str)
+
+    emitted = rng.uniform(50, 150, rows)
+    efficiency = rng.uniform(70, 95, rows)
+    captured = emitted * efficiency / 100
+    stored = captured * rng.uniform(0.9, 1.0, rows)
+    stored[rng.random(rows) < missing_fraction] = np.nan  # some readings miss a value, they get anomaly_flag=True
+    country = facility % len(COUNTRIES)
+    return pd.DataFrame({
+        "date": dates,
+        "facility_id": np.char.add("F", np.char.zfill(facility.astype(str), 5)),
+        "facility_name": np.char.add("Facility ", facility.astype(str)),
+        "country": np.array([c for c, _ in COUNTRIES])[country],
+        "region": np.array([r for _, r in COUNTRIES])[country],
+        "storage_site_type": np.array(SITE_TYPES)[facility % len(SITE_TYPES)],
+        "co2_emitted_tonnes": emitted.round(2),
+        "co2_captured_tonnes": captured.round(2),
+        "co2_stored_tonnes": stored.round(2),
+        "capture_efficiency_percent": efficiency.round(2),
+        "storage_integrity_percent": rng.uniform(95, 100, rows).round(2),
+    }, columns=COLUMNS)
+
+
+def generate_fleet(rows, facilities, **options):
+    """The whole synthetic fleet as one DataFrame (for sizes that fit in memory)."""
+    return fleet_chunk(0, rows, facilities, rows, **options)
+
+
+def write_fleet_csv(path, rows, facilities, chunk_rows=CHUNK_ROWS, **options):
+    """Write a synthetic fleet of `rows` readings from `facilities` facilities to `path`, one chunk at a time."""
+    for start in range(0, rows, chunk_rows):
+        chunk = fleet_chunk(start, min(chunk_rows, rows - start), facilities, rows, **options)
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic CO2 fleet dataset")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--facilities", type=int, default=100)
+    parser.add_argument("--days", type=int, default=120, help="Days the readings are spread over")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default="fleet.csv")
+    args = parser.parse_args()
+    write_fleet_csv(args.out, args.rows, args.facilities, days=args.days, seed=args.seed)
+    print(f"Wrote {args.rows} rows of {args.facilities} facilities to {args.out}")
@@ -0,0 +1,262 @@
+# Benchmark harness for the analytics service
+# -------------------------------
+# For every dataset size (rows x facilities) this generates a synthetic fleet (see generate_data.py), then measures:
+#   - loading the dataset into the store
+#   - every insight function of insights.py, called directly
+#   - every gRPC endpoint, against an in-process server on a free local port
+#   - the FastAPI endpoints, through an in-process test client
+# Each endpoint is called by `--concurrency` threads at once. The report has latency percentiles, throughput and
+# the peak RSS of the process, as JSON that can be compared with the report of another commit (--compare).
+#
+# Every size runs in its own subprocess, in its own temporary directory, so peak RSS is per size and the
+# dataset files of one size never leak into the next.
+#
+#   python -m benchmarks.run_benchmarks --sizes 1000x10,100000x100 --out report.json
+#   python -m benchmarks.run_benchmarks --sizes 1000x10 --compare old_report.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.generate_data import write_fleet_csv
+
+DEFAULT_SIZES = "1000x10,100000x100"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def latency_stats(latencies, seconds, errors=0):
+    """Percentiles (in ms) and throughput of one measured operation."""
+    latencies = np.asarray(latencies) * 1000
+    if not len(latencies):
+        return {"calls": 0, "errors": errors}
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        "throughput_per_s": len(latencies) / seconds if seconds else 0.0,
+    }
+
+
+def measure(call, arguments, concurrency):
+    """Run call(argument) for every argument on `concurrency` threads, returns latency_stats."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def timed(argument):
+        started = time.perf_counter()
+        try:
+            call(argument)
+        except Exception:
+            with lock:
+                errors[0] += 1
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, arguments))
+    return latency_stats(latencies, time.perf_counter() - started, errors[0])
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != "darwin" else peak / 1024 / 1024  # kilobytes on Linux, bytes on macOS
+
+
+# One dataset size, run inside its own subprocess_________________________
+def run_size(rows, facilities, requests, concurrency, chunk_bytes=1 << 20):
+    sys.path.insert(0, ROOT)
+    import grpc
+    from fastapi.testclient import TestClient
+
+    from protos import service_pb2, service_pb2_grpc
+    from dataset_store import store
+    from insight_cache import insight_cache
+    from insights import CO2_emssion_pattern, detect_efficiency_pattern, storage_efficiency_pattern, fleet_insights
+    import server
+    import service
+
+    result = {"rows": rows, "facilities": facilities}
+    started = time.perf_counter()
+    write_fleet_csv("fleet.csv", rows, facilities)
+    result["generate_seconds"] = time.perf_counter() - started
+    result["csv_megabytes"] = os.path.getsize("fleet.csv") / 1e6
+
+    started = time.perf_counter()
+    snapshot = store.load_csv("fleet.csv")
+    result["load_seconds"] = time.perf_counter() - started
+    result["peak_rss_mb_after_load"] = peak_rss_mb()
+    result["dataset_memory_mb"] = snapshot.memory_bytes(deep=True) / 1e6
+
+    rng = random.Random(0)
+    names = list(snapshot.facility_index)
+    sample = [rng.choice(names) for _ in range(requests)]
+
+    # insight functions, called directly on the snapshot
+    functions = {}
+    for function in (CO2_emssion_pattern, detect_efficiency_pattern, storage_efficiency_pattern):
+        functions[function.__name__] = measure(lambda name: function(snapshot, name), sample, 1)
+    functions["fleet_insights"] = measure(lambda _: fleet_insights(snapshot), range(max(1, requests // 50)), 1)
+    result["functions"] = functions
+
+    # gRPC endpoints, against an in-process server with the settings of grpc_settings.py
+    grpc_server, port = server.create_server(concurrency, "127.0.0.1:0", reuse_port=False)
+    grpc_server.start()
+    channel = grpc.insecure_channel(f"127.0.0.1:{port}", options=[("grpc.max_receive_message_length", -1)])
+    stub = service_pb2_grpc.CO2AnalyticsServiceStub(channel)
+
+    def upload_chunks():
+        with open("fleet.csv", "rb") as f:
+            for data in iter(lambda: f.read(chunk_bytes), b""):
+                yield service_pb2.UploadCSVChunk(data=data)
+
+    endpoints = {}
+    started = time.perf_counter()
+    stub.UploadCSVStream(upload_chunks())
+    endpoints["UploadCSVStream"] = latency_stats([time.perf_counter() - started], time.perf_counter() - started)
+
+    insight_rpcs = {
+        "GetInsightsPlot": (stub.GetInsightsPlot, service_pb2.GetInsightsRequest),
+        "GetCaptureEfficiencyData": (stub.GetCaptureEfficiencyData, service_pb2.GetCaptureEfficiencyDataRequest),
+        "GetStorageEfficiencyData": (stub.GetStorageEfficiencyData, service_pb2.GetStorageEfficiencyDataRequest),
+    }
+    max_entries = insight_cache.max_entries
+    for endpoint, (rpc, request_type) in insight_rpcs.items():
+        for compact in (False, True):
+            label = endpoint + (":compact" if compact else "")
+            insight_cache.max_entries = 0  # nothing stays cached: every call computes
+            endpoints[label + ":uncached"] = measure(lambda name: rpc(request_type(facility_name=name, compact=compact)), sample, concurrency)
+            insight_cache.max_entries = max_entries
+            endpoints[label + ":cached"] = measure(lambda name: rpc(request_type(facility_name=name, compact=compact)), sample, concurrency)
+    endpoints["GetFleetInsights"] = measure(
+        lambda _: stub.GetFleetInsights(service_pb2.GetFleetInsightsRequest(all_facilities=True)), range(max(1, requests // 50)), 1)
+
+    def entry(i):
+        return service_pb2.GlobalInput(
+            date="2024-05-01", facility_id="F00000", facility_name=names[i % len(names)], country="NO", region="EU",
+            storage_site_type="saline", co2_emitted_tonnes=100.0, co2_captured_tonnes=80.0, co2_stored_tonnes=75.0,
+            capture_efficiency_percent=80.0, storage_integrity_percent=99.0)
+
+    endpoints["UpdateCSV"] = measure(lambda i: stub.UpdateCSV(entry(i)), range(requests), concurrency)
+    batch = [entry(i) for i in range(1000)]
+    batch_stats = measure(lambda i: stub.UpdateCSVBatch(service_pb2.UpdateCSVBatchRequest(entries=batch, batch_id=i)),
+                          range(max(1, requests // 10)), concurrency)
+    batch_stats["rows_per_s"] = batch_stats.get("throughput_per_s", 0.0) * len(batch)
+    endpoints["UpdateCSVBatch"] = batch_stats
+    endpoints["StreamCSV"] = measure(
+        lambda _: sum(1 for _ in stub.StreamCSV(service_pb2.GetCSVRequest(csv_name="fleet.csv"))), range(1), 1)
+    result["grpc"] = endpoints
+    channel.close()
+    grpc_server.stop(0)
+
+    # FastAPI endpoints, one test client per thread
+    clients = threading.local()
+
+    def http_get(path, **params):
+        if not hasattr(clients, "client"):
+            clients.client = TestClient(service.app)
+        response = clients.client.get(path, params=params)
+        response.raise_for_status()
+
+    result["http"] = {
+        "get_insights": measure(lambda name: http_get("/get_insights/", facility_name=name), sample, concurrency),
+        "get_fleet_insights": measure(lambda _: http_get("/get_fleet_insights/", facility_names="all"), range(max(1, requests // 50)), 1),
+    }
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+#___________________________
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(sizes, requests, concurrency):
+    """Run every size in its own subprocess and collect the results into one report."""
+    results = []
+    for rows, facilities in sizes:
+        print(f"Benchmarking {rows} rows x {facilities} facilities...")
+        with tempfile.TemporaryDirectory() as workdir:
+            output = os.path.join(workdir, "result.json")
+            subprocess.run([sys.executable, "-m", "benchmarks.run_benchmarks", "--single", f"{rows}x{facilities}",
+                            "--requests", str(requests), "--concurrency", str(concurrency), "--out", output],
+                           cwd=workdir, env={**os.environ, "PYTHONPATH": ROOT, "CO2_MATERIALIZE": "0"}, check=True)
+            with open(output) as f:
+                results.append(json.load(f))
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "requests": requests,
+        "concurrency": concurrency,
+        "results": results,
+    }
+
+
+def compare(old, new):
+    """Print the p50 latency and throughput of every operation in `new` next to `old` (reports of run_all)."""
+    old_results = {(r["rows"], r["facilities"]): r for r in old["results"]}
+    for result in new["results"]:
+        before = old_results.get((result["rows"], result["facilities"]))
+        if before is None:
+            continue
+        print(f"{result['rows']} rows x {result['facilities']} facilities ({old.get('commit')} -> {new.get('commit')})")
+        for group in ("functions", "grpc", "http"):
+            for name, stats in result.get(group, {}).items():
+                previous = before.get(group, {}).get(name)
+                if not previous or "p50_ms" not in stats or "p50_ms" not in previous:
+                    continue
+                print(f"  {group}/{name}: p50 {previous['p50_ms']:.2f} -> {stats['p50_ms']:.2f} ms "
+                      f"({stats['p50_ms'] / previous['p50_ms']:.2f}x), "
+                      f"throughput {previous['throughput_per_s']:.1f} -> {stats['throughput_per_s']:.1f}/s")
+
+
+def parse_sizes(text):
+    return [tuple(int(part) for part in size.lower().split("x")) for size in text.split(",") if size]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CO2 analytics service")
+    parser.add_argument("--sizes", type=str, default=DEFAULT_SIZES,
+                        help="Comma separated ROWSxFACILITIES, e.g. 1000x10,1000000x1000,50000000x5000")
+    parser.add_argument("--requests", type=int, default=200, help="Calls per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads calling each endpoint at once")
+    parser.add_argument("--out", type=str, default="benchmark_report.json")
+    parser.add_argument("--compare", type=str, help="Report of an earlier run to compare with")
+    parser.add_argument("--single", type=str, help=argparse.SUPPRESS)  # internal: run one size in this process
+    args = parser.parse_args()
+
+    if args.single:
+        (rows, facilities), = parse_sizes(args.single)
+        report = run_size(rows, facilities, args.requests, args.concurrency)
+    else:
+        report = run_all(parse_sizes(args.sizes), args.requests, args.concurrency)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    if not args.single:
+        print(f"Report written to {args.out}")
+        if args.compare:
+            with open(args.compare) as f:
+                compare(json.load(f), report)
@@ -0,0 +1,110 @@
+# Columnar on-disk storage of the dataset
+# -------------------------------
+# The servers used to keep their state only as ./csv_dataset.csv, which has to be parsed as text on every cold start.
+# Here the dataset is kept in Arrow IPC files instead: the dates are already parsed and every column is stored in binary,
+# so a load skips parsing text. What changed is the format only: the files are not partitioned, and the dataset store
+# still reads every row and column into its pandas frame (it needs them all). The files are memory-mapped, so read(columns)
+# never touches the pages of the other columns, and each column's Arrow buffers are released as soon as it is converted.
+#
+# Layout of the directory:
+#   base.arrow           the whole dataset as of the last upload or compaction
+#   delta-<n>.arrow      rows appended since then (UpdateCSV / update_csv), one small file per append
+# Once there are COMPACT_EVERY delta files they are merged into a new base file.
+# Every file records the sequence number of the last append log batch it contains (see append_log.py),
+# so a restart knows which logged batches are already saved here.
+#
+# pyarrow is optional: without it, has_arrow() is False and the dataset store keeps using the csv file.
+
+import glob
+import os
+
+import pandas as pd
+
+from dataset_schema import concat_frames
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - depends on the installation
+    pa = None
+
+COLUMNAR_DIR = "./dataset_columns"
+COMPACT_EVERY = 100  # delta files allowed before they are merged into the base file
+
+
+def has_arrow():
+    return pa is not None
+
+
+class ColumnarStore:
+    """Arrow IPC files holding the dataset: one base file plus small delta files for appended rows."""
+
+    def __init__(self, directory=COLUMNAR_DIR, compact_every=COMPACT_EVERY):
+        self.directory = directory
+        self.compact_every = compact_every
+        self._base_path = os.path.join(directory, "base.arrow")
+        self._dtypes = None  # column types of the base file, appended rows are converted to them
+        self.log_seq = 0  # last append log batch saved in the files, set by read()
+
+    def exists(self):
+        return os.path.exists(self._base_path)
+
+    def write_base(self, frame, log_seq=0):
+        """Replace everything on disk with `frame` (a new upload, or a compaction of base + deltas)."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(frame, self._base_path, log_seq)
+        for path in self._delta_paths():
+            os.remove(path)
+        self._dtypes = frame.dtypes
+
+    def append(self, rows, whole_frame, log_seq=0):
+        """Save appended `rows` (append log batches up to `log_seq`) as a delta file.
+
+        `whole_frame` returns the whole dataset after the append; it is only called when it is time to compact.
+        """
+        deltas = self._delta_paths()
+        if len(deltas) + 1 >= self.compact_every:
+            self.write_base(whole_frame(), log_seq)  # the dataset is in memory anyway, no need to read the files back
+            return
+        number = int(os.path.basename(deltas[-1])[6:-6]) + 1 if deltas else 1
+        self._write(self._conform(rows), os.path.join(self.directory, f"delta-{number:06d}.arrow"), log_seq)
+
+    def read(self, columns=None):
+        """The dataset (only `columns`, if given) from the memory-mapped base file and all deltas."""
+        self.log_seq = 0
+        frames = [self._read(path, columns) for path in [self._base_path] + self._delta_paths()]
+        self._dtypes = frames[0].dtypes
+        return concat_frames(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def _delta_paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, "delta-*.arrow")))
+
+    def _conform(self, rows):
+        # give appended rows the base file's columns and types, so all files can be read back together
+        if self._dtypes is None:
+            self._dtypes = self._read(self._base_path, None).dtypes
+        rows = rows.reindex(columns=self._dtypes.index)
+        for column, dtype in self._dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype) or (dtype == "float32" and rows[column].dtype == "float64"):
+                continue  # values missing from the base file's categories, or too precise for its float32, would be lost
+            try:
+                rows[column] = rows[column].astype(dtype)
+            except (TypeError, ValueError):
+                pass  # e.g. a missing value in an integer column: keep the row's own type
+        return rows
+
+    def _write(self, frame, path, log_seq):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"log_seq": str(log_seq).encode()})
+        partial = path + ".part"
+        with pa.OSFile(partial, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(partial, path)  # readers never see a half-written file
+
+    def _read(self, path, columns):
+        with pa.memory_map(path, "r") as source:
+            table = ipc.open_file(source).read_all()  # zero-copy: the columns point into the mapped file
+            self.log_seq = max(self.log_seq, int((table.schema.metadata or {}).get(b"log_seq", 0)))
+            if columns is not None:
+                table = table.select([c for c in columns if c in table.column_names])
+            return table.to_pandas(split_blocks=True, self_destruct=True)
@@ -0,0 +1,114 @@
+# Process pool for the insight calculations
+# -------------------------------
+# The gRPC server answers requests on a pool of threads, so the pandas filtering and ridge fits of concurrent
+# requests all share one GIL and the server never uses more than about one core for them.
+# With compute workers enabled, the insight functions run in separate worker processes instead.
+#
+# Every worker keeps its own read-only copy of the datasets it was asked about (the WORKER_DATASETS most recently used),
+# loaded from the files the main process saves (the memory-mapped Arrow files of columnar_store.py when pyarrow is
+# installed, otherwise the csv) and from the append log of rows not merged into them yet (append_log.py).
+# Each call carries the dataset's files and the main process's dataset version; a worker whose copy is older catches up first:
+# it adds the append log batches written since its copy (DatasetStore.catch_up), and only re-reads the whole dataset when
+# the main process loaded a new one (an upload, or a read of the saved files) or the batches were merged into the files meanwhile.
+# Before sending a call, the main process waits until the rows of that version are flushed to the log,
+# so the files are never behind the version a worker is asked for.
+
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from append_log import AppendLog
+from columnar_store import ColumnarStore
+from dataset_store import DatasetStore
+
+COMPUTE_WORKERS = int(os.environ.get("CO2_COMPUTE_WORKERS", "0"))  # worker processes, 0 = compute in the calling thread
+WORKER_DATASETS = 4  # datasets each worker keeps in memory, the least recently used one is dropped above this
+
+logger = logging.getLogger(__name__)
+
+
+class ComputePool:
+    """Runs insight functions either in the calling thread (no workers) or in a pool of worker processes."""
+
+    def __init__(self):
+        self.workers = 0
+        self._executor = None
+
+    @property
+    def enabled(self):
+        return self._executor is not None
+
+    def start(self, workers=COMPUTE_WORKERS):
+        """Start `workers` worker processes. Does nothing for 0 workers.
+
+        Call this before the gRPC server is created: workers are spawned, not forked, but the pool's own
+        threads are better started before grpc's.
+        """
+        if workers <= 0 or self._executor is not None:
+            return
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),  # a forked child would inherit grpc's threads and locks
+        )
+        for future in [self._executor.submit(_ready) for _ in range(workers)]:
+            future.result()  # spawn them all now, not on the first requests
+        logger.info("Started %d compute worker processes", workers)
+
+    def run(self, function, snapshot, store, *args, **kwargs):
+        """function(dataset, *args, **kwargs), where `dataset` is `snapshot` (of `store`) here or the same version of it in a worker."""
+        if self._executor is None:
+            return function(snapshot, *args, **kwargs)
+        store.log.wait(snapshot.log_seq)
+        files = (store.csv_path, store.columnar.directory if store.columnar is not None else None, store.log.directory)
+        version = (snapshot.loaded_version, snapshot.version, snapshot.log_seq)
+        return self._executor.submit(_run, function, version, files, args, kwargs).result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+            self.workers = 0
+
+
+# Inside the worker processes_________________________
+_worker_stores = OrderedDict()  # (csv path, columnar directory, log directory) -> [store, main process (loaded version, version) it is at least as new as]
+
+
+def _worker_store(files):
+    entry = _worker_stores.get(files)
+    if entry is None:
+        csv_path, columnar_dir, log_dir = files
+        store = DatasetStore(csv_path, columnar=ColumnarStore(columnar_dir) if columnar_dir else None, log=AppendLog(log_dir))
+        if columnar_dir is None:
+            store.columnar = None  # no pyarrow in the main process: read the csv even if pyarrow is importable here
+        entry = _worker_stores[files] = [store, (0, 0)]
+        while len(_worker_stores) > WORKER_DATASETS:
+            _worker_stores.popitem(last=False)
+    _worker_stores.move_to_end(files)
+    return entry
+
+
+def _ready():
+    return os.getpid()
+
+
+def _run(function, version, files, args, kwargs):
+    loaded_version, version, log_seq = version
+    entry = _worker_store(files)
+    store = entry[0]
+    if entry[1] < (loaded_version, version):
+        if entry[1][0] < loaded_version or store.catch_up(log_seq) is None:
+            try:
+                store.reload()
+            except FileNotFoundError:  # a delta file was compacted away while we were reading, the new base has it
+                store.reload()
+        entry[1] = (loaded_version, version)
+    return function(store.snapshot(), *args, **kwargs)
+#___________________________
+
+
+# The single pool used by the gRPC server
+compute_pool = ComputePool()
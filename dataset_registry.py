@@ -0,0 +1,163 @@
+# Registry of named datasets
+# -------------------------------
+# Both servers used to hold a single dataset saved to ./csv_dataset.csv, so two operators uploading at the same time
+# overwrote each other's data. Every request now names a dataset (`dataset_id`, see protos/service.proto) and the
+# registry gives each one its own DatasetStore, saved under DATASETS_DIR/<dataset_id>/ (csv, columnar files and
+# append log). An empty dataset_id is the original dataset (./csv_dataset.csv), so existing clients keep working.
+#
+# A dataset_id is "<tenant>/<name>" or just "<tenant>". The memory of loaded datasets is kept within a budget per
+# tenant (TENANT_MEMORY_MB) and for the whole process (MEMORY_BUDGET_MB): when a load or an update goes over one,
+# the least recently used datasets are unloaded. Everything they hold is already on disk (their files and append log),
+# so an unloaded dataset is simply read again on its next use.
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from append_log import AppendLog
+from columnar_store import ColumnarStore, has_arrow
+from dataset_store import DatasetStore, store as default_store
+from metrics import CounterFunction, Gauge
+
+DATASETS_DIR = os.environ.get("CO2_DATASETS_DIR", "./datasets")
+MEMORY_BUDGET_MB = int(os.environ.get("CO2_MEMORY_BUDGET_MB", "4096"))  # all loaded datasets together
+TENANT_MEMORY_MB = int(os.environ.get("CO2_TENANT_MEMORY_MB", "1024"))  # the loaded datasets of one tenant
+DEFAULT_DATASET = ""
+DATASET_ID = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}(/[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63})?$")
+
+logger = logging.getLogger(__name__)
+
+
+def tenant_of(dataset_id):
+    return dataset_id.split("/", 1)[0]
+
+
+class DatasetRegistry:
+    """Thread-safe map of dataset ids to DatasetStores, unloading the least recently used ones to stay within budget.
+
+    Listeners added with add_listener() are called after every change of any dataset as
+    listener(dataset_id, snapshot, facilities), like DatasetStore listeners with the dataset id first.
+    """
+
+    def __init__(self, root=DATASETS_DIR, memory_budget_mb=MEMORY_BUDGET_MB, tenant_memory_mb=TENANT_MEMORY_MB,
+                 default=None):
+        self.root = root
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.tenant_budget = tenant_memory_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self._stores = {}                # dataset id -> DatasetStore, loaded or not
+        self._loaded = OrderedDict()     # dataset id -> estimated bytes in memory, least recently used first
+        self._bytes_per_row = {}         # dataset id -> memory per row, measured when the dataset is loaded
+        self._listeners = []
+        self.evictions = 0
+        self.read_only = False  # see make_read_only()
+        if default is not None:
+            self._add(DEFAULT_DATASET, default)
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def get(self, dataset_id=DEFAULT_DATASET):
+        """The store of `dataset_id`, created on first use. Raises ValueError for an invalid id.
+
+        The store loads its saved dataset lazily (DatasetStore.snapshot()), also after it was unloaded.
+        """
+        with self._lock:
+            store = self._stores.get(dataset_id)
+            if store is None:
+                if not DATASET_ID.match(dataset_id) or ".." in dataset_id:
+                    raise ValueError(f"Invalid dataset_id: {dataset_id!r}, expected <tenant> or <tenant>/<name> "
+                                     f"(letters, digits, '_', '-', '.')")
+                directory = os.path.join(self.root, *dataset_id.split("/"))
+                os.makedirs(directory, exist_ok=True)
+                store = DatasetStore(
+                    csv_path=os.path.join(directory, "csv_dataset.csv"),
+                    columnar=ColumnarStore(os.path.join(directory, "columnar")) if has_arrow() else None,
+                    log=AppendLog(os.path.join(directory, "log")),
+                    read_only=self.read_only,
+                )
+                self._add(dataset_id, store)
+            elif dataset_id in self._loaded:
+                self._loaded.move_to_end(dataset_id)  # most recently used
+        return store
+
+    def make_read_only(self):
+        """Make every dataset read-only (see DatasetStore), for a process that shares the dataset files with others."""
+        with self._lock:
+            self.read_only = True
+            for store in self._stores.values():
+                store.read_only = True
+
+    def loaded_store(self, dataset_id):
+        """The store of `dataset_id` if its dataset is in memory, otherwise None (nothing is loaded)."""
+        with self._lock:
+            return self._stores.get(dataset_id) if dataset_id in self._loaded else None
+
+    def loaded_datasets(self):
+        """Ids of the datasets in memory, least recently used first."""
+        with self._lock:
+            return list(self._loaded)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "datasets": len(self._stores),
+                "loaded": len(self._loaded),
+                "memory_bytes": sum(self._loaded.values()),
+                "memory_budget_bytes": self.memory_budget,
+                "tenant_budget_bytes": self.tenant_budget,
+                "evictions": self.evictions,
+            }
+
+    def _add(self, dataset_id, store):
+        # must be called with the lock held (or before the registry is shared)
+        self._stores[dataset_id] = store
+        store.add_listener(lambda snapshot, facilities: self._on_change(dataset_id, snapshot, facilities))
+
+    def _on_change(self, dataset_id, snapshot, facilities):
+        # store listener: account the dataset's memory, unload others if over budget, then tell our own listeners
+        if facilities is None:  # a whole dataset was loaded: measure it once, updates are estimated per row
+            self._bytes_per_row[dataset_id] = snapshot.memory_bytes(deep=True) / max(snapshot.rows, 1)
+        size = int(snapshot.rows * self._bytes_per_row.get(dataset_id, 0))
+        with self._lock:
+            if self._stores.get(dataset_id) is not None and (facilities is None or dataset_id in self._loaded):
+                self._loaded[dataset_id] = size
+                self._loaded.move_to_end(dataset_id)
+            victims = self._over_budget(dataset_id)
+            for victim in victims:
+                del self._loaded[victim]
+            self.evictions += len(victims)
+        for victim in victims:  # outside our lock: unloading takes the victim store's own lock
+            logger.info("Unloading dataset %r to stay within the memory budget", victim)
+            self._stores[victim].unload()
+        for listener in self._listeners:
+            listener(dataset_id, snapshot, facilities)
+
+    def _over_budget(self, keep):
+        # must be called with the lock held: datasets to unload, least recently used first, so that every tenant and
+        # the whole registry fit in their budgets. `keep` (the dataset just used) is never unloaded.
+        total = sum(self._loaded.values())
+        tenants = {}
+        for dataset_id, size in self._loaded.items():
+            tenants[tenant_of(dataset_id)] = tenants.get(tenant_of(dataset_id), 0) + size
+        victims = []
+        for dataset_id, size in self._loaded.items():
+            tenant = tenant_of(dataset_id)
+            if dataset_id == keep or (total <= self.memory_budget and tenants[tenant] <= self.tenant_budget):
+                continue
+            victims.append(dataset_id)
+            total -= size
+            tenants[tenant] -= size
+        if total > self.memory_budget or tenants.get(tenant_of(keep), 0) > self.tenant_budget:
+            logger.warning("Dataset %r alone is over the memory budget", keep)
+        return victims
+
+
+# The registry shared by the gRPC server and the FastAPI service, the original dataset is its default one
+registry = DatasetRegistry(default=default_store)
+
+Gauge("co2_datasets_loaded", "Datasets in memory", function=lambda: len(registry._loaded))
+Gauge("co2_datasets_memory_bytes", "Estimated memory of the datasets in memory", function=lambda: sum(registry._loaded.values()))
+CounterFunction("co2_dataset_evictions_total", "Datasets unloaded to stay within the memory budgets", function=lambda: registry.evictions)
@@ -0,0 +1,264 @@
+# Compact in-memory types of the dataset columns
+# -------------------------------
+# pd.read_csv gives every text column (facility_id, facility_name, country, region, storage_site_type) one Python string
+# per row and every number a float64, several times the memory the data needs, and comparing facility names means
+# comparing strings. The dataset store (see dataset_store.py) reads csv files with read_csv() below, which parses the text
+# columns into categoricals right away, and converts every parsed chunk to the types of SCHEMA:
+#   - text columns become categoricals: one small integer code per row plus each distinct value once
+#   - numeric columns become float32 when every value keeps its digits (FLOAT32_DIGITS significant digits at most),
+#     otherwise they stay float64
+#   - dates become int32 day numbers (days since 1970-01-01, NO_DATE when missing or unreadable)
+# Rows appended to a loaded dataset are not inferred again, they get the types of the dataset (see ColumnTypes below),
+# except that a float32 column becomes float64 as soon as an appended value has more digits than a float32 keeps.
+# The insight functions work on these types directly. Only what leaves the server is turned back into text and plain
+# numbers: plain_floats() for the values of a chart and expand_frame() for the rows of a csv download.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# The GlobalInput columns (see protos/service.proto) and their type in memory, other columns are kept as parsed
+SCHEMA = {
+    "date": "day",
+    "facility_id": "category",
+    "facility_name": "category",
+    "country": "category",
+    "region": "category",
+    "storage_site_type": "category",
+    "co2_emitted_tonnes": "float32",
+    "co2_captured_tonnes": "float32",
+    "co2_stored_tonnes": "float32",
+    "capture_efficiency_percent": "float32",
+    "storage_integrity_percent": "float32",
+}
+CSV_DTYPES = {column: kind for column, kind in SCHEMA.items() if kind == "category"}  # parsed as categoricals right away
+FLOAT32_DIGITS = 6  # significant digits a float32 always gives back exactly, values with more stay float64
+NO_DATE = np.iinfo(np.int32).min  # day number of a missing or unreadable date
+FEW_DATES = 64  # up to this many dates (e.g. appended readings) "YYYY-MM-DD" texts are read by numpy, pandas is slower for a few
+ISO_DAY = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def read_csv(source, **options):
+    """pd.read_csv with the text columns of SCHEMA parsed straight into categoricals, then see compact_frame()."""
+    return pd.read_csv(source, dtype=CSV_DTYPES, **options)
+
+
+def day_numbers(dates):
+    """Dates (text, datetime64 or day numbers already) as an int32 array of days since 1970-01-01, NO_DATE where missing."""
+    dates = pd.Series(dates) if not isinstance(dates, pd.Series) else dates
+    if pd.api.types.is_integer_dtype(dates.dtype):
+        return dates.to_numpy(dtype=np.int32)
+    if len(dates) <= FEW_DATES and not pd.api.types.is_datetime64_any_dtype(dates.dtype):
+        texts = dates.to_numpy(dtype=object)
+        if all(isinstance(text, str) and ISO_DAY.fullmatch(text) for text in texts):
+            try:
+                return np.array(texts, dtype="datetime64[D]").astype(np.int32)
+            except ValueError:  # e.g. 2024-13-45, unreadable: pandas makes it NO_DATE below
+                pass
+    if not pd.api.types.is_datetime64_any_dtype(dates.dtype):
+        dates = pd.to_datetime(dates, errors="coerce")
+    days = dates.to_numpy(dtype="datetime64[D]")
+    return np.where(np.isnat(days), NO_DATE, days.astype(np.int64)).astype(np.int32)
+
+
+def day_labels(days):
+    """Day numbers as "YYYY-MM-DD" texts (None for NO_DATE)."""
+    days = np.asarray(days)
+    labels = days.astype("datetime64[D]").astype(str).astype(object)
+    labels[days == NO_DATE] = None
+    return labels
+
+
+def round_significant(values, digits=FLOAT32_DIGITS):
+    # every value rounded to `digits` significant digits (scaling by an exact power of ten, so 50.12 stays 50.12)
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values)))
+        power = np.where(np.isfinite(magnitude), digits - 1 - magnitude, 0)
+        up = 10.0 ** np.maximum(power, 0)
+        down = 10.0 ** np.maximum(-power, 0)
+        return np.round(values * up / down) * down / up
+
+
+def fits_float32(values):
+    """True if every value comes back unchanged from a float32 (see plain_floats), so the column can be stored as one."""
+    values = np.asarray(values, dtype=np.float64)
+    finite = values[np.isfinite(values)]
+    if len(finite) and np.abs(finite).max() >= np.finfo(np.float32).max:
+        return False
+    return bool(np.array_equal(round_significant(values.astype(np.float32)), values, equal_nan=True))
+
+
+def plain_floats(values):
+    """The values of a column as float64, float32 values turned back into the numbers they were read as."""
+    values = values.to_numpy() if isinstance(values, pd.Series) else np.asarray(values)
+    if values.dtype == np.float32:
+        return round_significant(values)
+    return values.astype(np.float64)
+
+
+def float_values(values):
+    """The values of a column as a float64 array (None in rows sent as updates, or text that is not a number, counts as missing)."""
+    try:
+        return np.asarray(values, dtype=np.float64)  # numbers, and None as NaN
+    except (TypeError, ValueError):
+        return np.asarray(pd.to_numeric(values, errors="coerce"), dtype=np.float64)
+
+
+def compact_column(values, kind):
+    """One column of SCHEMA in its compact type (see the top of this file), or None if it already has it."""
+    if kind == "day":
+        return day_numbers(values)
+    if kind == "category":
+        return None if isinstance(values.dtype, pd.CategoricalDtype) else values.astype("category")
+    if values.dtype == np.float32:
+        return None
+    numbers = float_values(values)
+    return numbers.astype(np.float32) if fits_float32(numbers) else numbers
+
+
+def compact_frame(frame):
+    """The frame with the columns of SCHEMA converted to their compact types (see the top of this file)."""
+    columns = {}
+    for column, kind in SCHEMA.items():
+        if column in frame.columns:
+            values = compact_column(frame[column], kind)
+            if values is not None:
+                columns[column] = values
+    return frame.assign(**columns) if columns else frame
+
+
+class ColumnTypes:
+    """The compact types of one dataset's columns, given to the rows appended to it instead of inferring them again.
+
+    Inferring the types of every appended chunk costs more than appending it and gives every chunk categories of its
+    own, which then have to be combined when the chunks are merged. So the types are decided once for the dataset:
+    appended numbers are stored in the column's float type, and the values of text columns are looked up in a dict of
+    the column's categories, new ones are added at the end of them. Numbers are never rounded to fit: when an appended
+    value of a float32 column has more than FLOAT32_DIGITS significant digits, the column becomes float64 from then on
+    (concat_frames() turns its earlier float32 values into the numbers they were read as). Columns the dataset has no
+    type for yet are converted as in compact_frame().
+    """
+
+    def __init__(self, frame=None):
+        self.dtypes = {}  # column -> dtype
+        self._codes = {}  # categorical column -> {value: code}
+        self._values = {}  # categorical column -> [value of every code]
+        if frame is not None:
+            self.learn(frame)
+
+    def learn(self, frame):
+        """Add the types of the SCHEMA columns of a compact frame: its new categories, and float64 where it has one."""
+        for column in SCHEMA:
+            if column in frame.columns:
+                self._learn(column, frame[column].dtype)
+
+    def columns(self, frame):
+        """The SCHEMA columns of `frame` as {column: array} in the types of the dataset."""
+        columns = {}
+        for column, kind in SCHEMA.items():
+            if column not in frame.columns:
+                continue
+            values, dtype = frame[column], self.dtypes.get(column)
+            if kind == "day":
+                values = day_numbers(values)
+            elif dtype is None:
+                compact = compact_column(values, kind)
+                values = values if compact is None else compact
+                if isinstance(values, pd.Series):
+                    values = values.array if isinstance(values.dtype, pd.CategoricalDtype) else values.to_numpy()
+                self._learn(column, values.dtype)
+            elif kind == "category":
+                values = self._categorical(column, values)
+            else:
+                values = float_values(values)
+                if dtype == np.float32 and not fits_float32(values):
+                    self._learn(column, values.dtype)  # widened to float64, see above
+                else:
+                    values = values.astype(dtype)
+            columns[column] = values
+        return columns
+
+    def categories(self, column):
+        """The categories of a categorical column as a list, value of code i at i (faster to look up than dtype.categories)."""
+        return self._values[column]
+
+    def convert(self, frame):
+        """`frame` with the columns of SCHEMA in the types of the dataset."""
+        columns = self.columns(frame)
+        return frame.assign(**columns) if columns else frame
+
+    def _learn(self, column, dtype):
+        if isinstance(dtype, pd.CategoricalDtype):
+            if column not in self._codes:
+                self.dtypes[column], self._codes[column], self._values[column] = pd.CategoricalDtype(dtype.categories[:0]), {}, []
+            self._add_categories(column, [value for value in dtype.categories if value not in self._codes[column]])
+        elif self.dtypes.get(column) != np.float64:
+            self.dtypes[column] = dtype
+
+    def _categorical(self, column, values):
+        codes_of = self._codes[column]
+        values = values.to_numpy(dtype=object)
+        codes = np.fromiter((codes_of.get(value, -1) for value in values), dtype=np.int64, count=len(values))
+        new = [value for value in values[codes < 0] if not pd.isna(value)]
+        if new:
+            self._add_categories(column, list(dict.fromkeys(new)))
+            codes = np.fromiter((codes_of.get(value, -1) for value in values), dtype=np.int64, count=len(values))
+        return pd.Categorical.from_codes(codes, dtype=self.dtypes[column])
+
+    def _add_categories(self, column, values):
+        if values:
+            codes_of, categories = self._codes[column], self.dtypes[column].categories
+            codes_of.update((value, code) for code, value in enumerate(values, len(codes_of)))
+            self._values[column].extend(values)
+            self.dtypes[column] = pd.CategoricalDtype(categories.append(pd.Index(values, dtype=categories.dtype)))
+
+
+def expand_frame(frame):
+    """The plain form of a compact frame, to send or save as text: dates as text, categories as their values, plain floats."""
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+        if column == "date" and pd.api.types.is_integer_dtype(values.dtype):
+            columns[column] = day_labels(values.to_numpy())
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            columns[column] = values.astype(object).to_numpy()
+        elif values.dtype == np.float32:
+            columns[column] = plain_floats(values)
+    return frame.assign(**columns) if columns else frame
+
+
+def concat_frames(frames, **options):
+    """pd.concat of frames with categorical columns (options such as ignore_index are passed on), keeping them categorical.
+
+    pd.concat only keeps a categorical column when every frame has the same categories, otherwise it falls back to
+    Python objects. Here every frame is first given the union of the categories (the first frame's ones first).
+    A column that is float32 in some frames and float64 in others (widened by appended rows, see ColumnTypes) becomes
+    float64 with the float32 values as the numbers they were read as (plain_floats), not their nearest binary float64.
+    """
+    frames = [frame for frame in frames if len(frame.columns)]
+    if len(frames) <= 1:
+        return frames[0] if frames else pd.DataFrame()
+    frame_dtypes = [dict(zip(frame.columns, frame.dtypes)) for frame in frames]  # (much faster than frame[column] for many small frames)
+    for column in frames[0].columns:
+        dtypes = [column_dtypes[column] for column_dtypes in frame_dtypes if column in column_dtypes]
+        if all(dtype is dtypes[0] or dtype == dtypes[0] for dtype in dtypes):
+            continue
+        if np.dtype(np.float32) in dtypes and np.dtype(np.float64) in dtypes:
+            frames = [frame.assign(**{column: plain_floats(frame[column])})
+                      if column in frame.columns and frame[column].dtype == np.float32 else frame for frame in frames]
+            continue
+        if not all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+            continue
+        categories = dtypes[0].categories
+        for dtype in dtypes[1:]:
+            categories = categories.append(dtype.categories.difference(categories, sort=False))
+        union = pd.CategoricalDtype(categories)
+        frames = [frame.assign(**{column: frame[column].astype(union)}) if column in frame.columns else frame
+                  for frame in frames]
+    return pd.concat(frames, **options)
+
+
+def memory_mb(frame):
+    return frame.memory_usage(index=False, deep=True).sum() / (1024 * 1024)
@@ -0,0 +1,718 @@
+# Shared in-memory dataset store
+# -------------------------------
+# Both servers (server.py for gRPC and service.py for FastAPI) used to re-read csv_dataset.csv
+# from disk on every insight call. The store keeps the uploaded dataset resident in memory instead:
+# uploads load it once, updates append to it in place, and the insight handlers only read from memory.
+# Appended rows are first recorded in a write-ahead log (see append_log.py) and kept as separate chunks,
+# they are merged into the main frame (and saved into the dataset files) lazily, a whole batch at a time.
+# Columns are kept in the compact types of dataset_schema.py (categoricals, float32, int32 day numbers).
+
+import io
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from append_log import AppendLog
+from columnar_store import ColumnarStore, has_arrow
+from dataset_schema import ColumnTypes, compact_frame, concat_frames, expand_frame, memory_mb, read_csv
+from insights import add_date_columns, add_model_rows, month_numbers, update_model_stats
+from metrics import ROWS_PROCESSED, Gauge, stage
+from window_index import FacilityWindows
+
+CSV_PATH = "./csv_dataset.csv"  # file of the default dataset, the others are under dataset_registry.DATASETS_DIR
+DERIVED_COLUMNS = ["month"]  # columns computed at load time, they are never written back to the csv
+CHUNK_ROWS = 1000  # rows per chunk when a csv is streamed back to a client
+PARSE_ROWS = 50000  # rows parsed at a time while a csv upload is still streaming in
+MERGE_ROWS = 10000  # appended rows are merged into the main frame once there are this many of them...
+MERGE_FRACTION = 8  # ...or 1/MERGE_FRACTION of the main frame's rows, whichever is more
+TAIL_CHUNKS = 256   # appended chunks are concatenated into one whenever there are this many
+SMALL_APPEND_ROWS = 64  # appends of up to this many rows update the running sums row by row (see DatasetStore.append)
+
+logger = logging.getLogger(__name__)
+
+
+def to_csv_frame(frame):
+    """The dataset as it looks in the csv file: derived columns dropped, dates back to text and categories to their values."""
+    return expand_frame(frame.drop(columns=[c for c in DERIVED_COLUMNS if c in frame.columns]))
+
+
+class DatasetSnapshot:
+    """Immutable view of the dataset at one version.
+
+    Writers never modify a published snapshot, they build a new one and swap it in,
+    so a reader holding a snapshot can never observe a half-written frame.
+    Rows appended since the last merge are kept as separate chunks after the main frame instead of being copied
+    into it on every append (usually one chunk, whose column arrays grow in place as rows arrive, see _GrowingRows):
+    `frame` merges them on first use, the per-facility lookups read them where they are.
+    `facility_index` maps every facility name to the row positions of that facility in `frame`,
+    `latest_month` maps it to (month number, row positions) of the facility's most recent month,
+    `facility_versions` to the dataset version that last changed the facility's rows, and `model_stats`
+    to the running regression statistics of each (model, month) of the facility (see insights.build_model_stats).
+    `log_seq` is the last append log batch included (see append_log.py), `loaded_version` the version at which the
+    dataset was last loaded whole (an upload, or a read of the saved files), the versions after it only appended rows.
+    `windows` caches the date indexes of facilities (see window_index.py); it is shared with the next snapshots,
+    every index remembers the facility version it was built for.
+    """
+
+    __slots__ = ("_parts", "rows", "version", "facility_index", "latest_month", "facility_versions", "model_stats", "log_seq",
+                 "loaded_version", "windows")
+
+    def __init__(self, frame, version, facility_index, latest_month, facility_versions, model_stats, tail=(), rows=None, log_seq=0,
+                 loaded_version=0, windows=None):
+        self._parts = (frame, tuple(tail))  # (main frame, appended chunks), always replaced together
+        self.rows = rows if rows is not None else len(frame) + sum(len(chunk) for chunk in tail)
+        self.version = version
+        self.facility_index = facility_index
+        self.latest_month = latest_month
+        self.facility_versions = facility_versions
+        self.model_stats = model_stats
+        self.log_seq = log_seq
+        self.loaded_version = loaded_version
+        self.windows = windows if windows is not None else {}
+
+    @property
+    def frame(self):
+        """The whole dataset as one frame, the appended chunks are merged into it the first time it is asked for."""
+        frame, tail = self._parts
+        if tail:
+            frame = concat_frames([frame, *self._tail_frames()], ignore_index=True)
+            self._parts = (frame, ())  # the same rows, so readers of the old parts are not affected
+        return frame
+
+    @property
+    def empty(self):
+        return self.rows == 0
+
+    def rows_at(self, positions):
+        """The rows at `positions` of the whole dataset, taken from the main frame and the appended chunks without merging them."""
+        frame, tail = self._parts
+        if not tail or not len(positions) or positions.max() < len(frame):
+            return frame.iloc[positions]
+        tail = self._tail_frames()
+        if len(tail) > 1:
+            tail = (concat_frames(tail),)  # the chunks keep their row numbers as index
+            self._parts = (frame, tail)
+        in_frame = positions < len(frame)
+        if not in_frame.any():
+            return tail[0].iloc[positions - len(frame)]
+        rows = concat_frames([frame.iloc[positions[in_frame]], tail[0].iloc[positions[~in_frame] - len(frame)]])
+        return rows.iloc[np.argsort(np.concatenate([np.flatnonzero(in_frame), np.flatnonzero(~in_frame)]), kind="stable")]
+
+    def facility_rows(self, facility_name):
+        """All rows of one facility, in file order. Costs time proportional to that facility's rows only."""
+        positions = self.facility_index.get(facility_name)
+        if positions is None:
+            return self._parts[0].iloc[0:0]
+        return self.rows_at(positions)
+
+    def latest_month_rows(self, facility_name):
+        """Rows of the facility's most recent month, a direct lookup instead of re-parsing its dates."""
+        _, positions = self.latest_month.get(facility_name, (-1, None))
+        if positions is None:
+            return self._parts[0].iloc[0:0]
+        return self.rows_at(positions)
+
+    def memory_bytes(self, deep=False):
+        """Memory used by the rows. With deep=False text columns only count their pointers, which is fast enough to ask often."""
+        frame, tail = self._parts
+        if deep:
+            tail = self._tail_frames()
+        return int(sum(part.memory_usage(index=False, deep=deep).sum() if isinstance(part, pd.DataFrame) else part.memory_bytes()
+                       for part in (frame, *tail)))
+
+    def _tail_frames(self):
+        # the appended chunks as frames, rows still in a growing buffer become one on first use
+        frame, tail = self._parts
+        if any(isinstance(part, _AppendedRows) for part in tail):
+            tail = tuple(part.frame() if isinstance(part, _AppendedRows) else part for part in tail)
+            self._parts = (frame, tail)
+        return tail
+
+    def facility_version(self, facility_name):
+        """Version of one facility's rows: it only changes when that facility gets new rows or a new csv is loaded."""
+        return self.facility_versions.get(facility_name, self.version)
+
+    def window_index(self, facility_name):
+        """Date index of one facility's rows for insights over any date range (see window_index.py), or None if unknown.
+
+        Built on first use and reused until the facility gets new rows.
+        """
+        positions = self.facility_index.get(facility_name)
+        if positions is None:
+            return None
+        version = self.facility_version(facility_name)
+        windows = self.windows.get(facility_name)
+        if windows is None or windows.version != version:
+            with stage("index"):
+                windows = FacilityWindows(self.rows_at(positions), positions, version)
+            self.windows[facility_name] = windows  # a concurrent reader may build the same index, either one is kept
+        return windows
+
+
+def build_facility_index(frame, offset=0):
+    """Map facility name -> array of row positions (shifted by `offset`) for the rows of `frame`."""
+    if "facility_name" not in frame.columns:
+        return {}
+    groups = frame.groupby("facility_name", sort=False, observed=True).indices
+    return {name: positions + offset for name, positions in groups.items()}
+
+
+def group_positions(codes):
+    """Map category code -> array of the positions of the rows with that code, for an array of category codes (-1 = missing)."""
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    starts = np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]]))
+    ends = np.append(starts[1:], len(codes))
+    return {int(codes[start]): order[start:end] for start, end in zip(starts, ends) if codes[start] >= 0}
+
+
+def latest_month_positions(months, positions):
+    """(latest month number, positions of the rows in that month) among `positions`; -1 when no row has a valid date."""
+    facility_months = months[positions]
+    latest = int(facility_months.max()) if len(positions) else -1
+    if latest < 0:
+        return -1, positions[:0]
+    return latest, positions[facility_months == latest]
+
+
+def build_latest_month_index(frame, facility_index):
+    """Map facility name -> (latest month number, row positions of that month)."""
+    if "month" not in frame.columns:
+        return {}
+    months = frame["month"].to_numpy()
+    return {name: latest_month_positions(months, positions) for name, positions in facility_index.items()}
+
+
+class _GrowingPositions:
+    # position arrays that grow in place as rows are appended, instead of being copied on every append.
+    # Snapshots hold views of the filled part of a buffer, and that part is never written again.
+    def __init__(self):
+        self._buffers = {}  # key -> buffer, `current` arrays passed to extend() are views of these
+
+    def extend(self, key, current, positions):
+        buffer = self._buffers.get(key)
+        size = len(current)
+        if buffer is None or current.base is not buffer or size + len(positions) > len(buffer):
+            grown = np.empty(max(16, 2 * (size + len(positions))), dtype=np.intp)  # doubling: O(1) per row on average
+            grown[:size] = current
+            buffer = self._buffers[key] = grown
+        buffer[size:size + len(positions)] = positions
+        return buffer[:size + len(positions)]
+
+
+class _AppendedRows:
+    # the rows of a _GrowingRows buffer when a snapshot was published: its arrays and how many of their rows count
+    __slots__ = ("buffer", "start", "size", "_arrays", "_dtypes")
+
+    def __init__(self, buffer, start, size, arrays, dtypes):
+        self.buffer = buffer
+        self.start = start
+        self.size = size
+        self._arrays = arrays
+        self._dtypes = dtypes
+
+    def __len__(self):
+        return self.size
+
+    def memory_bytes(self):
+        return sum(array[:self.size].nbytes for array in self._arrays.values())
+
+    def frame(self):
+        columns = {name: pd.Categorical.from_codes(array[:self.size], dtype=self._dtypes[name]) if name in self._dtypes
+                   else array[:self.size] for name, array in self._arrays.items()}
+        return pd.DataFrame(columns, index=pd.RangeIndex(self.start, self.start + self.size))  # their row numbers in the dataset
+
+
+class _GrowingRows:
+    # appended rows kept in column arrays that grow in place, instead of one small frame per append that has to be
+    # concatenated with the others later (pandas spends far more time per frame than per row). Categorical columns keep
+    # their codes: categories are only ever added at the end (see dataset_schema.ColumnTypes), so the codes of earlier
+    # rows stay valid with the latest categories. Snapshots hold an _AppendedRows view of the filled part.
+    def __init__(self, start):
+        self.start = start  # row number of the first row in the dataset
+        self.size = 0
+        self._arrays = {}   # column -> buffer
+        self._dtypes = {}   # categorical column -> dtype with the categories of all its rows so far
+
+    @property
+    def end(self):
+        return self.start + self.size
+
+    def extend(self, columns):
+        """Add rows ({column: array}), returns the view of all rows so far, or None if they have other columns or types."""
+        if self._arrays and (list(columns) != list(self._arrays)
+                             or not all(self._fits(name, values) for name, values in columns.items())):
+            return None
+        rows = len(next(iter(columns.values())))
+        for name, values in columns.items():
+            if isinstance(values, pd.Categorical):
+                self._dtypes[name] = values.dtype
+                values = values.codes.astype(np.int32)  # (int8 codes would not fit once there are more categories)
+            buffer = self._arrays.get(name)
+            if buffer is None or self.size + rows > len(buffer):
+                grown = np.empty(max(16, 2 * (self.size + rows)), dtype=values.dtype)  # doubling: O(1) per row on average
+                if buffer is not None:
+                    grown[:self.size] = buffer[:self.size]
+                buffer = self._arrays[name] = grown
+            buffer[self.size:self.size + rows] = values
+        self.size += rows
+        return _AppendedRows(self, self.start, self.size, dict(self._arrays), dict(self._dtypes))
+
+    def _fits(self, name, values):
+        if not isinstance(values, pd.Categorical):
+            return name not in self._dtypes and np.asarray(values).dtype == self._arrays[name].dtype
+        old = self._dtypes.get(name)
+        if old is None:
+            return False
+        new = values.dtype
+        return new is old or (new.ordered == old.ordered and new.categories[:len(old.categories)].equals(old.categories))
+
+
+class DatasetBuilder:
+    """Builds the frame and indexes of a new dataset from parsed chunks of rows, as the chunks come in.
+
+    Every chunk is converted to the compact column types (see dataset_schema.py) first, `parsed_mb` is the memory
+    the chunks took as parsed. Chunks of appended rows (appended=True, replayed from the append log) get the types of
+    the rows before them, as DatasetStore.append gives them.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.parsed_mb = 0.0
+        self.types = ColumnTypes()
+        self._frames = []
+        self._positions = {}  # facility name -> list of position arrays, one per chunk
+        self._model_stats = {}
+
+    def add(self, chunk, appended=False):
+        self.parsed_mb += memory_mb(chunk)
+        if "date" in chunk.columns and "anomaly_flag" not in chunk.columns:
+            # rows of a csv without the column were not flagged; logged rows from before it was saved get their flags again
+            chunk = entries_frame(chunk) if appended else chunk.assign(anomaly_flag=False)
+        if appended:
+            chunk = self.types.convert(chunk)
+        else:
+            chunk = compact_frame(chunk)
+            self.types.learn(chunk)
+        if "date" in chunk.columns:
+            chunk = add_date_columns(chunk)
+            self._model_stats = update_model_stats(self._model_stats, chunk)
+        for name, positions in build_facility_index(chunk, offset=self.rows).items():
+            self._positions.setdefault(name, []).append(positions)
+        self._frames.append(chunk)
+        self.rows += len(chunk)
+
+    def finish(self):
+        """(frame, facility index, latest month index, facility versions, model stats) for DatasetStore._publish."""
+        frame = concat_frames(self._frames, ignore_index=True) if len(self._frames) > 1 else self._frames[0]
+        logger.info("Loaded %d rows: %.1f MB in memory, %.1f MB as parsed", self.rows, memory_mb(frame), self.parsed_mb)
+        if "month" not in frame.columns:
+            return frame, {}, {}, None, {}
+        index = {name: np.concatenate(parts) for name, parts in self._positions.items()}
+        return frame, index, build_latest_month_index(frame, index), None, self._model_stats
+
+
+class _ByteChunkReader(io.RawIOBase):
+    # file-like view of an iterator of byte chunks, copying every chunk to `sink` as it is read
+    def __init__(self, chunks, sink):
+        self._chunks = iter(chunks)
+        self._sink = sink
+        self._current = memoryview(b"")
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not len(self._current):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0  # end of the upload
+            self._sink.write(chunk)
+            self.bytes_read += len(chunk)
+            self._current = memoryview(chunk)
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+
+class DatasetStore:
+    """Thread-safe holder of the current dataset.
+
+    Reads are lock-free (a single attribute read of the current snapshot), writes are serialised
+    by a lock and bump the version counter every time a new snapshot is published.
+    Listeners added with add_listener() are called after every change as
+    listener(snapshot, facilities), where `facilities` is None when a whole new dataset was loaded.
+
+    When pyarrow is installed the dataset is saved in a ColumnarStore (see columnar_store.py): uploads are
+    converted into it, appended rows go to its delta files and a restart loads from it instead of the csv.
+    Without pyarrow, appended rows are added to the csv file as before.
+    Either way appended rows are only saved there when they are merged; until then the append log holds them.
+
+    A read_only store never writes to its files: it loads what is saved (replaying the append log only in memory), and
+    uploads and appends raise PermissionError. For processes that share the files with the one writing them.
+    """
+
+    def __init__(self, csv_path=CSV_PATH, columnar=None, log=None, read_only=False):
+        self.csv_path = csv_path
+        self.read_only = read_only
+        self.columnar = columnar if columnar is not None else (ColumnarStore() if has_arrow() else None)
+        self.log = log if log is not None else AppendLog()
+        self._lock = threading.Lock()
+        self._positions = _GrowingPositions()
+        self._types = ColumnTypes()  # column types of the dataset, appended rows get them too (see dataset_schema.py)
+        self._rows = None            # _GrowingRows of the last appended chunk
+        self._saved_rows = 0         # rows of the current dataset saved in its files, the ones after them are only in the log
+        self._loaded = False
+        self._file_columns = []  # column order of the csv on disk, appended rows are written in that order
+        self._snapshot = DatasetSnapshot(pd.DataFrame(), 0, {}, {}, {}, {})
+        self._listeners = []
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    @property
+    def saved_to(self):
+        """Where appended rows are saved."""
+        return self.columnar.directory if self.columnar is not None else self.csv_path
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def snapshot(self):
+        """Current snapshot. Loads the dataset saved on disk by a previous run if nothing is loaded yet."""
+        if not self._loaded and self._has_saved():
+            snapshot = None
+            with self._lock:
+                if not self._loaded:  # another thread may have loaded it while we waited
+                    with stage("load"):
+                        loaded, log_seq = self._read_saved(persist=not self.read_only)
+                    snapshot = self._publish(*loaded, log_seq=log_seq)
+            if snapshot is not None:
+                self._notify(snapshot, None)
+        return self._snapshot
+
+    def load_csv(self, path=None):
+        """Parse the csv at `path` (default: the store's csv_path) and make it the current dataset."""
+        self._check_writable()
+        path = path or self.csv_path
+        return self._replace(path, self._read(path))  # parse and index outside the lock, readers keep using the old snapshot meanwhile
+
+    def load_stream(self, byte_chunks, path=None, parse_rows=PARSE_ROWS):
+        """Load a csv that arrives as an iterator of byte chunks (a streamed upload).
+
+        Rows are parsed and indexed `parse_rows` at a time while later chunks are still arriving, and the bytes
+        are saved to `path` (default: the store's csv_path) on the way. Returns (snapshot, number of bytes received).
+        """
+        self._check_writable()
+        path = path or self.csv_path
+        partial = f"{path}.{os.getpid()}-{threading.get_ident()}.part"  # the previous file stays in place until the upload is complete
+        builder = DatasetBuilder()
+        try:
+            with stage("load"), open(partial, "wb") as sink:
+                reader = _ByteChunkReader(byte_chunks, sink)
+                for chunk in read_csv(io.BufferedReader(reader), chunksize=parse_rows):
+                    builder.add(chunk)
+                loaded = builder.finish()
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return self._replace(path, loaded), reader.bytes_read
+
+    def append(self, rows):
+        """Append new rows to the dataset. Returns the new snapshot once the rows are durable in the append log.
+
+        Nothing already in memory is copied: the rows are added to the column arrays of the appended chunk after the main
+        frame, and they and the position arrays grow in place. The rows are converted to the dataset's column types before they are logged, so rows that cannot
+        be added raise here and never reach the log (which would replay them on every restart). A few rows at a time
+        (up to SMALL_APPEND_ROWS, e.g. single readings) are added to the running sums straight from their values instead
+        of going through the whole-frame builders. Once enough rows have been appended they are merged into the main
+        frame, saved into the dataset files (the columnar store, or the csv) and dropped from the log.
+        """
+        self._check_writable()
+        reloaded = None
+        with self._lock:
+            if not self._loaded and self._has_saved():  # unloaded since the caller looked at it (see dataset_registry.py)
+                loaded, log_seq = self._read_saved(persist=not self.read_only)
+                reloaded = self._publish(*loaded, log_seq=log_seq)
+            snapshot, changed = self._add(rows)
+        if reloaded is not None:
+            self._notify(reloaded, None)
+        self._notify(snapshot, list(changed))
+        self.log.wait(snapshot.log_seq)  # group commit: concurrent appends share one flush
+        return snapshot
+
+    def _add(self, rows, log_seq=None):
+        # must be called with the lock held: add rows to the current snapshot and publish the result, see append().
+        # Rows that are already in the append log as batch `log_seq` (see catch_up()) are not written to it again, and
+        # nor are they merged into the dataset files: that is up to the process that wrote them.
+        # Returns (new snapshot, {facility: positions of its new rows among `rows`})
+        writing = log_seq is None
+        current = self._snapshot
+        offset = current.rows
+        columns = self._types.columns(rows)  # in the dataset's types, with cached category codes (see dataset_schema.py)
+        months = month_numbers(columns["date"])
+        chunk = {**{c: columns[c] if c in columns else rows[c].to_numpy() for c in rows.columns}, "month": months}
+        facilities = columns.get("facility_name")
+        if facilities is None:
+            changed = {}
+        else:
+            names = self._types.categories("facility_name")
+            changed = {names[code]: local for code, local in group_positions(facilities.codes).items()}
+        if len(rows) <= SMALL_APPEND_ROWS:
+            model_stats = add_model_rows(current.model_stats, changed, months, columns)
+        else:
+            model_stats = update_model_stats(current.model_stats, pd.DataFrame(chunk))  # O(1) per row, nothing is refit from scratch
+
+        # the rows go into the growing buffer of the last chunk, or start a new one
+        frame, tail = current._parts
+        appended = None
+        if tail and isinstance(tail[-1], _AppendedRows) and tail[-1].buffer is self._rows and self._rows.end == offset:
+            appended = self._rows.extend(chunk)
+            tail = tail[:-1] if appended is not None else tail
+        if appended is None:
+            self._rows = _GrowingRows(offset)
+            appended = self._rows.extend(chunk)
+        tail = tail + (appended,)
+        if len(tail) >= TAIL_CHUNKS:  # (only when the columns of the appended rows keep changing)
+            tail = (concat_frames([part.frame() if isinstance(part, _AppendedRows) else part for part in tail]),)
+
+        if writing:
+            if not self._file_columns:
+                self._file_columns = list(rows.columns)
+            log_seq = self.log.write(rows, self._file_columns)  # only queued here, the wait for the disk happens outside the lock
+
+        # only the facilities that received rows get new index entries, the others are shared
+        index = dict(current.facility_index)
+        latest = dict(current.latest_month)
+        versions = dict(current.facility_versions)
+        for name, local in changed.items():
+            positions = local + offset
+            versions[name] = current.version + 1
+            index[name] = self._positions.extend(("index", name), index.get(name, positions[:0]), positions)
+            old_month, old_positions = latest.get(name, (-1, positions[:0]))
+            new_month, new_positions = latest_month_positions(months, local)
+            if new_month > old_month:
+                latest[name] = (new_month, new_positions + offset)
+            elif new_month == old_month and new_month >= 0:
+                latest[name] = (old_month, self._positions.extend(("latest", name), old_positions, new_positions + offset))
+        snapshot = self._publish(frame, index, latest, versions, model_stats,
+                                 tail=tail, rows=offset + len(rows), log_seq=log_seq, windows=current.windows)
+        ROWS_PROCESSED.inc(len(rows), operation="append")
+        if writing and snapshot.rows - self._saved_rows >= max(MERGE_ROWS, self._saved_rows // MERGE_FRACTION):
+            self._merge(snapshot)
+        return snapshot, changed
+
+    def csv_chunks(self, csv_name, chunk_rows=CHUNK_ROWS):
+        """Iterator over the dataset's csv in frames of at most `chunk_rows` rows (missing values as ""), or None if not found.
+
+        Only the dataset's own file is served (its name, or a path to it), from memory and converted a chunk at a time.
+        Any other name, e.g. the file of another dataset or anything outside the dataset, is not found.
+        """
+        if not self._is_own_file(csv_name):
+            return None
+        snapshot = self.snapshot()
+        if not self._loaded:
+            return None
+        frame = snapshot.frame
+        return (to_csv_frame(frame.iloc[start:start + chunk_rows]).fillna("") for start in range(0, len(frame), chunk_rows))
+
+    def _is_own_file(self, csv_name):
+        return csv_name == os.path.basename(self.csv_path) or os.path.realpath(csv_name) == os.path.realpath(self.csv_path)
+
+    def _read(self, path):
+        # parse the csv, dates included, and build its indexes: everything a snapshot needs
+        with stage("load"):
+            builder = DatasetBuilder()
+            builder.add(read_csv(path))
+            return builder.finish()
+
+    def reload(self):
+        """Re-read the dataset saved on disk (and in the append log) and make it the current one, without writing anything.
+
+        Used by the read-only copies of the dataset in compute worker processes (see compute_pool.py).
+        """
+        with self._lock:
+            loaded, log_seq = self._read_saved(persist=False)
+            snapshot = self._publish(*loaded, log_seq=log_seq)
+        return snapshot
+
+    def catch_up(self, log_seq):
+        """Add the append log batches written by another process since the current snapshot, up to at least `log_seq`.
+
+        The read-only copy of a compute worker (see compute_pool.py) follows the main process's appends this way instead
+        of reload()ing the whole dataset for every new version: only the new batches are read and added, like append()
+        does, without writing anything. Returns the new snapshot, or None if the batches are not in the log anymore
+        (they were merged into the dataset files meanwhile), then only a reload() gets them.
+        """
+        with self._lock:
+            current = self._snapshot
+            if current.log_seq >= log_seq:
+                return current
+            try:
+                batches = self.log.replay(current.log_seq)
+            except FileNotFoundError:  # a log segment was dropped while we read it
+                return None
+            if not batches or batches[0][0] != current.log_seq + 1 or batches[-1][0] < log_seq:
+                return None
+            changed = set()
+            for seq, rows in batches:
+                snapshot, facilities = self._add(rows, seq)
+                changed.update(facilities)
+        self._notify(snapshot, list(changed))
+        return snapshot
+
+    def unload(self):
+        """Drop the dataset from memory. It is read again from disk (its files and the append log) on its next use.
+
+        Appended rows not merged yet are in the append log, so nothing has to be saved first. Readers still holding
+        a snapshot keep using it. Versions keep counting up, so cached results of the old data are never reused.
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            current = self._snapshot
+            self.log.wait(current.log_seq)  # the reload replays the log from disk
+            self._snapshot = DatasetSnapshot(pd.DataFrame(), current.version, {}, {}, {}, {})
+            self._positions = _GrowingPositions()
+            self._loaded = False
+
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError(f"The dataset saved to {self.saved_to} is read-only here")
+
+    def _has_saved(self):
+        return os.path.exists(self.csv_path) or self._has_columnar()
+
+    def _has_columnar(self):
+        return self.columnar is not None and self.columnar.exists()
+
+    def _read_saved(self, persist=True):
+        # the dataset saved by a previous run: from the columnar files if there are any, otherwise from the csv
+        # (converted on the way), plus the append log batches not saved into them yet.
+        # Returns (what DatasetStore._publish needs, last log batch included)
+        while True:
+            builder = DatasetBuilder()
+            if self._has_columnar():
+                builder.add(self.columnar.read())
+                saved_seq = self.columnar.log_seq
+            else:
+                saved_seq = self.log.saved_seq()
+                builder.add(read_csv(self.csv_path))
+                if self.log.saved_seq() != saved_seq:
+                    continue  # rows were saved into the csv while we read it: read again
+            saved_rows = builder.rows
+            batches = self.log.replay(saved_seq)
+            if batches and batches[0][0] != saved_seq + 1:
+                continue  # batches were saved and dropped from the log while we read: read again
+            for _, rows in batches:
+                builder.add(rows, appended=True)
+            loaded = builder.finish()
+            log_seq = batches[-1][0] if batches else saved_seq
+            break
+
+        if persist:
+            frame = loaded[0]
+            self._file_columns = [c for c in frame.columns if c not in DERIVED_COLUMNS]
+            if self.columnar is not None and not self.columnar.exists():
+                self.columnar.write_base(frame.drop(columns=DERIVED_COLUMNS, errors="ignore"), log_seq)
+                self.log.checkpoint(log_seq)
+            elif batches:
+                self._save_rows(frame.iloc[saved_rows:], log_seq, lambda: frame)
+        return loaded, log_seq
+
+    def _merge(self, snapshot):
+        # must be called with the lock held: merge the appended chunks into the main frame and save the rows not saved yet.
+        # (A reader may have merged some of them already: `frame` merges on first use, but only in memory.)
+        frame = snapshot.frame  # later appends start from the merged frame
+        self._save_rows(frame.iloc[self._saved_rows:], snapshot.log_seq, lambda: frame)
+        self._saved_rows = len(frame)
+        self._rows = None
+
+    def _save_rows(self, rows, log_seq, whole_frame):
+        # save appended rows (up to append log batch `log_seq`) into the dataset files, then drop them from the log
+        if self.columnar is not None:
+            self.columnar.append(rows.drop(columns=DERIVED_COLUMNS, errors="ignore"),
+                                 lambda: whole_frame().drop(columns=DERIVED_COLUMNS, errors="ignore"), log_seq)
+        elif self._file_columns and os.path.exists(self.csv_path) and \
+                not set(self._file_columns) <= set(read_csv(self.csv_path, nrows=0).columns):
+            # the file lacks a column of the dataset (the anomaly_flag of an uploaded csv without one): write it again whole
+            partial = f"{self.csv_path}.{os.getpid()}-{threading.get_ident()}.part"
+            to_csv_frame(whole_frame()).reindex(columns=self._file_columns).to_csv(partial, index=False)
+            os.replace(partial, self.csv_path)
+        else:
+            # keep the file readable: write the new rows in the same column order as the file
+            rows = to_csv_frame(rows)
+            rows = rows.reindex(columns=self._file_columns) if self._file_columns else rows
+            rows.to_csv(self.csv_path, mode="a", header=not self._file_columns, index=False)
+        self.log.checkpoint(log_seq)
+
+    def _replace(self, path, loaded):
+        # make a freshly loaded dataset the current one, and the one saved on disk
+        with self._lock:
+            self.csv_path = path
+            self._file_columns = [c for c in loaded[0].columns if c not in DERIVED_COLUMNS]
+            log_seq = self.log.current_seq()
+            if self.columnar is not None:
+                self.columnar.write_base(loaded[0].drop(columns=DERIVED_COLUMNS, errors="ignore"), log_seq)
+            self.log.checkpoint(log_seq)  # batches appended to the previous dataset must not be replayed onto this one
+            snapshot = self._publish(*loaded, log_seq=log_seq)
+        self._notify(snapshot, None)
+        return snapshot
+
+    def _publish(self, frame, facility_index, latest_month, facility_versions, model_stats, tail=(), rows=None, log_seq=0,
+                 windows=None):
+        # must be called with the lock held, facility_versions=None means every facility is new in this version
+        version = self._snapshot.version + 1
+        loaded_version = self._snapshot.loaded_version
+        if facility_versions is None:
+            facility_versions = dict.fromkeys(facility_index, version)
+            loaded_version = version
+            self._positions = _GrowingPositions()
+            self._types = ColumnTypes(frame)
+            self._saved_rows = len(frame)  # a new upload, or what was read from the files (and saved there, see _read_saved)
+            ROWS_PROCESSED.inc(len(frame), operation="load")
+        snapshot = DatasetSnapshot(frame, version, facility_index, latest_month, facility_versions, model_stats,
+                                   tail=tail, rows=rows, log_seq=log_seq, loaded_version=loaded_version, windows=windows)
+        self._snapshot = snapshot
+        self._loaded = True
+        return snapshot
+
+    def _notify(self, snapshot, facilities):
+        for listener in self._listeners:
+            listener(snapshot, facilities)
+
+
+def entry_frame(entry):
+    """Turn one update entry (a dict of GlobalInput fields) into a one-row frame with its anomaly_flag set."""
+    return entries_frame([entry])
+
+
+def entries_frame(entries):
+    """Turn many update entries (a list of dicts of GlobalInput fields, or a dict of columns) into a frame.
+
+    The anomaly_flag of every row (set if any of its values is missing) is computed for all rows at once.
+    """
+    frame = pd.DataFrame(entries).drop(columns="anomaly_flag", errors="ignore")
+    frame["anomaly_flag"] = frame.isna().any(axis=1).to_numpy()  # flag the rows with a missing value
+    return frame
+
+
+# The single store shared by the gRPC server and the FastAPI service
+store = DatasetStore()
+
+Gauge("co2_dataset_rows", "Rows in the in-memory dataset", function=lambda: store._snapshot.rows)
+Gauge("co2_dataset_facilities", "Facilities in the in-memory dataset", function=lambda: len(store._snapshot.facility_index))
+Gauge("co2_dataset_version", "Version of the in-memory dataset", function=lambda: store._snapshot.version)
+Gauge("co2_dataset_memory_bytes", "Memory used by the in-memory dataset (text columns count their pointers only)",
+      function=lambda: store._snapshot.memory_bytes())
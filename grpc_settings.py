@@ -0,0 +1,65 @@
+# Settings of the gRPC server (server.py), from environment variables
+# -------------------------------
+# Everything the gRPC server is started with, so it can be sized for the dashboard traffic without code changes:
+#   - the port (the Dockerfile sets 50053, the port docker-compose publishes and the snet-daemon calls)
+#   - message size limits: grpc's default 4 MB receive limit is below many csv uploads (UploadCSVStream has no limit)
+#   - gzip compression of large responses only (chart data of long date ranges, fleet results), small ones are not
+#     worth the CPU time
+#   - keepalive pings, so connections dropped by a load balancer or NAT are noticed, and an optional maximum
+#     connection age, so clients reconnect from time to time and spread over the server processes
+#   - a cap on the RPCs in progress: above it new calls fail right away with RESOURCE_EXHAUSTED (and the client retries
+#     or backs off) instead of queueing behind the busy io threads
+#   - several server processes sharing the port with SO_REUSEPORT, the kernel spreads the connections over them.
+#     Each process has its own copy of the datasets in memory, loaded from the files saved on disk, and the datasets
+#     are read-only: uploads and updates fail with FAILED_PRECONDITION, as processes writing the same files and append
+#     log would lose each other's rows. So this is only for serving datasets that were saved by a single-process
+#     server; CO2_COMPUTE_WORKERS (compute_pool.py) uses all the cores for one shared, writable copy of the data instead.
+
+import os
+
+MB = 1024 * 1024
+
+GRPC_PORT = int(os.environ.get("CO2_GRPC_PORT", "50051"))
+GRPC_ASYNC = os.environ.get("CO2_GRPC_ASYNC", "0") == "1"  # 1 = the asyncio server of aio_server.py instead of the threaded one
+GRPC_PROCESSES = int(os.environ.get("CO2_GRPC_PROCESSES", "1"))  # server processes on GRPC_PORT, above 1 they share it with SO_REUSEPORT
+MAX_RECEIVE_MB = int(os.environ.get("CO2_GRPC_MAX_RECEIVE_MB", "64"))  # largest request (e.g. an UploadCSV file)
+MAX_SEND_MB = int(os.environ.get("CO2_GRPC_MAX_SEND_MB", "64"))  # largest response
+GZIP_MIN_BYTES = int(os.environ.get("CO2_GRPC_GZIP_MIN_BYTES", "0"))  # responses from this size on are gzipped, 0 = never
+MAX_CONCURRENT_RPCS = int(os.environ.get("CO2_GRPC_MAX_CONCURRENT_RPCS", "100"))  # RPCs in progress at once, 0 = no cap
+KEEPALIVE_SECONDS = int(os.environ.get("CO2_GRPC_KEEPALIVE_SECONDS", "60"))  # ping a connection idle this long, 0 = never
+KEEPALIVE_TIMEOUT_SECONDS = int(os.environ.get("CO2_GRPC_KEEPALIVE_TIMEOUT_SECONDS", "20"))  # close it without an answer by then
+MIN_CLIENT_PING_SECONDS = int(os.environ.get("CO2_GRPC_MIN_CLIENT_PING_SECONDS", "10"))  # clients pinging more often are disconnected
+MAX_CONNECTION_AGE_SECONDS = int(os.environ.get("CO2_GRPC_MAX_CONNECTION_AGE_SECONDS", "0"))  # 0 = connections are kept
+CONNECTION_AGE_GRACE_SECONDS = 30  # calls still running on a connection that is too old get this long to finish
+
+
+def server_options(reuse_port=GRPC_PROCESSES > 1):
+    """The channel options of grpc.server() for the settings above."""
+    options = [
+        ("grpc.max_receive_message_length", MAX_RECEIVE_MB * MB),
+        ("grpc.max_send_message_length", MAX_SEND_MB * MB),
+        # without it, a server left running on the port would silently share it with a new one
+        ("grpc.so_reuseport", int(reuse_port)),
+        ("grpc.http2.min_ping_interval_without_data_ms", MIN_CLIENT_PING_SECONDS * 1000),
+        ("grpc.keepalive_permit_without_calls", 1),  # dashboards keep their channel open between refreshes
+    ]
+    if KEEPALIVE_SECONDS > 0:
+        options += [
+            ("grpc.keepalive_time_ms", KEEPALIVE_SECONDS * 1000),
+            ("grpc.keepalive_timeout_ms", KEEPALIVE_TIMEOUT_SECONDS * 1000),
+        ]
+    if MAX_CONNECTION_AGE_SECONDS > 0:
+        options += [
+            ("grpc.max_connection_age_ms", MAX_CONNECTION_AGE_SECONDS * 1000),
+            ("grpc.max_connection_age_grace_ms", CONNECTION_AGE_GRACE_SECONDS * 1000),
+        ]
+    return options
+
+
+def describe():
+    """One line with the settings, for the startup log."""
+    gzip = f"gzip from {GZIP_MIN_BYTES} bytes" if GZIP_MIN_BYTES > 0 else "no gzip"
+    cap = f"at most {MAX_CONCURRENT_RPCS} RPCs at once" if MAX_CONCURRENT_RPCS > 0 else "no RPC cap"
+    keepalive = f"keepalive {KEEPALIVE_SECONDS}s" if KEEPALIVE_SECONDS > 0 else "no keepalive"
+    return (f"{'asyncio' if GRPC_ASYNC else 'threaded'}, {GRPC_PROCESSES} process(es), messages up to {MAX_RECEIVE_MB} MB in / {MAX_SEND_MB} MB out, "
+            f"{gzip}, {cap}, {keepalive}")
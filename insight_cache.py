@@ -0,0 +1,92 @@
+# Result cache for the insight endpoints
+# -------------------------------
+# Dashboards poll the same facilities over and over while the data does not change. Instead of refitting
+# the model on every poll, computed results are kept here, keyed by (dataset_id, endpoint, facility_name, facility version).
+# The facility version (see dataset_store.py) changes whenever that facility gets new rows, so a cached
+# result can never be served for data it was not computed from. Updates therefore leave the cache alone (looking for
+# the entries of the facilities they touched would cost a scan of the whole cache per append): the entries of older
+# versions are no longer asked for, and the LRU order and TTL_SECONDS evict them. Only when a new csv is uploaded
+# to a dataset are all of its entries dropped at once.
+# One cache serves every dataset of the registry (see dataset_registry.py), so its size does not grow with them.
+
+import threading
+import time
+from collections import OrderedDict
+
+from dataset_registry import registry
+from metrics import CounterFunction, Gauge
+
+MAX_ENTRIES = 4096   # least recently used entries are evicted above this size
+TTL_SECONDS = 600    # entries older than this are recomputed even if the data did not change
+
+
+class InsightCache:
+    """Thread-safe LRU cache with a time-to-live, counting hits, misses and evictions."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expiry time, value), oldest use first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Cached value for `key`, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Store `value` under `key` and return it."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self, dataset_id=None):
+        """Drop every entry of one dataset, or of all of them."""
+        with self._lock:
+            if dataset_id is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == dataset_id]:
+                    del self._entries[key]
+
+    def on_dataset_change(self, dataset_id, snapshot, facilities):
+        # dataset registry listener: a new csv drops the entries of its dataset, updates change the facility versions
+        # of the keys instead (see the top of this file)
+        if facilities is None:
+            self.clear(dataset_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# The cache shared by the gRPC server and the FastAPI service
+insight_cache = InsightCache()
+registry.add_listener(insight_cache.on_dataset_change)
+
+CounterFunction("co2_insight_cache_hits_total", "Insight cache lookups answered from the cache", function=lambda: insight_cache.hits)
+CounterFunction("co2_insight_cache_misses_total", "Insight cache lookups that had to compute", function=lambda: insight_cache.misses)
+CounterFunction("co2_insight_cache_evictions_total", "Insight cache entries evicted to stay under max_entries", function=lambda: insight_cache.evictions)
+Gauge("co2_insight_cache_entries", "Entries in the insight cache", function=lambda: len(insight_cache._entries))
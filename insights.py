@@ -3,43 +3,324 @@
 
 import pandas as pd               # Tool for handling tabular data (spreadsheets, CSVs)
 import numpy as np                # Tool for working with numbers
-import matplotlib                 # Tool for plotting graphs
-matplotlib.use('Agg')             # 'Agg' makes sure plots can be created even without a display screen (useful on servers)
-import matplotlib.pyplot as plt   # Shortcut to make charts and graphs
-from sklearn.linear_model import Ridge           # Machine Learning model: Ridge Regression (used to find patterns/relationships)
-from sklearn.metrics import mean_squared_error   # Tool to measure how accurate the model’s predictions are
+# (No plotting or machine learning libraries are imported here: the dashboards draw the charts from the data we return,
+#  and the Ridge Regression models are solved with numpy below. Loading matplotlib and scikit-learn took most of the
+#  servers' startup time, see startup.py)
 import argparse                   # Tool that lets us run the code from the command line with arguments
+import logging                    # Tool for messages about what the code is doing (only shown when logging is switched on)
+from metrics import stage, timed_stage  # Tool that measures how long each step takes (see metrics.py)
+from dataset_schema import NO_DATE, compact_frame, concat_frames, day_labels, day_numbers, plain_floats, read_csv  # Compact column types (see dataset_schema.py)
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------------------------------
+# HELPER: add_date_columns
+# What it does: converts the 'date' column into day numbers (days since 1970-01-01, see dataset_schema.py) and adds a month number
+# to every row (year * 12 + month - 1)
+# Purpose: the dataset store (see dataset_store.py) does this once when data is loaded, so the functions below do not have to.
+# Rows with a date that cannot be read get day NO_DATE and month -1, so they never count as the latest month.
+
+@timed_stage("date_parse")
+def add_date_columns(frame):
+    days = day_numbers(frame["date"])                                        # (already day numbers in the dataset store)
+    return frame.assign(date=days, month=month_numbers(days))
+
+def month_numbers(days):
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) + 1970 * 12
+    return np.where(days == NO_DATE, -1, months).astype("int32")
+
+# -------------------------------------------------------------------------------------
+# HELPER: facility_rows
+# What it does: returns only the rows that belong to one facility
+# Purpose: the servers pass a dataset snapshot (see dataset_store.py) that already knows where each facility's rows are,
+# so we jump straight to them instead of comparing the facility name of every row in the whole fleet's data.
+# A plain pandas DataFrame (for example when running this file from the command line) is simply filtered.
+
+def facility_rows(data, facility_name):
+    if hasattr(data, "facility_rows"):                                       # dataset snapshot with a facility index
+        return data.facility_rows(facility_name)
+    return data[data["facility_name"] == facility_name]                      # plain DataFrame: compare every row
+
+# -------------------------------------------------------------------------------------
+# HELPER: latest_month_rows
+# What it does: returns the rows of one facility from its most recent month, leaving out rows with missing values in `subset`
+# Purpose: this is STEP 1 to STEP 3 of every function below. A dataset snapshot already has the dates parsed, a month number
+# for every row and a pointer to each facility's latest month, so this becomes a direct lookup instead of parsing the dates again.
+
+@timed_stage("filter")
+def latest_month_rows(data, facility_name, subset):
+    if hasattr(data, "latest_month_rows"):                                   # dataset snapshot: the latest month's rows are known
+        filtered = data.latest_month_rows(facility_name).dropna(subset=subset)
+        if not filtered.empty:                                               # (if all of them miss values, an older month is the latest usable one)
+            return filtered
+    filtered = facility_rows(data, facility_name).dropna(subset=subset)      # STEP 1: Only keep the facility's rows without missing values
+    if "month" not in filtered.columns:                                      # STEP 2: Convert the 'date' column into a proper date format and get the month of every row
+        filtered = add_date_columns(filtered)
+    latest_month = filtered["month"].max()                                   # STEP 3: Focus only on the most recent month’s data
+    return filtered[(filtered["month"] == latest_month) & (filtered["month"] >= 0)]
+
+# -------------------------------------------------------------------------------------
+# HELPER: window_rows
+# What it does: returns the rows of one facility between two dates (start and end, or a window such as "7d", "2w", "month"
+# or "quarter" that ends on the facility's latest reading), leaving out rows with missing values for `model` (see MODELS),
+# together with that model fitted on them and the {column: (total, min, max)} of those rows.
+# Purpose: this is STEP 1 to STEP 5 for any date range instead of the latest month. A dataset snapshot keeps a date-sorted index
+# of each facility's rows with running sums (see window_index.py): the rows are found with a binary search, and the model,
+# totals, minimums and maximums come from a few subtractions instead of going over the rows again.
+
+@timed_stage("filter")
+def window_rows(data, facility_name, model, start=None, end=None, window=None):
+    from window_index import date_range                                      # (window_index.py uses MODELS from this file)
+    inputs, target, subset = MODELS[model]
+    if hasattr(data, "window_index"):                                        # dataset snapshot: use the facility's date index
+        windows = data.window_index(facility_name)
+        if windows is None:                                                  # unknown facility: no rows
+            return data.facility_rows(facility_name), None, None
+        rows = windows.models[model]
+        first, last = date_range(start, end, window, rows.days[-1] if len(rows) else None)
+        lo, hi = rows.bounds(first, last)
+        coef, intercept = ridge_from_stats(rows.stats(lo, hi))
+        return data.rows_at(rows.positions[lo:hi]), (coef[0], intercept[0]), rows.summary(lo, hi)
+    filtered = facility_rows(data, facility_name).dropna(subset=subset)     # plain DataFrame: filter and sort the rows
+    if "month" not in filtered.columns:
+        filtered = add_date_columns(filtered)
+    filtered = filtered[filtered["date"] != NO_DATE].sort_values("date", kind="stable")
+    days = filtered["date"].to_numpy(dtype=np.int64)
+    first, last = date_range(start, end, window, days[-1] if len(days) else None)
+    keep = np.ones(len(days), dtype=bool)
+    if first is not None:
+        keep &= days >= first
+    if last is not None:
+        keep &= days <= last
+    filtered = filtered[keep]
+    return filtered, (ridge_fit(filtered[inputs], filtered[target]) if len(filtered) else None), None
+
+# -------------------------------------------------------------------------------------
+# HELPER: select_rows
+# What it does: STEP 1-3 of the functions below: the latest month's rows by default, or the rows of the requested dates
+# Returns (rows, (coefficients, intercept) or None if the model still has to be fitted, {column: (total, min, max)} or None)
+
+def select_rows(data, facility_name, model, start=None, end=None, window=None):
+    if start or end or window:
+        return window_rows(data, facility_name, model, start, end, window)
+    return latest_month_rows(data, facility_name, MODELS[model][2]), None, None
+
+# -------------------------------------------------------------------------------------
+# HELPER: compact_dates
+# What it does: turns the dates of the rows into one start date plus the number of days since then for every row
+# Purpose: the compact form of the chart data (compact=True below) sends these numbers instead of one date text per row,
+# together with the values as numpy arrays, which the gRPC server packs into binary fields (see protos/service.proto).
+
+def compact_dates(filtered):
+    days = filtered["date"].to_numpy(dtype=np.int64)                         # dates are day numbers already
+    start = days.min()
+    return str(np.datetime64(int(start), "D")), (days - start).astype(np.int32)
+
+# -------------------------------------------------------------------------------------
+# HELPERS: closed-form Ridge Regression
+# What they do: fit the same model as scikit-learn's Ridge(alpha=1.0), but straight from a few sums per group of rows
+# Purpose: with only one or two inputs, scikit-learn spends most of its time checking inputs and building objects,
+# not on the maths. Ridge only needs these sums ("sufficient statistics"): the number of rows n, the sum of every input,
+# the sum of the target, the sums of inputs multiplied with each other and the sums of inputs multiplied with the target.
+# From them, the coefficients of every group (for example every facility) are solved at once as small 1x1 / 2x2 systems.
+
+RIDGE_ALPHA = 1.0   # strength of the regularization, the same as scikit-learn's default
+
+# The three models used by the insight functions: (inputs, target, columns that must not be missing)
+MODELS = {
+    "emission": (["co2_emitted_tonnes"], "co2_captured_tonnes",
+                 ["co2_emitted_tonnes", "capture_efficiency_percent", "co2_captured_tonnes"]),
+    "capture": (["co2_emitted_tonnes"], "capture_efficiency_percent",
+                ["co2_emitted_tonnes", "capture_efficiency_percent"]),
+    "storage": (["co2_emitted_tonnes", "co2_captured_tonnes"], "co2_stored_tonnes",
+                ["co2_emitted_tonnes", "co2_captured_tonnes", "co2_stored_tonnes"]),
+}
+
+def sufficient_stats(x, y, groups=None, n_groups=1):
+    x = np.asarray(x, dtype=float)
+    x = x[:, None] if x.ndim == 1 else x                                      # rows x inputs
+    y = np.asarray(y, dtype=float)
+    groups = np.zeros(len(y), dtype=np.intp) if groups is None else np.asarray(groups, dtype=np.intp)
+    p = x.shape[1]
+    n = np.bincount(groups, minlength=n_groups).astype(float)                # rows per group
+    sx = np.stack([np.bincount(groups, x[:, j], n_groups) for j in range(p)], axis=1)
+    sy = np.bincount(groups, y, n_groups)
+    sxx = np.empty((n_groups, p, p))
+    for j in range(p):
+        for k in range(j, p):
+            sxx[:, j, k] = sxx[:, k, j] = np.bincount(groups, x[:, j] * x[:, k], n_groups)
+    sxy = np.stack([np.bincount(groups, x[:, j] * y, n_groups) for j in range(p)], axis=1)
+    return {"n": n, "sx": sx, "sy": sy, "sxx": sxx, "sxy": sxy}
+
+def ridge_from_stats(stats, alpha=RIDGE_ALPHA):
+    n = np.maximum(stats["n"], 1.0)                                          # (empty groups just get zeros)
+    mean_x = stats["sx"] / n[:, None]
+    mean_y = stats["sy"] / n
+    # like scikit-learn, centre the data first so the intercept is not regularized
+    cxx = stats["sxx"] - n[:, None, None] * mean_x[:, :, None] * mean_x[:, None, :]
+    cxy = stats["sxy"] - n[:, None] * mean_x * mean_y[:, None]
+    p = mean_x.shape[1]
+    coef = np.linalg.solve(cxx + alpha * np.eye(p), cxy[:, :, None])[:, :, 0]  # one small system per group, solved together
+    intercept = mean_y - (mean_x * coef).sum(axis=1)
+    return coef, intercept
+
+def ridge_fit(x, y, alpha=RIDGE_ALPHA):
+    coef, intercept = ridge_from_stats(sufficient_stats(x, y), alpha)         # a single group: one facility's month
+    return coef[0], intercept[0]
+
+@timed_stage("predict")
+def ridge_predict(x, coef, intercept):
+    return np.asarray(x, dtype=float).reshape(-1, len(coef)) @ coef + intercept
+
+# -------------------------------------------------------------------------------------
+# HELPERS: running regression statistics
+# What they do: keep the sums of every (facility, model, month) up to date, so the models never need refitting from scratch
+# Purpose: when a single new reading arrives, its values are simply added to the sums of its facility's month. The model for
+# that month is then solved directly from the sums; only its predictions (one per day of the month) are recalculated.
+
+def model_values(column):
+    # the numbers the models are fitted on: float32 values as they are stored (not turned back into the csv's numbers by
+    # plain_floats, like the values shown), the same as a fit on the rows themselves, so every path gets the same model
+    return column.to_numpy(dtype=float, na_value=np.nan)
+
+def build_model_stats(frame):
+    model_stats = {}                                                         # facility name -> {(model, month): sums}
+    facility_codes, facility_names = pd.factorize(frame["facility_name"])   # number every facility and every month once,
+    month_codes, months = pd.factorize(frame["month"])                       # so a (facility, month) pair is a single integer
+    facility_names = np.asarray(facility_names, dtype=object)               # (plain names: picking them one by one from a categorical is slow)
+    pairs = facility_codes * len(months) + month_codes
+    usable = (facility_codes >= 0) & (frame["month"].to_numpy() >= 0)
+    values = {c: model_values(frame[c])                                       # every model column once, as plain numbers
+              for c in dict.fromkeys(c for _, _, subset in MODELS.values() for c in subset)}
+    for model, (inputs, target, subset) in MODELS.items():
+        valid = usable & ~np.any([np.isnan(values[c]) for c in subset], axis=0)  # rows without missing values for this model
+        codes, keys = pd.factorize(pairs[valid])
+        x = np.stack([values[c][valid] for c in inputs], axis=1)
+        stats = sufficient_stats(x, values[target][valid], codes, len(keys))
+        for i, key in enumerate(keys):
+            facility_name, month = facility_names[key // len(months)], int(months[key % len(months)])
+            model_stats.setdefault(facility_name, {})[(model, month)] = {k: v[i:i + 1] for k, v in stats.items()}
+    return model_stats
+
+def update_model_stats(model_stats, rows):
+    updated = dict(model_stats)                                              # a new dict: snapshots already handed out keep their sums
+    for facility_name, new_stats in build_model_stats(rows).items():
+        facility_stats = dict(updated.get(facility_name, {}))
+        for key, stats in new_stats.items():
+            old = facility_stats.get(key)
+            facility_stats[key] = stats if old is None else {k: old[k] + stats[k] for k in stats}
+        updated[facility_name] = facility_stats
+    return updated
+
+def add_model_rows(model_stats, groups, months, columns):
+    # the same as update_model_stats for a few new rows (a single reading, usually), from plain numpy values instead of a frame:
+    # `groups` maps facility name -> positions of its rows, `months` and every array of `columns` have one entry per row
+    updated = dict(model_stats)
+    for facility_name, positions in groups.items():
+        facility_stats = dict(updated.get(facility_name, {}))
+        for model, (inputs, target, subset) in MODELS.items():
+            values = {c: np.asarray(columns[c][positions], dtype=float) for c in subset}
+            valid = (months[positions] >= 0) & ~np.any([np.isnan(values[c]) for c in subset], axis=0)
+            for month in np.unique(months[positions][valid]):
+                rows = valid & (months[positions] == month)
+                x = np.stack([values[c][rows] for c in inputs], axis=1)
+                y = values[target][rows]
+                stats = {"n": np.array([rows.sum()], dtype=float), "sx": x.sum(axis=0)[None], "sy": y.sum(keepdims=True),
+                         "sxx": (x.T @ x)[None], "sxy": (x.T @ y)[None]}
+                key = (model, int(month))
+                old = facility_stats.get(key)
+                facility_stats[key] = stats if old is None else {k: old[k] + stats[k] for k in stats}
+        updated[facility_name] = facility_stats
+    return updated
+
+@timed_stage("fit")
+def fit_latest_month(data, facility_name, model, filtered):
+    inputs, target, _ = MODELS[model]
+    stats = None
+    if hasattr(data, "model_stats"):                                         # dataset snapshot: use the running sums of this month
+        stats = data.model_stats.get(facility_name, {}).get((model, int(filtered["month"].iloc[0])))
+    if stats is None or stats["n"][0] != len(filtered):                      # otherwise fit on the rows themselves
+        return ridge_fit(filtered[inputs], filtered[target])
+    coef, intercept = ridge_from_stats(stats)
+    return coef[0], intercept[0]
+
+# -------------------------------------------------------------------------------------
+# HELPER: fleet_latest_month_models
+# What it does: fits one model (see MODELS) for the latest month of every facility in one pass over the data
+# Purpose: precompute the whole fleet at once instead of filtering and fitting facility by facility.
+# Returns the latest month's rows of all facilities (or only of `facility_names`) and, per facility name, its (coefficients, intercept).
+
+@timed_stage("filter")
+def latest_month_frame(data, subset, facility_names=None):
+    if hasattr(data, "latest_month"):                                        # dataset snapshot: gather the known latest-month rows
+        names = data.latest_month if facility_names is None else [n for n in facility_names if n in data.latest_month]
+        positions = [data.latest_month[name][1] for name in names]
+        frame = data.rows_at(np.concatenate(positions) if positions else np.array([], dtype=np.intp))
+        frame = frame.dropna(subset=subset)
+        missing = set(names) - set(frame["facility_name"].unique())
+        if missing:                                                          # facilities whose latest month only has missing values
+            frame = concat_frames([frame] + [latest_month_rows(data, name, subset) for name in missing])
+        return frame
+    frame = data if facility_names is None else data[data["facility_name"].isin(facility_names)]
+    frame = frame.dropna(subset=subset)
+    if "month" not in frame.columns:
+        frame = add_date_columns(frame)
+    frame = frame[frame["month"] >= 0]
+    return frame[frame["month"] == frame.groupby("facility_name")["month"].transform("max")]
+
+def fit_fleet(data, model, facility_names=None, alpha=RIDGE_ALPHA):
+    inputs, target, subset = MODELS[model]
+    frame = latest_month_frame(data, subset, facility_names)
+    with stage("fit"):
+        codes, names = pd.factorize(frame["facility_name"])                 # facility number of every row
+        stats = sufficient_stats(frame[inputs], frame[target], codes, len(names))
+        coef, intercept = ridge_from_stats(stats, alpha)
+    return frame, codes, names, coef, intercept
+
+def fleet_latest_month_models(data, model, facility_names=None, alpha=RIDGE_ALPHA):
+    frame, _, names, coef, intercept = fit_fleet(data, model, facility_names, alpha)
+    return frame, {name: (coef[i], intercept[i]) for i, name in enumerate(names)}
 
 # -------------------------------------------------------------------------------------
 # FUNCTION 1: CO2_emssion_pattern
 # What it does: returns data for the CO2 emission pattern chart, the output is for the following items: date (days in the recent month), Co2 emitted in tonnes and capture efficiency in percentages
 # Purpose: Show the relationship between CO2 emissions and capture efficiency in the last month
 
-def CO2_emssion_pattern(data, facility_name, plot=False):
-   filtered = data[data["facility_name"] == facility_name].dropna(          # STEP 1: Only keep rows belonging to the requested facility and drop rows with missing values
-        subset=["co2_emitted_tonnes", "capture_efficiency_percent", "co2_captured_tonnes"]
+def CO2_emssion_pattern(data, facility_name, plot=False, compact=False, start=None, end=None, window=None):
+   filtered, fit, summary = select_rows(data, facility_name, "emission",   # STEP 1-3: Only keep the requested facility's rows of the most recent month
+        start, end, window                                                  # (or of the requested dates), without missing values
     )
    if filtered.empty:                                                       # If there is no usable data, stop here
-        print(f"No data found for facility: {facility_name}")
-        return None, None
-   filtered["date"] = pd.to_datetime(filtered["date"], errors="coerce")     # STEP 2: Convert the 'date' column into a proper date format
-   latest_month = filtered["date"].dt.to_period("M").max()                  # STEP 3: Focus only on the most recent month’s data
-   filtered = filtered[filtered["date"].dt.to_period("M") == latest_month]
+        logger.debug("No data found for facility: %s", facility_name)
+        return None
    x = filtered[["co2_emitted_tonnes"]]                                     # STEP 4: Define inputs (X) and target (Y) for the model
-   y = filtered["co2_captured_tonnes"]
-   d = filtered["date"]
-   model = Ridge()                                                          # STEP 5: Train a Ridge Regression model on this data
-   model.fit(x, y)
-   y_pred = model.predict(x)                                                # Model predicts efficiency given emissions
-
-   chart_data = {                                                           # STEP 6: Package results into a dictionary for dashboards
-       "labels": d.dt.strftime("%Y-%m-%d").tolist() , # returning dates as labels
-       "actual_values": x["co2_emitted_tonnes"].tolist(), # actual amount emitted in tonnes
-       "predicted_values": y_pred.tolist(), # percentage captured from the emitted amount
-       "min_emissions": filtered["co2_emitted_tonnes"].min(),
-       "max_emissions": filtered["co2_emitted_tonnes"].max(),
-       "total_emissions": filtered["co2_emitted_tonnes"].sum(),
-       "total_captured": filtered["co2_captured_tonnes"].sum(),
+   coef, intercept = fit or fit_latest_month(data, facility_name, "emission", filtered)  # STEP 5: Train a Ridge Regression model on this data
+   y_pred = ridge_predict(x, coef, intercept)                               # Model predicts efficiency given emissions
+   return emission_chart_data(filtered, y_pred, facility_name, compact, summary)  # STEP 6: Package results into a dictionary for dashboards
+
+def emission_chart_data(filtered, y_pred, facility_name, compact=False, summary=None):
+   if compact:                                                              # compact form: dates as day offsets, values kept as numpy arrays
+       start_date, day_offsets = compact_dates(filtered)
+       points = {"start_date": start_date, "day_offsets": day_offsets,
+                 "actual_values": plain_floats(filtered["co2_emitted_tonnes"]), "predicted_values": np.asarray(y_pred)}
+   else:
+       points = {
+           "labels": day_labels(filtered["date"]).tolist() , # returning dates as labels
+           "actual_values": plain_floats(filtered["co2_emitted_tonnes"]).tolist(), # actual amount emitted in tonnes
+           "predicted_values": y_pred.tolist(), # percentage captured from the emitted amount
+       }
+   if summary:                                                              # totals, min and max already known from the date index
+       (total_emissions, min_emissions, max_emissions), (total_captured, _, _) = summary["co2_emitted_tonnes"], summary["co2_captured_tonnes"]
+   else:
+       emitted = plain_floats(filtered["co2_emitted_tonnes"])               # (float32 columns back to the numbers of the csv)
+       min_emissions, max_emissions, total_emissions = emitted.min(), emitted.max(), emitted.sum()
+       total_captured = plain_floats(filtered["co2_captured_tonnes"]).sum()
+   chart_data = {
+       **points,
+       "min_emissions": min_emissions,
+       "max_emissions": max_emissions,
+       "total_emissions": total_emissions,
+       "total_captured": total_captured,
        "facility_name": facility_name,
    }
    return chart_data
@@ -49,25 +330,30 @@ def CO2_emssion_pattern(data, facility_name, plot=False):
 # What it does: returns data for the CO2 emission pattern chart, the output is for the following items: date (days in the recent month), actual percentage of CO2 capture and predicted percentage of CO2 capture based on the historical data for the period
 # Purpose: Compare actual vs predicted efficiency and raise inefficiency alerts
 
-def detect_efficiency_pattern(data, facility_name):
-    filtered = data[data["facility_name"] == facility_name].dropna(         # STEP 1: Filter for the chosen facility and drop missing values
-        subset=["co2_emitted_tonnes", "capture_efficiency_percent"]
+def detect_efficiency_pattern(data, facility_name, compact=False, start=None, end=None, window=None):
+    filtered, fit, _ = select_rows(data, facility_name, "capture",          # STEP 1-3: Filter for the chosen facility's latest month (or the requested dates)
+        start, end, window                                                  # and drop missing values
     )
     if filtered.empty:
-        print(f"No data found for facility: {facility_name}")
-        return None, None
-    filtered["date"] = pd.to_datetime(filtered["date"], errors="coerce")    # STEP 2: Clean up date column
-    latest_month = filtered["date"].dt.to_period("M").max()                 # STEP 3: Focus on the latest month’s entries
-    filtered = filtered[filtered["date"].dt.to_period("M") == latest_month]
+        logger.debug("No data found for facility: %s", facility_name)
+        return None
     x = filtered[["co2_emitted_tonnes"]]                                    # STEP 4: Inputs (emissions) and target (efficiency)
-    y = filtered["capture_efficiency_percent"]
-    d = filtered["date"]
-    model = Ridge()                                                         # STEP 5: Train Ridge Regression model and predict efficiency
-    model.fit(x, y)
-    y_pred = model.predict(x)
-    inefficiency_flag = ((y_pred - y) / y_pred) > 0.05                      # STEP 6: Flag inefficiencies, If actual capture is more than 5% lower than predicted, raise a flag (True = problem)
+    coef, intercept = fit or fit_latest_month(data, facility_name, "capture", filtered)  # STEP 5: Train Ridge Regression model and predict efficiency
+    y_pred = ridge_predict(x, coef, intercept)
+    return capture_chart_data(filtered, y_pred, compact)                    # STEP 6-7: Flag inefficiencies and prepare dashboard-ready output
+
+def inefficiency_flags(y, y_pred):
+    return ((y_pred - y) / y_pred) > 0.05                                   # If actual capture is more than 5% lower than predicted, raise a flag (True = problem)
+
+def capture_chart_data(filtered, y_pred, compact=False):
+    y = plain_floats(filtered["capture_efficiency_percent"])
+    inefficiency_flag = inefficiency_flags(y, y_pred)                       # STEP 6: Flag inefficiencies
+    if compact:                                                             # compact form: dates as day offsets, values kept as numpy arrays
+        start_date, day_offsets = compact_dates(filtered)
+        return {"start_date": start_date, "day_offsets": day_offsets, "actual_values": y,
+                "predicted_values": np.asarray(y_pred), "inefficiency_flag": np.asarray(inefficiency_flag, dtype=bool)}
     chart_data = {                                                          # STEP 7: Prepare dashboard-ready output
-        "labels": d.dt.strftime("%Y-%m-%d").tolist(),  # returning dates as labels
+        "labels": day_labels(filtered["date"]).tolist(),  # returning dates as labels
         "actual_values": y.tolist(),  # actual percentage of CO2 capture
         "predicted_values": y_pred.tolist(),  # predicted percentage of CO2 capture
         "inefficiency_flag": inefficiency_flag.tolist() # alerts us if the actual capture value is more than 5% lower than the predicted
@@ -79,42 +365,169 @@ def detect_efficiency_pattern(data, facility_name):
 # Purpose: Predict how much CO2 should have been stored and check if actual storage is lower
 # What it does: analyses and finds the predicted amount of stored CO2 based on the historical data, it also provides an alert (a flag) when the CO2 level is lower than the predicted value
 
-def storage_efficiency_pattern(data, facility_name):
-    filtered = data[data["facility_name"] == facility_name].dropna(           # STEP 1: Filter out missing rows
-        subset=["co2_emitted_tonnes", "co2_captured_tonnes", "co2_stored_tonnes"]
+def storage_efficiency_pattern(data, facility_name, compact=False, start=None, end=None, window=None):
+    filtered, fit, _ = select_rows(data, facility_name, "storage",            # STEP 1-3: Filter out missing rows and only keep latest month’s data
+        start, end, window                                                    # (or the requested dates)
     )
     if filtered.empty:
-        print(f"No data found for facility: {facility_name}")
-        return None, None
-    filtered["date"] = pd.to_datetime(filtered["date"], errors="coerce")      # STEP 2: Ensure 'date' is in proper datetime format
-    latest_month = filtered["date"].dt.to_period("M").max()                   # STEP 3: Only keep latest month’s data
-    filtered = filtered[filtered["date"].dt.to_period("M") == latest_month]
+        logger.debug("No data found for facility: %s", facility_name)
+        return None
     x = filtered[["co2_emitted_tonnes", "co2_captured_tonnes"]]  # STEP 4: Features and target, we include both features in order to better predict co2_stored_tonnes, the model can see the effectiveness of capturing the release CO2
-    y = filtered["co2_stored_tonnes"]
-    d = filtered["date"]
-    model = Ridge()                                              # STEP 5: Train regression model and make predictions
-    model.fit(x, y)
-    y_pred = model.predict(x) #predicted value of how much should be stored based on historical data
-    storage_issue_flag = y < y_pred                              # STEP 6: Flag storage issues if actual < predicted
+    coef, intercept = fit or fit_latest_month(data, facility_name, "storage", filtered)  # STEP 5: Train regression model and make predictions
+    y_pred = ridge_predict(x, coef, intercept) #predicted value of how much should be stored based on historical data
+    return storage_chart_data(filtered, y_pred, compact)         # STEP 6-7: Flag storage issues and package results for the dashboard
+
+def storage_issue_flags(y, y_pred):
+    return y < y_pred                                            # a storage issue: less CO2 stored than predicted
+
+def storage_chart_data(filtered, y_pred, compact=False):
+    y = plain_floats(filtered["co2_stored_tonnes"])
+    storage_issue_flag = storage_issue_flags(y, y_pred)          # STEP 6: Flag storage issues if actual < predicted
+    if compact:                                                  # compact form: dates as day offsets, values kept as numpy arrays
+        start_date, day_offsets = compact_dates(filtered)
+        return {"start_date": start_date, "day_offsets": day_offsets, "actual_stored_co2": y,
+                "predicted_stored_co2": np.asarray(y_pred), "storage_issue_detected": np.asarray(storage_issue_flag, dtype=bool)}
 
     dashboard_insights = {                                       # STEP 7: Package results for the dashboard
-        "labels": d.dt.strftime("%Y-%m-%d").tolist(), # dates
+        "labels": day_labels(filtered["date"]).tolist(), # dates
         "actual_stored_co2": y.tolist(),
         "predicted_stored_co2": y_pred.tolist(),
         "storage_issue_detected": storage_issue_flag.tolist() # allows us to see on which days the storage level was lower than predicted
     }
     return dashboard_insights
 
+# -------------------------------------------------------------------------------------
+# FUNCTION 4: fleet_insights
+# What it does: returns the results of the three functions above for many facilities (all of them when facility_names is None)
+# Purpose: a dashboard showing the whole fleet gets everything from one grouped pass over the data:
+# each model is fitted for every facility at once and all predictions are made in one go, instead of filtering and fitting per facility.
+# Returns {facility name: {"chart_data": ..., "capture_data": ..., "storage_data": ...}}, an item is None if the facility has no usable data for it.
+# With compact=True every item is in the compact form (see compact_dates).
+
+FLEET_OUTPUTS = [("chart_data", "emission"), ("capture_data", "capture"), ("storage_data", "storage")]
+
+def fleet_insights(data, facility_names=None, compact=False):
+    results = {}
+    for output, model in FLEET_OUTPUTS:
+        frame, codes, names, coef, intercept = fit_fleet(data, model, facility_names)     # STEP 1-5 for every facility at once
+        with stage("predict"):
+            inputs = np.asarray(frame[MODELS[model][0]], dtype=float)
+            y_pred = (inputs * coef[codes]).sum(axis=1) + intercept[codes]              # every facility's model predicts its own rows
+        order = np.argsort(codes, kind="stable")                                        # rows of each facility next to each other, in date order
+        ends = np.cumsum(np.bincount(codes, minlength=len(names)))
+        for i, name in enumerate(names):                                                # STEP 6-7: package the results per facility
+            rows = order[ends[i - 1] if i else 0:ends[i]]
+            filtered, predicted = frame.iloc[rows], y_pred[rows]
+            if model == "emission":
+                chart_data = emission_chart_data(filtered, predicted, name, compact)
+            elif model == "capture":
+                chart_data = capture_chart_data(filtered, predicted, compact)
+            else:
+                chart_data = storage_chart_data(filtered, predicted, compact)
+            results.setdefault(name, dict.fromkeys(output for output, _ in FLEET_OUTPUTS))[output] = chart_data
+    return results
+
+# -------------------------------------------------------------------------------------
+# FUNCTION 5: fleet_scan
+# What it does: checks every facility in every month for the two alerts above (capture inefficiency from FUNCTION 2 and
+# storage issues from FUNCTION 3), and ranks the facilities and the days with the biggest problems
+# Purpose: a health view of the whole fleet from one call, instead of calling the functions above once per facility.
+# Like those functions, every (facility, month) gets its own model, but all of them are fitted together from grouped sums
+# (see sufficient_stats) and every row is predicted and flagged in one go.
+# A day's shortfall is (predicted - actual) / predicted when it is flagged, and a facility's score is its average shortfall
+# per checked day, both alerts added together.
+# Returns {"facilities": [worst first, only those with a flagged day], "days": [worst first], "facilities_scanned",
+# "facilities_flagged", "rows_scanned"}, with plain Python values (ready for JSON or a gRPC message).
+
+SCAN_CHECKS = [("inefficiency", "capture", inefficiency_flags), ("storage_issue", "storage", storage_issue_flags)]
+SCAN_TOP_FACILITIES = 20  # facilities in the ranking
+SCAN_TOP_DAYS = 50        # flagged days in the ranking
+
+def fleet_scan(data, facility_names=None, top_facilities=SCAN_TOP_FACILITIES, top_days=SCAN_TOP_DAYS):
+    frame = data.frame if hasattr(data, "frame") else data                  # STEP 1: every row of the fleet (or of `facility_names`)
+    if facility_names is not None:
+        frame = frame[frame["facility_name"].isin(facility_names)]
+    if "month" not in frame.columns:
+        frame = add_date_columns(frame)
+    facility_codes, names = pd.factorize(frame["facility_name"])            # number every facility and every month once,
+    month_codes, months = pd.factorize(frame["month"])                       # so a (facility, month) pair is a single integer
+    pairs = facility_codes * len(months) + month_codes
+    usable = (facility_codes >= 0) & (frame["month"].to_numpy() >= 0)
+    n = len(names)
+    totals = {}
+    score = np.zeros(n)
+    flagged = []                                                             # per alert: (name, flagged rows, shortfalls, predictions, column)
+    for check, model, flags_of in SCAN_CHECKS:
+        inputs, target, subset = MODELS[model]
+        values = {c: frame[c].to_numpy(dtype=float, na_value=np.nan) for c in subset}
+        rows = np.flatnonzero(usable & ~np.any([np.isnan(values[c]) for c in subset], axis=0))  # STEP 2: rows without missing values
+        x = np.stack([values[c][rows] for c in inputs], axis=1)
+        y = values[target][rows]
+        with stage("fit"):
+            groups, keys = pd.factorize(pairs[rows])                         # STEP 3: one model per (facility, month), all fitted at once
+            coef, intercept = ridge_from_stats(sufficient_stats(x, y, groups, len(keys)))
+        with stage("predict"):
+            y_pred = (x * coef[groups]).sum(axis=1) + intercept[groups]      # STEP 4: every row predicted by its own month's model
+        actual = plain_floats(frame[target])[rows]                           # (compared as the numbers of the csv, like the chart data)
+        flags = np.asarray(flags_of(actual, y_pred), dtype=bool)             # STEP 5: the same alerts as the functions above
+        shortfall = np.where(flags, (y_pred - actual) / np.where(y_pred == 0, 1, y_pred), 0.0)
+        codes = facility_codes[rows]                                         # STEP 6: add them up per facility
+        checked = np.bincount(codes, minlength=n)
+        worst = np.zeros(n)
+        np.maximum.at(worst, codes[flags], shortfall[flags])
+        totals[check + "_days"] = np.bincount(codes[flags], minlength=n)
+        totals[check + "_checked"] = checked
+        totals[check + "_worst_shortfall"] = worst
+        score += np.bincount(codes, shortfall, n) / np.maximum(checked, 1)
+        flagged.append((check, rows[flags], shortfall[flags], y_pred[flags], target))
+
+    ranked = [i for i in np.argsort(-score, kind="stable") if score[i] > 0]  # STEP 7: rank the facilities, worst first
+    facilities = [{"facility_name": str(names[i]), "score": float(score[i]), **{k: v[i].item() for k, v in totals.items()}}
+                  for i in ranked[:top_facilities]]
+    shortfalls = np.concatenate([f[2] for f in flagged])                     # STEP 8: rank the flagged days of both alerts, worst first
+    worst_days = np.argsort(-shortfalls, kind="stable")[:top_days]
+    offsets = np.cumsum([0] + [len(f[1]) for f in flagged])
+    dates = frame["date"].to_numpy()
+    days = []
+    for i in worst_days:
+        part = np.searchsorted(offsets, i, side="right") - 1
+        check, rows, shortfall, y_pred, target = flagged[part]
+        row = rows[i - offsets[part]]
+        days.append({"facility_name": str(frame["facility_name"].iloc[row]), "date": day_labels(dates[row:row + 1])[0],
+                     "check": check, "actual": float(plain_floats(frame[target].iloc[row:row + 1])[0]),
+                     "predicted": float(y_pred[i - offsets[part]]), "shortfall": float(shortfall[i - offsets[part]])})
+    return {"facilities": facilities, "days": days, "facilities_scanned": n, "facilities_flagged": len(ranked),
+            "rows_scanned": len(frame)}
+
+def print_fleet_scan(scan):
+    print(f"Scanned {scan['facilities_scanned']} facilities ({scan['rows_scanned']} rows), "
+          f"{scan['facilities_flagged']} with flagged days")
+    print("\nWorst facilities (score = average shortfall per checked day):")
+    for rank, f in enumerate(scan["facilities"], 1):
+        print(f"{rank:4}. {f['facility_name']:<30} score {f['score']:.4f}   "
+              f"inefficient {f['inefficiency_days']}/{f['inefficiency_checked']} days (worst {f['inefficiency_worst_shortfall']:.1%})   "
+              f"storage issues {f['storage_issue_days']}/{f['storage_issue_checked']} days (worst {f['storage_issue_worst_shortfall']:.1%})")
+    print("\nWorst days:")
+    for rank, d in enumerate(scan["days"], 1):
+        print(f"{rank:4}. {d['date']}  {d['facility_name']:<30} {d['check']:<14} "
+              f"actual {d['actual']:.2f}, predicted {d['predicted']:.2f} ({d['shortfall']:.1%} short)")
+
 
 #Run from cli______________________________
 if __name__ == "__main__":
 #section allows script to be run manually by user in the terminal:    
     parser = argparse.ArgumentParser(description="Get emission patterns per facility")
     parser.add_argument("csv_file", type=str, help="Path to the csv with emission data")
-    parser.add_argument("--facility", type=str, help="Facility name", required=True)
+    parser.add_argument("--facility", type=str, help="Facility name")
+    parser.add_argument("--fleet-scan", action="store_true", help="Scan every facility for inefficiencies and storage issues, worst first")
+    parser.add_argument("--top", type=int, default=SCAN_TOP_FACILITIES, help="Facilities and days listed by --fleet-scan")
     parser.add_argument("--plot", action="store_true", help="Plot L2 for analyrics")
-    parser.add_argument("--scatter", action="store_true", help="Get the scatter plot along with L2")
     args = parser.parse_args()
-    data = pd.read_csv(args.csv_file) # Load the CSV file into a pandas DataFrame
-    CO2_emssion_pattern(data, args.facility, plot=args.plot, scatter=args.scatter) # Run one of the functions (basic CO2 pattern analysis)
+    if not args.fleet_scan and not args.facility:
+        parser.error("either --facility or --fleet-scan is required")
+    data = compact_frame(read_csv(args.csv_file)) # Load the CSV file into a pandas DataFrame (with compact column types, see dataset_schema.py)
+    if args.fleet_scan:
+        print_fleet_scan(fleet_scan(data, top_facilities=args.top, top_days=args.top)) # Scan the whole fleet, worst facilities and days first
+    else:
+        CO2_emssion_pattern(data, args.facility, plot=args.plot) # Run one of the functions (basic CO2 pattern analysis)
     #_________________________________________________________
@@ -0,0 +1,108 @@
+# Insights computed when data arrives, not when it is read
+# -------------------------------
+# The insights of a facility only change when it gets new rows, yet they used to be computed on the first read after
+# every change. The materializer listens to the dataset registry instead: after an upload or update of any dataset it
+# recomputes the insights of the facilities that changed, in one grouped pass, and puts the results (ready-to-send
+# protobuf bytes for the gRPC server) into the insight cache under the same keys the read handlers use, so a read is a lookup.
+# Datasets unloaded before their turn (see dataset_registry.py) are skipped, their next read computes as before.
+#
+# Updates often come in bursts (a gateway sending a batch every few milliseconds), so changes are collected for
+# DEBOUNCE_MS after the last one before anything is computed, but never for longer than MAX_DELAY_MS.
+# A read that arrives before the materializer is done simply computes the result itself, as before.
+
+import logging
+import os
+import threading
+import time
+
+DEBOUNCE_MS = 200     # wait this long after the last change before computing
+MAX_DELAY_MS = 2000   # but compute at least this often while changes keep coming
+MATERIALIZE = os.environ.get("CO2_MATERIALIZE", "1") != "0"  # set CO2_MATERIALIZE=0 to only compute on read
+
+logger = logging.getLogger(__name__)
+
+
+class Materializer:
+    """Background thread keeping the insight cache filled for the facilities that changed.
+
+    `compute(store, snapshot, facility_names)` returns {(endpoint, facility_name): value} for the given facilities
+    of a dataset; every value is cached under (dataset_id, endpoint, facility_name, facility version of `snapshot`).
+    """
+
+    def __init__(self, registry, cache, compute, debounce_ms=DEBOUNCE_MS, max_delay_ms=MAX_DELAY_MS):
+        self.registry = registry
+        self.cache = cache
+        self.compute = compute
+        self.debounce = debounce_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self._condition = threading.Condition()
+        self._pending = {}         # dataset id -> facilities changed since the last run, or None for a whole new dataset
+        self._first_change = 0.0   # time.monotonic() of the oldest pending change
+        self._last_change = 0.0
+        self._thread = None
+        self.runs = 0
+        self.facilities_materialized = 0
+
+    def start(self):
+        """Start listening to the registry. Safe to call more than once."""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="insight-materializer", daemon=True)
+            self._thread.start()
+        self.registry.add_listener(self.on_dataset_change)
+        for dataset_id in self.registry.loaded_datasets():  # datasets loaded before we started listening
+            self.on_dataset_change(dataset_id, None, None)
+
+    def on_dataset_change(self, dataset_id, snapshot, facilities):
+        # dataset registry listener: only remembers what changed, the work happens on the materializer's thread
+        with self._condition:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_change = now
+            self._last_change = now
+            if facilities is None:
+                self._pending[dataset_id] = None
+            elif dataset_id not in self._pending:
+                self._pending[dataset_id] = set(facilities)
+            elif self._pending[dataset_id] is not None:
+                self._pending[dataset_id].update(facilities)
+            self._condition.notify()
+
+    def stats(self):
+        return {"runs": self.runs, "facilities_materialized": self.facilities_materialized}
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                while True:  # debounce: wait until the changes stop for a moment, or have waited long enough
+                    now = time.monotonic()
+                    remaining = min(self._last_change + self.debounce, self._first_change + self.max_delay) - now
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                pending, self._pending = self._pending, {}
+
+            for dataset_id, facilities in pending.items():
+                try:
+                    self._materialize(dataset_id, facilities)
+                except Exception as e:  # never let one bad run stop the thread, reads still compute on their own
+                    logger.exception("Materializer error: %s", e)
+
+    def _materialize(self, dataset_id, facilities):
+        store = self.registry.loaded_store(dataset_id)
+        if store is None:  # unloaded meanwhile: not worth loading it again just for this
+            return
+        snapshot = store.snapshot()
+        if snapshot.empty:
+            return
+        facilities = list(snapshot.facility_index) if facilities is None else list(facilities)
+        started = time.perf_counter()
+        results = self.compute(store, snapshot, facilities)
+        for (endpoint, facility_name), value in results.items():
+            self.cache.put((dataset_id, endpoint, facility_name, snapshot.facility_version(facility_name)), value)
+        self.runs += 1
+        self.facilities_materialized += len(facilities)
+        logger.info("Materialized insights of %d facilities in %.3fs", len(facilities), time.perf_counter() - started)
@@ -0,0 +1,233 @@
+# Metrics in the Prometheus text format
+# -------------------------------
+# Counters, gauges and histograms kept in memory and rendered on request by the /metrics endpoints
+# (service.py for FastAPI, and a small HTTP listener started by server.py for gRPC, see serve_metrics()).
+# Nothing here depends on a Prometheus client library.
+#
+# stage("fit") times one stage of a request into the co2_stage_seconds histogram; @timed_stage("fit") does the same
+# for every call of a function. With CO2_METRICS=0 both turn into no-ops, so the hot path pays nothing for them.
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS = os.environ.get("CO2_METRICS", "1") != "0"
+METRICS_HOST = os.environ.get("CO2_METRICS_HOST", "127.0.0.1")  # local only by default
+METRICS_PORT = int(os.environ.get("CO2_METRICS_PORT", "9100"))  # /metrics of the gRPC server, 0 = no listener
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values tuple -> value
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labelnames, key, value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. requests or rows processed."""
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down. With `function`, it is read from function() every time metrics are rendered."""
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=None, function=None):
+        super().__init__(name, help, labelnames, registry)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.function is not None:
+            return [(self.name, (), (), self.function())]
+        return super().samples()
+
+
+class CounterFunction(Gauge):
+    """A counter kept elsewhere (e.g. the insight cache's hit count), read from function() when metrics are rendered."""
+    type = "counter"
+
+
+class Histogram(_Metric):
+    """Counts of observed values (e.g. seconds) per bucket, with their sum and count."""
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]  # per bucket, +Inf, then the sum
+            counts[position] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += count
+                samples.append((self.name + "_bucket", self.labelnames + ("le",), key + (bound,), cumulative))
+            samples.append((self.name + "_count", self.labelnames, key, cumulative))
+            samples.append((self.name + "_sum", self.labelnames, key, counts[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labelnames, values, value in metric.samples():
+                lines.append(f"{name}{_label_text(labelnames, values)} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# The metrics shared by both servers_________________________
+STAGE_SECONDS = Histogram("co2_stage_seconds", "Time spent in each stage of computing an insight", ["stage"])
+RPC_SECONDS = Histogram("co2_grpc_request_seconds", "gRPC request duration", ["method", "code"])
+HTTP_SECONDS = Histogram("co2_http_request_seconds", "HTTP request duration", ["path", "status"])
+ROWS_PROCESSED = Counter("co2_rows_processed_total", "Rows loaded or appended into the dataset", ["operation"])
+
+
+def process_rss_bytes():
+    # current resident memory of this process (Linux), or the peak where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+Gauge("co2_process_resident_memory_bytes", "Resident memory of the process", function=process_rss_bytes)
+#___________________________
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+@contextmanager
+def _timer(stage_name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage_name)
+
+
+def stage(stage_name):
+    """Context manager timing one stage (load, filter, date_parse, fit, predict, serialize) into STAGE_SECONDS."""
+    return _timer(stage_name) if METRICS else _NO_TIMER
+
+
+def timed_stage(stage_name):
+    """Decorator timing every call of a function as one stage. Returns the function itself when metrics are off."""
+    def decorate(function):
+        if not METRICS:
+            return function
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage_name)
+        return timed
+    return decorate
+
+
+def serve_metrics(port=METRICS_PORT, host=METRICS_HOST, ready=None):
+    """Serve GET /metrics on a background thread (for the gRPC server, which has no HTTP endpoint of its own).
+
+    With a `ready` function, GET /ready answers 200 once ready() is true and 503 before (see startup.py).
+    """
+    if port <= 0:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/ready" and ready is not None:
+                status, body = (200, b"ready\n") if ready() else (503, b"starting\n")
+            elif path == "/metrics":
+                status, body = 200, REGISTRY.render().encode()
+            else:
+                self.send_error(404)
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # no line per scrape
+            pass
+
+    http_server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=http_server.serve_forever, name="metrics-http", daemon=True).start()
+    return http_server
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14protos/service.proto\x12\x0c\x63o2analytics\"(\n\x10UploadCSVRequest\x12\x14\n\x0c\x66ile_content\x18\x01 \x01(\x0c\"4\n\x11UploadCSVResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\"\x07\n\x05\x45mpty\"!\n\rGetCSVRequest\x12\x10\n\x08\x63sv_name\x18\x01 \x01(\t\"o\n\tCSVRecord\x12\x33\n\x06\x66ields\x18\x01 \x03(\x0b\x32#.co2analytics.CSVRecord.FieldsEntry\x1a-\n\x0b\x46ieldsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\":\n\x0eGetCSVResponse\x12(\n\x07records\x18\x01 \x03(\x0b\x32\x17.co2analytics.CSVRecord\"\xb4\x02\n\x0bGlobalInput\x12\x0c\n\x04\x64\x61te\x18\x01 \x01(\t\x12\x13\n\x0b\x66\x61\x63ility_id\x18\x02 \x01(\t\x12\x15\n\rfacility_name\x18\x03 \x01(\t\x12\x0f\n\x07\x63ountry\x18\x04 \x01(\t\x12\x0e\n\x06region\x18\x05 \x01(\t\x12\x19\n\x11storage_site_type\x18\x06 \x01(\t\x12\x1a\n\x12\x63o2_emitted_tonnes\x18\x07 \x01(\x01\x12\x1b\n\x13\x63o2_captured_tonnes\x18\x08 \x01(\x01\x12\x19\n\x11\x63o2_stored_tonnes\x18\t \x01(\x01\x12\"\n\x1a\x63\x61pture_efficiency_percent\x18\n \x01(\x01\x12!\n\x19storage_integrity_percent\x18\x0b \x01(\x01\x12\x14\n\x0c\x61nomaly_flag\x18\x0c \x01(\x08\"J\n\x11UpdateCSVResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x14\n\x0c\x61nomaly_flag\x18\x03 \x01(\x08\"+\n\x12GetInsightsRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\"8\n\x1fGetCaptureEfficiencyDataRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\"8\n\x1fGetStorageEfficiencyDataRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\"\xc2\x01\n\tChartData\x12\x0e\n\x06labels\x18\x01 \x03(\t\x12\x18\n\x10predicted_values\x18\x02 \x03(\x01\x12\x15\n\ractual_values\x18\x03 \x03(\x01\x12\x15\n\rmin_emissions\x18\x04 \x01(\x01\x12\x15\n\rmax_emissions\x18\x05 \x01(\x01\x12\x17\n\x0ftotal_emissions\x18\x06 \x01(\x01\x12\x16\n\x0etotal_captured\x18\x07 \x01(\x01\x12\x15\n\rfacility_name\x18\x08 \x01(\t\"s\n\x15\x43\x61ptureEfficiencyData\x12\x0e\n\x06labels\x18\x01 \x03(\t\x12\x18\n\x10predicted_values\x18\x02 \x03(\x01\x12\x15\n\ractual_values\x18\x03 \x03(\x01\x12\x19\n\x11inefficiency_flag\x18\x04 \x03(\x08\"\x80\x01\n\x15StorageEfficiencyData\x12\x0e\n\x06labels\x18\x01 \x03(\t\x12\x19\n\x11\x61\x63tual_stored_co2\x18\x02 \x03(\x01\x12\x1c\n\x14predicted_stored_co2\x18\x03 \x03(\x01\x12\x1e\n\x16storage_issue_detected\x18\x04 \x03(\x08\"B\n\x13GetInsightsResponse\x12+\n\nchart_data\x18\x01 \x01(\x0b\x32\x17.co2analytics.ChartData\"]\n GetCaptureEfficiencyDataResponse\x12\x39\n\x0c\x63\x61pture_data\x18\x01 \x01(\x0b\x32#.co2analytics.CaptureEfficiencyData\"]\n GetStorageEfficiencyDataResponse\x12\x39\n\x0cstorage_data\x18\x01 \x01(\x0b\x32#.co2analytics.StorageEfficiencyData2\xbf\x04\n\x13\x43O2AnalyticsService\x12L\n\tUploadCSV\x12\x1e.co2analytics.UploadCSVRequest\x1a\x1f.co2analytics.UploadCSVResponse\x12\x43\n\x06GetCSV\x12\x1b.co2analytics.GetCSVRequest\x1a\x1c.co2analytics.GetCSVResponse\x12G\n\tUpdateCSV\x12\x19.co2analytics.GlobalInput\x1a\x1f.co2analytics.UpdateCSVResponse\x12V\n\x0fGetInsightsPlot\x12 .co2analytics.GetInsightsRequest\x1a!.co2analytics.GetInsightsResponse\x12y\n\x18GetCaptureEfficiencyData\x12-.co2analytics.GetCaptureEfficiencyDataRequest\x1a..co2analytics.GetCaptureEfficiencyDataResponse\x12y\n\x18GetStorageEfficiencyData\x12-.co2analytics.GetStorageEfficiencyDataRequest\x1a..co2analytics.GetStorageEfficiencyDataResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14protos/service.proto\x12\x0c\x63o2analytics\"<\n\x10UploadCSVRequest\x12\x14\n\x0c\x66ile_content\x18\x01 \x01(\x0c\x12\x12\n\ndataset_id\x18\x02 \x01(\t\"4\n\x11UploadCSVResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\"2\n\x0eUploadCSVChunk\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\x12\x12\n\ndataset_id\x18\x02 \x01(\t\"\xa8\x01\n\x17UploadCSVStreamResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0c\n\x04rows\x18\x03 \x01(\x03\x12\x16\n\x0e\x62ytes_received\x18\x04 \x01(\x03\x12\x0f\n\x07seconds\x18\x05 \x01(\x01\x12\x17\n\x0frows_per_second\x18\x06 \x01(\x01\x12\x1c\n\x14megabytes_per_second\x18\x07 \x01(\x01\"\x07\n\x05\x45mpty\"5\n\rGetCSVRequest\x12\x10\n\x08\x63sv_name\x18\x01 \x01(\t\x12\x12\n\ndataset_id\x18\x02 \x01(\t\"o\n\tCSVRecord\x12\x33\n\x06\x66ields\x18\x01 \x03(\x0b\x32#.co2analytics.CSVRecord.FieldsEntry\x1a-\n\x0b\x46ieldsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\":\n\x0eGetCSVResponse\x12(\n\x07records\x18\x01 \x03(\x0b\x32\x17.co2analytics.CSVRecord\"\xe3\x03\n\x0bGlobalInput\x12\x0c\n\x04\x64\x61te\x18\x01 \x01(\t\x12\x13\n\x0b\x66\x61\x63ility_id\x18\x02 \x01(\t\x12\x15\n\rfacility_name\x18\x03 \x01(\t\x12\x0f\n\x07\x63ountry\x18\x04 \x01(\t\x12\x0e\n\x06region\x18\x05 \x01(\t\x12\x19\n\x11storage_site_type\x18\x06 \x01(\t\x12\x1f\n\x12\x63o2_emitted_tonnes\x18\x07 \x01(\x01H\x00\x88\x01\x01\x12 \n\x13\x63o2_captured_tonnes\x18\x08 \x01(\x01H\x01\x88\x01\x01\x12\x1e\n\x11\x63o2_stored_tonnes\x18\t \x01(\x01H\x02\x88\x01\x01\x12\'\n\x1a\x63\x61pture_efficiency_percent\x18\n \x01(\x01H\x03\x88\x01\x01\x12&\n\x19storage_integrity_percent\x18\x0b \x01(\x01H\x04\x88\x01\x01\x12\x14\n\x0c\x61nomaly_flag\x18\x0c \x01(\x08\x12\x12\n\ndataset_id\x18\r \x01(\tB\x15\n\x13_co2_emitted_tonnesB\x16\n\x14_co2_captured_tonnesB\x14\n\x12_co2_stored_tonnesB\x1d\n\x1b_capture_efficiency_percentB\x1c\n\x1a_storage_integrity_percent\"J\n\x11UpdateCSVResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x14\n\x0c\x61nomaly_flag\x18\x03 \x01(\x08\"i\n\x15UpdateCSVBatchRequest\x12*\n\x07\x65ntries\x18\x01 \x03(\x0b\x32\x19.co2analytics.GlobalInput\x12\x10\n\x08\x62\x61tch_id\x18\x02 \x01(\x04\x12\x12\n\ndataset_id\x18\x03 \x01(\t\"\xa0\x01\n\x16UpdateCSVBatchResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x10\n\x08\x62\x61tch_id\x18\x03 \x01(\x04\x12\x15\n\rrows_received\x18\x04 \x01(\x03\x12\x12\n\nrows_added\x18\x05 \x01(\x03\x12\x11\n\tanomalies\x18\x06 \x01(\x03\x12\x15\n\ranomaly_flags\x18\x07 \x03(\x08\"|\n\x12GetInsightsRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x0f\n\x07\x63ompact\x18\x02 \x01(\x08\x12\r\n\x05start\x18\x03 \x01(\t\x12\x0b\n\x03\x65nd\x18\x04 \x01(\t\x12\x0e\n\x06window\x18\x05 \x01(\t\x12\x12\n\ndataset_id\x18\x06 \x01(\t\"\x89\x01\n\x1fGetCaptureEfficiencyDataRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x0f\n\x07\x63ompact\x18\x02 \x01(\x08\x12\r\n\x05start\x18\x03 \x01(\t\x12\x0b\n\x03\x65nd\x18\x04 \x01(\t\x12\x0e\n\x06window\x18\x05 \x01(\t\x12\x12\n\ndataset_id\x18\x06 \x01(\t\"\x89\x01\n\x1fGetStorageEfficiencyDataRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x0f\n\x07\x63ompact\x18\x02 \x01(\x08\x12\r\n\x05start\x18\x03 \x01(\t\x12\x0b\n\x03\x65nd\x18\x04 \x01(\t\x12\x0e\n\x06window\x18\x05 \x01(\t\x12\x12\n\ndataset_id\x18\x06 \x01(\t\"\xa4\x02\n\tChartData\x12\x0e\n\x06labels\x18\x01 \x03(\t\x12\x18\n\x10predicted_values\x18\x02 \x03(\x01\x12\x15\n\ractual_values\x18\x03 \x03(\x01\x12\x15\n\rmin_emissions\x18\x04 \x01(\x01\x12\x15\n\rmax_emissions\x18\x05 \x01(\x01\x12\x17\n\x0ftotal_emissions\x18\x06 \x01(\x01\x12\x16\n\x0etotal_captured\x18\x07 \x01(\x01\x12\x15\n\rfacility_name\x18\x08 \x01(\t\x12\x12\n\nstart_date\x18\t \x01(\t\x12\x13\n\x0b\x64\x61y_offsets\x18\n \x03(\x05\x12\x19\n\x11\x61\x63tual_values_f32\x18\x0b \x01(\x0c\x12\x1c\n\x14predicted_values_f32\x18\x0c \x01(\x0c\"\xf5\x01\n\x15\x43\x61ptureEfficiencyData\x12\x0e\n\x06labels\x18\x01 \x03(\t\x12\x18\n\x10predicted_values\x18\x02 \x03(\x01\x12\x15\n\ractual_values\x18\x03 \x03(\x01\x12\x19\n\x11inefficiency_flag\x18\x04 \x03(\x08\x12\x12\n\nstart_date\x18\x05 \x01(\t\x12\x13\n\x0b\x64\x61y_offsets\x18\x06 \x03(\x05\x12\x19\n\x11\x61\x63tual_values_f32\x18\x07 \x01(\x0c\x12\x1c\n\x14predicted_values_f32\x18\x08 \x01(\x0c\x12\x1e\n\x16inefficiency_flag_bits\x18\t \x01(\x0c\"\x86\x02\n\x15StorageEfficiencyData\x12\x0e\n\x06labels\x18\x01 \x03(\t\x12\x19\n\x11\x61\x63tual_stored_co2\x18\x02 \x03(\x01\x12\x1c\n\x14predicted_stored_co2\x18\x03 \x03(\x01\x12\x1e\n\x16storage_issue_detected\x18\x04 \x03(\x08\x12\x12\n\nstart_date\x18\x05 \x01(\t\x12\x13\n\x0b\x64\x61y_offsets\x18\x06 \x03(\x05\x12\x1d\n\x15\x61\x63tual_stored_co2_f32\x18\x07 \x01(\x0c\x12 \n\x18predicted_stored_co2_f32\x18\x08 \x01(\x0c\x12\x1a\n\x12storage_issue_bits\x18\t \x01(\x0c\"B\n\x13GetInsightsResponse\x12+\n\nchart_data\x18\x01 \x01(\x0b\x32\x17.co2analytics.ChartData\"]\n GetCaptureEfficiencyDataResponse\x12\x39\n\x0c\x63\x61pture_data\x18\x01 \x01(\x0b\x32#.co2analytics.CaptureEfficiencyData\"]\n GetStorageEfficiencyDataResponse\x12\x39\n\x0cstorage_data\x18\x01 \x01(\x0b\x32#.co2analytics.StorageEfficiencyData\"n\n\x17GetFleetInsightsRequest\x12\x16\n\x0e\x66\x61\x63ility_names\x18\x01 \x03(\t\x12\x16\n\x0e\x61ll_facilities\x18\x02 \x01(\x08\x12\x0f\n\x07\x63ompact\x18\x03 \x01(\x08\x12\x12\n\ndataset_id\x18\x04 \x01(\t\"\xcc\x01\n\x10\x46\x61\x63ilityInsights\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12+\n\nchart_data\x18\x02 \x01(\x0b\x32\x17.co2analytics.ChartData\x12\x39\n\x0c\x63\x61pture_data\x18\x03 \x01(\x0b\x32#.co2analytics.CaptureEfficiencyData\x12\x39\n\x0cstorage_data\x18\x04 \x01(\x0b\x32#.co2analytics.StorageEfficiencyData\"j\n\x18GetFleetInsightsResponse\x12\x32\n\nfacilities\x18\x01 \x03(\x0b\x32\x1e.co2analytics.FacilityInsights\x12\x1a\n\x12missing_facilities\x18\x02 \x03(\t\"h\n\x10ScanFleetRequest\x12\x16\n\x0e\x66\x61\x63ility_names\x18\x01 \x03(\t\x12\x16\n\x0etop_facilities\x18\x02 \x01(\r\x12\x10\n\x08top_days\x18\x03 \x01(\r\x12\x12\n\ndataset_id\x18\x04 \x01(\t\"\xf7\x01\n\x0e\x46\x61\x63ilityHealth\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\r\n\x05score\x18\x02 \x01(\x01\x12\x19\n\x11inefficiency_days\x18\x03 \x01(\x03\x12\x1c\n\x14inefficiency_checked\x18\x04 \x01(\x03\x12$\n\x1cinefficiency_worst_shortfall\x18\x05 \x01(\x01\x12\x1a\n\x12storage_issue_days\x18\x06 \x01(\x03\x12\x1d\n\x15storage_issue_checked\x18\x07 \x01(\x03\x12%\n\x1dstorage_issue_worst_shortfall\x18\x08 \x01(\x01\"v\n\nFlaggedDay\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\r\n\x05\x63heck\x18\x03 \x01(\t\x12\x0e\n\x06\x61\x63tual\x18\x04 \x01(\x01\x12\x11\n\tpredicted\x18\x05 \x01(\x01\x12\x11\n\tshortfall\x18\x06 \x01(\x01\"\xbb\x01\n\x11ScanFleetResponse\x12\x30\n\nfacilities\x18\x01 \x03(\x0b\x32\x1c.co2analytics.FacilityHealth\x12&\n\x04\x64\x61ys\x18\x02 \x03(\x0b\x32\x18.co2analytics.FlaggedDay\x12\x1a\n\x12\x66\x61\x63ilities_scanned\x18\x03 \x01(\x03\x12\x1a\n\x12\x66\x61\x63ilities_flagged\x18\x04 \x01(\x03\x12\x14\n\x0crows_scanned\x18\x05 \x01(\x03\x32\xb3\t\n\x13\x43O2AnalyticsService\x12L\n\tUploadCSV\x12\x1e.co2analytics.UploadCSVRequest\x1a\x1f.co2analytics.UploadCSVResponse\x12X\n\x0fUploadCSVStream\x12\x1c.co2analytics.UploadCSVChunk\x1a%.co2analytics.UploadCSVStreamResponse(\x01\x12\x43\n\x06GetCSV\x12\x1b.co2analytics.GetCSVRequest\x1a\x1c.co2analytics.GetCSVResponse\x12G\n\tUpdateCSV\x12\x19.co2analytics.GlobalInput\x1a\x1f.co2analytics.UpdateCSVResponse\x12[\n\x0eUpdateCSVBatch\x12#.co2analytics.UpdateCSVBatchRequest\x1a$.co2analytics.UpdateCSVBatchResponse\x12`\n\x0fStreamUpdateCSV\x12#.co2analytics.UpdateCSVBatchRequest\x1a$.co2analytics.UpdateCSVBatchResponse(\x01\x30\x01\x12V\n\x0fGetInsightsPlot\x12 .co2analytics.GetInsightsRequest\x1a!.co2analytics.GetInsightsResponse\x12y\n\x18GetCaptureEfficiencyData\x12-.co2analytics.GetCaptureEfficiencyDataRequest\x1a..co2analytics.GetCaptureEfficiencyDataResponse\x12y\n\x18GetStorageEfficiencyData\x12-.co2analytics.GetStorageEfficiencyDataRequest\x1a..co2analytics.GetStorageEfficiencyDataResponse\x12\x61\n\x10GetFleetInsights\x12%.co2analytics.GetFleetInsightsRequest\x1a&.co2analytics.GetFleetInsightsResponse\x12L\n\tScanFleet\x12\x1e.co2analytics.ScanFleetRequest\x1a\x1f.co2analytics.ScanFleetResponse\x12H\n\tStreamCSV\x12\x1b.co2analytics.GetCSVRequest\x1a\x1c.co2analytics.GetCSVResponse0\x01\x12^\n\x13StreamFleetInsights\x12%.co2analytics.GetFleetInsightsRequest\x1a\x1e.co2analytics.FacilityInsights0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -34,41 +34,63 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_CSVRECORD_FIELDSENTRY']._loaded_options = None
   _globals['_CSVRECORD_FIELDSENTRY']._serialized_options = b'8\001'
   _globals['_UPLOADCSVREQUEST']._serialized_start=38
-  _globals['_UPLOADCSVREQUEST']._serialized_end=78
-  _globals['_UPLOADCSVRESPONSE']._serialized_start=80
-  _globals['_UPLOADCSVRESPONSE']._serialized_end=132
-  _globals['_EMPTY']._serialized_start=134
-  _globals['_EMPTY']._serialized_end=141
-  _globals['_GETCSVREQUEST']._serialized_start=143
-  _globals['_GETCSVREQUEST']._serialized_end=176
-  _globals['_CSVRECORD']._serialized_start=178
-  _globals['_CSVRECORD']._serialized_end=289
-  _globals['_CSVRECORD_FIELDSENTRY']._serialized_start=244
-  _globals['_CSVRECORD_FIELDSENTRY']._serialized_end=289
-  _globals['_GETCSVRESPONSE']._serialized_start=291
-  _globals['_GETCSVRESPONSE']._serialized_end=349
-  _globals['_GLOBALINPUT']._serialized_start=352
-  _globals['_GLOBALINPUT']._serialized_end=660
-  _globals['_UPDATECSVRESPONSE']._serialized_start=662
-  _globals['_UPDATECSVRESPONSE']._serialized_end=736
-  _globals['_GETINSIGHTSREQUEST']._serialized_start=738
-  _globals['_GETINSIGHTSREQUEST']._serialized_end=781
-  _globals['_GETCAPTUREEFFICIENCYDATAREQUEST']._serialized_start=783
-  _globals['_GETCAPTUREEFFICIENCYDATAREQUEST']._serialized_end=839
-  _globals['_GETSTORAGEEFFICIENCYDATAREQUEST']._serialized_start=841
-  _globals['_GETSTORAGEEFFICIENCYDATAREQUEST']._serialized_end=897
-  _globals['_CHARTDATA']._serialized_start=900
-  _globals['_CHARTDATA']._serialized_end=1094
-  _globals['_CAPTUREEFFICIENCYDATA']._serialized_start=1096
-  _globals['_CAPTUREEFFICIENCYDATA']._serialized_end=1211
-  _globals['_STORAGEEFFICIENCYDATA']._serialized_start=1214
-  _globals['_STORAGEEFFICIENCYDATA']._serialized_end=1342
-  _globals['_GETINSIGHTSRESPONSE']._serialized_start=1344
-  _globals['_GETINSIGHTSRESPONSE']._serialized_end=1410
-  _globals['_GETCAPTUREEFFICIENCYDATARESPONSE']._serialized_start=1412
-  _globals['_GETCAPTUREEFFICIENCYDATARESPONSE']._serialized_end=1505
-  _globals['_GETSTORAGEEFFICIENCYDATARESPONSE']._serialized_start=1507
-  _globals['_GETSTORAGEEFFICIENCYDATARESPONSE']._serialized_end=1600
-  _globals['_CO2ANALYTICSSERVICE']._serialized_start=1603
-  _globals['_CO2ANALYTICSSERVICE']._serialized_end=2178
+  _globals['_UPLOADCSVREQUEST']._serialized_end=98
+  _globals['_UPLOADCSVRESPONSE']._serialized_start=100
+  _globals['_UPLOADCSVRESPONSE']._serialized_end=152
+  _globals['_UPLOADCSVCHUNK']._serialized_start=154
+  _globals['_UPLOADCSVCHUNK']._serialized_end=204
+  _globals['_UPLOADCSVSTREAMRESPONSE']._serialized_start=207
+  _globals['_UPLOADCSVSTREAMRESPONSE']._serialized_end=375
+  _globals['_EMPTY']._serialized_start=377
+  _globals['_EMPTY']._serialized_end=384
+  _globals['_GETCSVREQUEST']._serialized_start=386
+  _globals['_GETCSVREQUEST']._serialized_end=439
+  _globals['_CSVRECORD']._serialized_start=441
+  _globals['_CSVRECORD']._serialized_end=552
+  _globals['_CSVRECORD_FIELDSENTRY']._serialized_start=507
+  _globals['_CSVRECORD_FIELDSENTRY']._serialized_end=552
+  _globals['_GETCSVRESPONSE']._serialized_start=554
+  _globals['_GETCSVRESPONSE']._serialized_end=612
+  _globals['_GLOBALINPUT']._serialized_start=615
+  _globals['_GLOBALINPUT']._serialized_end=1098
+  _globals['_UPDATECSVRESPONSE']._serialized_start=1100
+  _globals['_UPDATECSVRESPONSE']._serialized_end=1174
+  _globals['_UPDATECSVBATCHREQUEST']._serialized_start=1176
+  _globals['_UPDATECSVBATCHREQUEST']._serialized_end=1281
+  _globals['_UPDATECSVBATCHRESPONSE']._serialized_start=1284
+  _globals['_UPDATECSVBATCHRESPONSE']._serialized_end=1444
+  _globals['_GETINSIGHTSREQUEST']._serialized_start=1446
+  _globals['_GETINSIGHTSREQUEST']._serialized_end=1570
+  _globals['_GETCAPTUREEFFICIENCYDATAREQUEST']._serialized_start=1573
+  _globals['_GETCAPTUREEFFICIENCYDATAREQUEST']._serialized_end=1710
+  _globals['_GETSTORAGEEFFICIENCYDATAREQUEST']._serialized_start=1713
+  _globals['_GETSTORAGEEFFICIENCYDATAREQUEST']._serialized_end=1850
+  _globals['_CHARTDATA']._serialized_start=1853
+  _globals['_CHARTDATA']._serialized_end=2145
+  _globals['_CAPTUREEFFICIENCYDATA']._serialized_start=2148
+  _globals['_CAPTUREEFFICIENCYDATA']._serialized_end=2393
+  _globals['_STORAGEEFFICIENCYDATA']._serialized_start=2396
+  _globals['_STORAGEEFFICIENCYDATA']._serialized_end=2658
+  _globals['_GETINSIGHTSRESPONSE']._serialized_start=2660
+  _globals['_GETINSIGHTSRESPONSE']._serialized_end=2726
+  _globals['_GETCAPTUREEFFICIENCYDATARESPONSE']._serialized_start=2728
+  _globals['_GETCAPTUREEFFICIENCYDATARESPONSE']._serialized_end=2821
+  _globals['_GETSTORAGEEFFICIENCYDATARESPONSE']._serialized_start=2823
+  _globals['_GETSTORAGEEFFICIENCYDATARESPONSE']._serialized_end=2916
+  _globals['_GETFLEETINSIGHTSREQUEST']._serialized_start=2918
+  _globals['_GETFLEETINSIGHTSREQUEST']._serialized_end=3028
+  _globals['_FACILITYINSIGHTS']._serialized_start=3031
+  _globals['_FACILITYINSIGHTS']._serialized_end=3235
+  _globals['_GETFLEETINSIGHTSRESPONSE']._serialized_start=3237
+  _globals['_GETFLEETINSIGHTSRESPONSE']._serialized_end=3343
+  _globals['_SCANFLEETREQUEST']._serialized_start=3345
+  _globals['_SCANFLEETREQUEST']._serialized_end=3449
+  _globals['_FACILITYHEALTH']._serialized_start=3452
+  _globals['_FACILITYHEALTH']._serialized_end=3699
+  _globals['_FLAGGEDDAY']._serialized_start=3701
+  _globals['_FLAGGEDDAY']._serialized_end=3819
+  _globals['_SCANFLEETRESPONSE']._serialized_start=3822
+  _globals['_SCANFLEETRESPONSE']._serialized_end=4009
+  _globals['_CO2ANALYTICSSERVICE']._serialized_start=4012
+  _globals['_CO2ANALYTICSSERVICE']._serialized_end=5215
 # @@protoc_insertion_point(module_scope)
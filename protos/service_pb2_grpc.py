@@ -40,6 +40,11 @@ class CO2AnalyticsServiceStub(object):
                 request_serializer=protos_dot_service__pb2.UploadCSVRequest.SerializeToString,
                 response_deserializer=protos_dot_service__pb2.UploadCSVResponse.FromString,
                 _registered_method=True)
+        self.UploadCSVStream = channel.stream_unary(
+                '/co2analytics.CO2AnalyticsService/UploadCSVStream',
+                request_serializer=protos_dot_service__pb2.UploadCSVChunk.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.UploadCSVStreamResponse.FromString,
+                _registered_method=True)
         self.GetCSV = channel.unary_unary(
                 '/co2analytics.CO2AnalyticsService/GetCSV',
                 request_serializer=protos_dot_service__pb2.GetCSVRequest.SerializeToString,
@@ -50,6 +55,16 @@ class CO2AnalyticsServiceStub(object):
                 request_serializer=protos_dot_service__pb2.GlobalInput.SerializeToString,
                 response_deserializer=protos_dot_service__pb2.UpdateCSVResponse.FromString,
                 _registered_method=True)
+        self.UpdateCSVBatch = channel.unary_unary(
+                '/co2analytics.CO2AnalyticsService/UpdateCSVBatch',
+                request_serializer=protos_dot_service__pb2.UpdateCSVBatchRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.UpdateCSVBatchResponse.FromString,
+                _registered_method=True)
+        self.StreamUpdateCSV = channel.stream_stream(
+                '/co2analytics.CO2AnalyticsService/StreamUpdateCSV',
+                request_serializer=protos_dot_service__pb2.UpdateCSVBatchRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.UpdateCSVBatchResponse.FromString,
+                _registered_method=True)
         self.GetInsightsPlot = channel.unary_unary(
                 '/co2analytics.CO2AnalyticsService/GetInsightsPlot',
                 request_serializer=protos_dot_service__pb2.GetInsightsRequest.SerializeToString,
@@ -65,6 +80,26 @@ class CO2AnalyticsServiceStub(object):
                 request_serializer=protos_dot_service__pb2.GetStorageEfficiencyDataRequest.SerializeToString,
                 response_deserializer=protos_dot_service__pb2.GetStorageEfficiencyDataResponse.FromString,
                 _registered_method=True)
+        self.GetFleetInsights = channel.unary_unary(
+                '/co2analytics.CO2AnalyticsService/GetFleetInsights',
+                request_serializer=protos_dot_service__pb2.GetFleetInsightsRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.GetFleetInsightsResponse.FromString,
+                _registered_method=True)
+        self.ScanFleet = channel.unary_unary(
+                '/co2analytics.CO2AnalyticsService/ScanFleet',
+                request_serializer=protos_dot_service__pb2.ScanFleetRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.ScanFleetResponse.FromString,
+                _registered_method=True)
+        self.StreamCSV = channel.unary_stream(
+                '/co2analytics.CO2AnalyticsService/StreamCSV',
+                request_serializer=protos_dot_service__pb2.GetCSVRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.GetCSVResponse.FromString,
+                _registered_method=True)
+        self.StreamFleetInsights = channel.unary_stream(
+                '/co2analytics.CO2AnalyticsService/StreamFleetInsights',
+                request_serializer=protos_dot_service__pb2.GetFleetInsightsRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.FacilityInsights.FromString,
+                _registered_method=True)
 
 
 class CO2AnalyticsServiceServicer(object):
@@ -77,6 +112,13 @@ class CO2AnalyticsServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def UploadCSVStream(self, request_iterator, context):
+        """upload a csv of any size in chunks, it is parsed while it is still arriving
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def GetCSV(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -89,6 +131,20 @@ class CO2AnalyticsServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def UpdateCSVBatch(self, request, context):
+        """many rows at once, for gateways sending a whole batch of sensor readings: they are added in one step
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamUpdateCSV(self, request_iterator, context):
+        """a stream of batches, each one is acknowledged as soon as it is added
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def GetInsightsPlot(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -107,6 +163,33 @@ class CO2AnalyticsServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetFleetInsights(self, request, context):
+        """the three insights above for many facilities (or all of them) in one call
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ScanFleet(self, request, context):
+        """both alerts for every facility and month in one pass, with the worst facilities and days first
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamCSV(self, request, context):
+        """streaming variants: the csv rows in chunks of records, and the fleet insights one facility at a time
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamFleetInsights(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_CO2AnalyticsServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -115,6 +198,11 @@ def add_CO2AnalyticsServiceServicer_to_server(servicer, server):
                     request_deserializer=protos_dot_service__pb2.UploadCSVRequest.FromString,
                     response_serializer=protos_dot_service__pb2.UploadCSVResponse.SerializeToString,
             ),
+            'UploadCSVStream': grpc.stream_unary_rpc_method_handler(
+                    servicer.UploadCSVStream,
+                    request_deserializer=protos_dot_service__pb2.UploadCSVChunk.FromString,
+                    response_serializer=protos_dot_service__pb2.UploadCSVStreamResponse.SerializeToString,
+            ),
             'GetCSV': grpc.unary_unary_rpc_method_handler(
                     servicer.GetCSV,
                     request_deserializer=protos_dot_service__pb2.GetCSVRequest.FromString,
@@ -125,6 +213,16 @@ def add_CO2AnalyticsServiceServicer_to_server(servicer, server):
                     request_deserializer=protos_dot_service__pb2.GlobalInput.FromString,
                     response_serializer=protos_dot_service__pb2.UpdateCSVResponse.SerializeToString,
             ),
+            'UpdateCSVBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.UpdateCSVBatch,
+                    request_deserializer=protos_dot_service__pb2.UpdateCSVBatchRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.UpdateCSVBatchResponse.SerializeToString,
+            ),
+            'StreamUpdateCSV': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamUpdateCSV,
+                    request_deserializer=protos_dot_service__pb2.UpdateCSVBatchRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.UpdateCSVBatchResponse.SerializeToString,
+            ),
             'GetInsightsPlot': grpc.unary_unary_rpc_method_handler(
                     servicer.GetInsightsPlot,
                     request_deserializer=protos_dot_service__pb2.GetInsightsRequest.FromString,
@@ -140,6 +238,26 @@ def add_CO2AnalyticsServiceServicer_to_server(servicer, server):
                     request_deserializer=protos_dot_service__pb2.GetStorageEfficiencyDataRequest.FromString,
                     response_serializer=protos_dot_service__pb2.GetStorageEfficiencyDataResponse.SerializeToString,
             ),
+            'GetFleetInsights': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetFleetInsights,
+                    request_deserializer=protos_dot_service__pb2.GetFleetInsightsRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.GetFleetInsightsResponse.SerializeToString,
+            ),
+            'ScanFleet': grpc.unary_unary_rpc_method_handler(
+                    servicer.ScanFleet,
+                    request_deserializer=protos_dot_service__pb2.ScanFleetRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.ScanFleetResponse.SerializeToString,
+            ),
+            'StreamCSV': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamCSV,
+                    request_deserializer=protos_dot_service__pb2.GetCSVRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.GetCSVResponse.SerializeToString,
+            ),
+            'StreamFleetInsights': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamFleetInsights,
+                    request_deserializer=protos_dot_service__pb2.GetFleetInsightsRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.FacilityInsights.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'co2analytics.CO2AnalyticsService', rpc_method_handlers)
@@ -179,6 +297,33 @@ class CO2AnalyticsService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def UploadCSVStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/co2analytics.CO2AnalyticsService/UploadCSVStream',
+            protos_dot_service__pb2.UploadCSVChunk.SerializeToString,
+            protos_dot_service__pb2.UploadCSVStreamResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def GetCSV(request,
             target,
@@ -233,6 +378,60 @@ class CO2AnalyticsService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def UpdateCSVBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/co2analytics.CO2AnalyticsService/UpdateCSVBatch',
+            protos_dot_service__pb2.UpdateCSVBatchRequest.SerializeToString,
+            protos_dot_service__pb2.UpdateCSVBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def StreamUpdateCSV(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/co2analytics.CO2AnalyticsService/StreamUpdateCSV',
+            protos_dot_service__pb2.UpdateCSVBatchRequest.SerializeToString,
+            protos_dot_service__pb2.UpdateCSVBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def GetInsightsPlot(request,
             target,
@@ -313,3 +512,111 @@ class CO2AnalyticsService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def GetFleetInsights(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/co2analytics.CO2AnalyticsService/GetFleetInsights',
+            protos_dot_service__pb2.GetFleetInsightsRequest.SerializeToString,
+            protos_dot_service__pb2.GetFleetInsightsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ScanFleet(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/co2analytics.CO2AnalyticsService/ScanFleet',
+            protos_dot_service__pb2.ScanFleetRequest.SerializeToString,
+            protos_dot_service__pb2.ScanFleetResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def StreamCSV(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/co2analytics.CO2AnalyticsService/StreamCSV',
+            protos_dot_service__pb2.GetCSVRequest.SerializeToString,
+            protos_dot_service__pb2.GetCSVResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def StreamFleetInsights(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/co2analytics.CO2AnalyticsService/StreamFleetInsights',
+            protos_dot_service__pb2.GetFleetInsightsRequest.SerializeToString,
+            protos_dot_service__pb2.FacilityInsights.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
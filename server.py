@@ -1,190 +1,678 @@
+from startup import mark, readiness, warm_up  # first, so the startup time is measured from (almost) the process start
+import asyncio
 import base64
+import itertools
+import logging
 import os
 from io import BytesIO
 
 import grpc
+import multiprocessing
 from concurrent import futures
 from datetime import datetime
-import pandas as pd
+import numpy as np
 from protos import service_pb2
 from protos import service_pb2_grpc
 import time
-from insights import CO2_emssion_pattern, detect_efficiency_pattern, storage_efficiency_pattern
+from insights import CO2_emssion_pattern, detect_efficiency_pattern, storage_efficiency_pattern, fleet_insights, fleet_scan, SCAN_TOP_DAYS, SCAN_TOP_FACILITIES
+from dataset_store import entries_frame
+from dataset_registry import registry
+from insight_cache import insight_cache
+from compute_pool import COMPUTE_WORKERS, compute_pool
+from materializer import MATERIALIZE, Materializer
+from window_index import date_range
+from metrics import METRICS, METRICS_PORT, RPC_SECONDS, serve_metrics, stage
+from grpc_settings import GRPC_ASYNC, GRPC_PORT, GRPC_PROCESSES, GZIP_MIN_BYTES, MAX_CONCURRENT_RPCS, describe, server_options
+
+STREAM_FACILITIES = 50  # facilities computed per batch by StreamFleetInsights
+IO_THREADS = int(os.environ.get("CO2_IO_THREADS", "10"))  # threads answering gRPC requests
+LOG_LEVEL = os.environ.get("CO2_LOG_LEVEL", "INFO")  # DEBUG also logs every request
+READ_ONLY_DETAILS = ("Datasets are read-only while the server runs several processes (CO2_GRPC_PROCESSES > 1): "
+                     "upload and update them through a server with a single process")
+
+logger = logging.getLogger(__name__)
 
 
 class CO2AnalyticsService(service_pb2_grpc.CO2AnalyticsServiceServicer):
 
     def UploadCSV(self, request, context):
-        print("Upload request is running")
-        global csv_path, data
-        timestamp = datetime.now().astimezone().strftime("%Y%m%d%H%M%S")
-        csv_path = f"./csv_dataset" + ".csv"
-
-        with open(csv_path, "wb") as f:
-            f.write(request.file_content)
+        logger.debug("Received UploadCSV request")
+        store = self._store(request.dataset_id, context, write=True)
+        if store is None:
+            return service_pb2.UploadCSVResponse(status="failed", message="error")
 
         try:
-            data = pd.read_csv(csv_path)
+            # saved next to the old file and swapped in when parsed, so concurrent uploads never mix; every insight call afterwards reads from memory
+            store.load_stream([request.file_content])
             return service_pb2.UploadCSVResponse(
                 status="success",
-                message=f"CSV uploaded and saved to {csv_path}"
+                message=f"CSV uploaded and saved to {store.csv_path}"
             )
         except Exception as e:
-            print("Error:", e)
-            context.set_details(str(e))
-            context.set_code(grpc.StatusCode.INTERNAL)
-            return service_pb2.UploadCSVResponse(status="failed", message="error")
+            return upload_failed(e, context, service_pb2.UploadCSVResponse)
+
 
+    def UploadCSVStream(self, request_iterator, context):
+        logger.debug("Received UploadCSVStream request")
+        started = time.perf_counter()
+        first = next(request_iterator, None)  # the dataset_id of the first chunk names the dataset
+        store = self._store(first.dataset_id if first is not None else "", context, write=True)
+        if store is None:
+            return service_pb2.UploadCSVStreamResponse(status="failed", message="error")
+        chunks = itertools.chain([first] if first is not None else [], request_iterator)
+        try:
+            # rows are parsed and indexed while the following chunks are still arriving
+            snapshot, bytes_received = store.load_stream(chunk.data for chunk in chunks)
+        except Exception as e:
+            return upload_failed(e, context, service_pb2.UploadCSVStreamResponse)
+
+        seconds = time.perf_counter() - started
+        rows = snapshot.rows
+        return service_pb2.UploadCSVStreamResponse(
+            status="success",
+            message=f"CSV uploaded and saved to {store.csv_path}",
+            rows=rows,
+            bytes_received=bytes_received,
+            seconds=seconds,
+            rows_per_second=rows / seconds if seconds else 0.0,
+            megabytes_per_second=bytes_received / 1e6 / seconds if seconds else 0.0,
+        )
 
     def GetCSV(self, request, context):
-        print("Received GetCSV request")
-        return service_pb2.GetCSVResponse()
+        logger.debug("Received GetCSV request")
+        response = service_pb2.GetCSVResponse()
+        for chunk in self._csv_chunks(request, context):  # StreamCSV is better for big files, this holds every record at once
+            response.records.extend(chunk.records)
+        return response
+
+    def StreamCSV(self, request, context):
+        logger.debug("Received StreamCSV request")
+        yield from self._csv_chunks(request, context)
+
+    def _csv_chunks(self, request, context):
+        # the csv as GetCSVResponse messages of at most CHUNK_ROWS records each, built one at a time
+        store = self._store(request.dataset_id, context)
+        if store is None:
+            return
+        chunks = store.csv_chunks(request.csv_name or os.path.basename(store.csv_path))
+        if chunks is None:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please check the file name.")
+            return
+        for chunk in chunks:
+            yield csv_message(chunk)
 
     def UpdateCSV(self, request, context):
-        print("Received UpdateCSV request")
-        return service_pb2.UpdateCSVResponse()
+        logger.debug("Received UpdateCSV request")
+        store, snapshot = self._dataset(request.dataset_id, context, write=True)
+        if snapshot is None:
+            return service_pb2.UpdateCSVResponse(status="failed", message="error")
 
-    def GetInsightsPlot(self, request, context):
-        print("Received GetInsightsPlot request")
-        global csv_path, data
-        csv_path = fr".\csv_dataset.csv"
-        print(csv_path)
-        if os.path.exists(csv_path):
-            print("path exists")
-            data = pd.read_csv(csv_path)
-        else:
-            return {"error": "CSV not found on server. Please check the file name."}
+        new_entry = added_rows(store, [request])  # update the dataset in memory, the row is saved in the append log on disk
+
+        return service_pb2.UpdateCSVResponse(
+            status="success",
+            message=f"Data added to {store.saved_to}",
+            anomaly_flag=bool(new_entry["anomaly_flag"].iloc[0]),
+        )
+
+    def UpdateCSVBatch(self, request, context):
+        logger.debug("Received UpdateCSVBatch request")
+        store, snapshot = self._dataset(request.dataset_id, context, write=True)
+        if snapshot is None:
+            return service_pb2.UpdateCSVBatchResponse(status="failed", message="error", batch_id=request.batch_id)
+        return self._add_batch(store, request)
+
+    def StreamUpdateCSV(self, request_iterator, context):
+        logger.debug("Received StreamUpdateCSV request")
+        for request in request_iterator:  # every batch is acknowledged once it is added, before the next one is read
+            store, snapshot = self._dataset(request.dataset_id, context, write=True)  # each batch names its dataset
+            if snapshot is None:
+                return
+            yield self._add_batch(store, request)
+
+    def _add_batch(self, store, request):
+        # add every entry of one batch to the dataset in one step
+        if not request.entries:
+            return service_pb2.UpdateCSVBatchResponse(status="success", message="Empty batch", batch_id=request.batch_id)
+        rows = added_rows(store, request.entries)  # the missing-value check runs on the whole batch at once
+        flags = rows["anomaly_flag"].tolist()
+        return service_pb2.UpdateCSVBatchResponse(
+            status="success",
+            message=f"Data added to {store.saved_to}",
+            batch_id=request.batch_id,
+            rows_received=len(request.entries),
+            rows_added=len(rows),
+            anomalies=sum(flags),
+            anomaly_flags=flags,
+        )
 
-        if csv_path is None:
+    def _store(self, dataset_id, context, write=False):
+        # the store of one dataset (see dataset_registry.py), or None (with the error set on the context) for an invalid id,
+        # or with write=True (uploads and updates) if this process may not write its datasets (see serve())
+        try:
+            store = registry.get(dataset_id)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return None
+        if write and store.read_only:
+            context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+            context.set_details(READ_ONLY_DETAILS)
+            return None
+        return store
+
+    def _dataset(self, dataset_id, context, write=False):
+        # (store, current in-memory snapshot) of one dataset, or (store, None) with the error set on the context
+        # if the id is invalid or nothing was uploaded to it yet (or for write=True, see _store)
+        store = self._store(dataset_id, context, write)
+        if store is None:
+            return None, None
+        return store, self._loaded_snapshot(store, store.snapshot(), context)
+
+    def _loaded_snapshot(self, store, snapshot, context):
+        # the snapshot, or None with the error set on the context if nothing was uploaded to the dataset yet
+        if not store.loaded:
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details("CSV path not set. Use UploadCsv before anything.")
-            return service_pb2.GetInsightsResponse()
-
-        if data.empty:
+            return None
+        if snapshot.empty:
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details("No csv loaded. Use /set_csv/ before anything.")
-            return service_pb2.GetInsightsResponse()
+            return None
+        return snapshot
+
+    def GetInsightsPlot(self, request, context):
+        logger.debug("Received GetInsightsPlot request")
+        return self._insight("GetInsightsPlot", insights_response, service_pb2.GetInsightsResponse, request, context)
+
+
+    def GetCaptureEfficiencyData(self, request, context):
+        logger.debug("Received GetEfficiencyData request")
+        return self._insight("GetCaptureEfficiencyData", capture_efficiency_response, service_pb2.GetCaptureEfficiencyDataResponse, request, context)
 
-        chart_data = CO2_emssion_pattern(data, facility_name=request.facility_name)
 
-        if chart_data is None:
+
+    def GetStorageEfficiencyData(self, request, context):
+        logger.debug("Received GetStorageEfficiencyData request")
+        return self._insight("GetStorageEfficiencyData", storage_efficiency_response, service_pb2.GetStorageEfficiencyDataResponse, request, context)
+
+    def GetFleetInsights(self, request, context):
+        logger.debug("Received GetFleetInsights request")
+        store, snapshot = self._dataset(request.dataset_id, context)
+        if snapshot is None:
+            return service_pb2.GetFleetInsightsResponse()
+
+        return fleet_insights_response(store, snapshot, self._fleet_names(request), request.compact)
+
+    def ScanFleet(self, request, context):
+        logger.debug("Received ScanFleet request")
+        store, snapshot = self._dataset(request.dataset_id, context)
+        if snapshot is None:
+            return service_pb2.ScanFleetResponse()
+
+        facility_names = list(dict.fromkeys(request.facility_names)) or None  # empty = every facility
+        return fleet_scan_response(store, snapshot, facility_names,
+                                   request.top_facilities or SCAN_TOP_FACILITIES, request.top_days or SCAN_TOP_DAYS)
+
+    def StreamFleetInsights(self, request, context):
+        logger.debug("Received StreamFleetInsights request")
+        store, snapshot = self._dataset(request.dataset_id, context)
+        if snapshot is None:
+            return
+
+        facility_names = self._fleet_names(request)
+        if facility_names is None:
+            facility_names = list(snapshot.facility_index)
+        for start in range(0, len(facility_names), STREAM_FACILITIES):  # one grouped pass per batch of facilities
+            batch = facility_names[start:start + STREAM_FACILITIES]
+            computed = {facility.facility_name: facility for facility in fleet_insights_response(store, snapshot, batch, request.compact).facilities}
+            for facility_name in batch:  # a facility without usable data is sent with only its name
+                yield computed.get(facility_name) or service_pb2.FacilityInsights(facility_name=facility_name)
+
+    def _fleet_names(self, request):
+        # requested facility names without duplicates, or None for every facility
+        facility_names = list(dict.fromkeys(request.facility_names))
+        if request.all_facilities or facility_names == ["all"]:
+            return None
+        return facility_names
+
+    def _insight(self, endpoint, build_response, response_type, request, context):
+        # serve one insight RPC from the result cache, computing (and caching) the serialized response on a miss
+        store, snapshot = self._dataset(request.dataset_id, context)
+        if snapshot is None:
+            return response_type()
+        key, dates = self._insight_key(endpoint, request, snapshot, context)
+        if key is None:
+            return response_type()
+        cached = insight_cache.get(key)
+        if cached is not None:
+            return cached
+
+        data = computed_insight(key, build_response, store, snapshot, request, dates)
+        if data is None:
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details("No data available for this facility.")
-            return service_pb2.GetInsightsResponse()
+            return response_type()
+        return data
+
+    def _insight_key(self, endpoint, request, snapshot, context):
+        # (cache key, dates) of an insight request, or (None, None) with the error set on the context for invalid dates
+        dates = None
+        if request.start or request.end or request.window:  # any dates other than the latest month
+            dates = {"start": request.start, "end": request.end, "window": request.window}
+            try:
+                date_range(**dates)
+            except ValueError as e:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details(str(e))
+                return None, None
+            endpoint += f"@{request.start}|{request.end}|{request.window}"  # every date range is cached apart
+        if request.compact:  # the compact form is cached apart from the per-point one
+            endpoint += COMPACT
+        return (request.dataset_id, endpoint, request.facility_name, snapshot.facility_version(request.facility_name)), dates
+
+
+def computed_insight(key, build_response, store, snapshot, request, dates):
+    # the serialized response of an insight request that missed the cache, put into the cache (None without usable data)
+    response = build_response(store, snapshot, request.facility_name, request.compact, dates)
+    if response is None:
+        return None
+    with stage("serialize"):
+        data = response.SerializeToString()
+    return insight_cache.put(key, data)
+
+
+# Building the responses of the insight RPCs_________________________
+# each returns None when the facility has no usable data.
+# The insight functions go through compute_pool, which runs them in worker processes when those are enabled.
+# compact=True fills the compact fields of the chart messages instead of the per-point ones (see protos/service.proto),
+# dates ({"start", "end", "window"}) selects other dates than the latest month
+
+COMPACT = ":compact"  # added to the endpoint name in the cache keys of compact responses
+
+
+def insights_response(store, snapshot, facility_name, compact=False, dates=None):
+    chart_data = compute_pool.run(CO2_emssion_pattern, snapshot, store, facility_name, compact=compact, **(dates or {}))
+    if chart_data is None:
+        return None
+    return service_pb2.GetInsightsResponse(chart_data=chart_data_message(chart_data))
+
+
+def capture_efficiency_response(store, snapshot, facility_name, compact=False, dates=None):
+    chart_data = compute_pool.run(detect_efficiency_pattern, snapshot, store, facility_name, compact=compact, **(dates or {}))
+    if chart_data is None:
+        return None
+    return service_pb2.GetCaptureEfficiencyDataResponse(capture_data=capture_data_message(chart_data))
+
+
+def storage_efficiency_response(store, snapshot, facility_name, compact=False, dates=None):
+    chart_data = compute_pool.run(storage_efficiency_pattern, snapshot, store, facility_name, compact=compact, **(dates or {}))
+    if chart_data is None:
+        return None
+    return service_pb2.GetStorageEfficiencyDataResponse(storage_data=storage_data_message(chart_data))
+
+
+def fleet_insights_response(store, snapshot, facility_names, compact=False):
+    # facility_names=None means every facility, all of them are computed in one grouped pass
+    results = compute_pool.run(fleet_insights, snapshot, store, facility_names, compact=compact)
+    response = service_pb2.GetFleetInsightsResponse()
+    for facility_name in (facility_names if facility_names is not None else list(results)):
+        result = results.get(facility_name)
+        if result is None:
+            response.missing_facilities.append(facility_name)
+            continue
+        facility = response.facilities.add(facility_name=facility_name)
+        if result["chart_data"] is not None:
+            facility.chart_data.CopyFrom(chart_data_message(result["chart_data"]))
+        if result["capture_data"] is not None:
+            facility.capture_data.CopyFrom(capture_data_message(result["capture_data"]))
+        if result["storage_data"] is not None:
+            facility.storage_data.CopyFrom(storage_data_message(result["storage_data"]))
+    return response
+
+
+def fleet_scan_response(store, snapshot, facility_names, top_facilities=SCAN_TOP_FACILITIES, top_days=SCAN_TOP_DAYS):
+    # the fleet scan's dicts have the same fields as the messages
+    scan = compute_pool.run(fleet_scan, snapshot, store, facility_names, top_facilities=top_facilities, top_days=top_days)
+    return service_pb2.ScanFleetResponse(
+        facilities=[service_pb2.FacilityHealth(**facility) for facility in scan["facilities"]],
+        days=[service_pb2.FlaggedDay(**day) for day in scan["days"]],
+        facilities_scanned=scan["facilities_scanned"],
+        facilities_flagged=scan["facilities_flagged"],
+        rows_scanned=scan["rows_scanned"],
+    )
+
+
+def materialized_responses(store, snapshot, facility_names):
+    # serialized responses of the three insight RPCs for `facility_names`, in both forms, each computed in one grouped pass.
+    # Used by the materializer to fill the insight cache as soon as the facilities change
+    responses = {}
+    for suffix, compact in (("", False), (COMPACT, True)):
+        results = compute_pool.run(fleet_insights, snapshot, store, facility_names, compact=compact)
+        for facility_name, result in results.items():
+            if result["chart_data"] is not None:
+                responses[("GetInsightsPlot" + suffix, facility_name)] = service_pb2.GetInsightsResponse(
+                    chart_data=chart_data_message(result["chart_data"])).SerializeToString()
+            if result["capture_data"] is not None:
+                responses[("GetCaptureEfficiencyData" + suffix, facility_name)] = service_pb2.GetCaptureEfficiencyDataResponse(
+                    capture_data=capture_data_message(result["capture_data"])).SerializeToString()
+            if result["storage_data"] is not None:
+                responses[("GetStorageEfficiencyData" + suffix, facility_name)] = service_pb2.GetStorageEfficiencyDataResponse(
+                    storage_data=storage_data_message(result["storage_data"])).SerializeToString()
+    return responses
+
+
+def upload_failed(error, context, response_type):
+    # the response to an upload that raised `error`, called in its except block
+    if isinstance(error, ValueError):  # an empty or unparsable csv (pandas' EmptyDataError and ParserError are ValueErrors)
+        logger.warning("Upload rejected: %s", error)
+        context.set_details(f"Could not read the csv: {error}")
+        context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+    else:
+        logger.exception("Upload failed: %s", error)
+        context.set_details(str(error))
+        context.set_code(grpc.StatusCode.INTERNAL)
+    return response_type(status="failed", message="error")
+
+
+def added_rows(store, entries):
+    # GlobalInput messages as rows (with their anomaly flags), added to the dataset in one step
+    rows = entries_frame(entry_columns(entries))
+    store.append(rows)
+    return rows
+
+
+def csv_message(chunk):
+    # one chunk of csv rows as a GetCSVResponse, every field as text
+    records = chunk.astype(str).to_dict(orient="records")
+    return service_pb2.GetCSVResponse(records=[service_pb2.CSVRecord(fields=record) for record in records])
+
+
+def entry_columns(entries):
+    # GlobalInput messages as a dict of columns. proto3 has no null, so empty strings, unset readings and NaN count as missing
+    columns = {}
+    for field in service_pb2.GlobalInput.DESCRIPTOR.fields:
+        if field.name in ("anomaly_flag", "dataset_id"):  # computed by the server / not a column
+            continue
+        if field.has_presence:  # the optional readings: left out is missing, not 0.0
+            values = [getattr(entry, field.name) if entry.HasField(field.name) else None for entry in entries]
+        else:
+            values = [getattr(entry, field.name) for entry in entries]
+        if field.type == field.TYPE_STRING:
+            values = [value or None for value in values]
+        columns[field.name] = values
+    return columns
+
+
+def float32_bytes(values):
+    # values as a little-endian float32 array, straight from the numpy buffer
+    return np.asarray(values, dtype="<f4").tobytes()
 
-        chart_data_proto = service_pb2.ChartData(
-            labels=chart_data["labels"],
-            predicted_values=chart_data["predicted_values"],
-            actual_values=chart_data["actual_values"],
+
+def flag_bits(flags):
+    # one bit per flag, first flag in the lowest bit of the first byte
+    return np.packbits(np.asarray(flags, dtype=bool), bitorder="little").tobytes()
+
+
+def chart_data_message(chart_data):
+    if "start_date" in chart_data:  # compact form (see insights.compact_dates)
+        return service_pb2.ChartData(
+            start_date=chart_data["start_date"],
+            day_offsets=chart_data["day_offsets"],
+            actual_values_f32=float32_bytes(chart_data["actual_values"]),
+            predicted_values_f32=float32_bytes(chart_data["predicted_values"]),
             min_emissions=chart_data["min_emissions"],
             max_emissions=chart_data["max_emissions"],
             total_emissions=chart_data["total_emissions"],
             total_captured=chart_data["total_captured"],
             facility_name=chart_data["facility_name"],
         )
+    return service_pb2.ChartData(
+        labels=chart_data["labels"],
+        predicted_values=chart_data["predicted_values"],
+        actual_values=chart_data["actual_values"],
+        min_emissions=chart_data["min_emissions"],
+        max_emissions=chart_data["max_emissions"],
+        total_emissions=chart_data["total_emissions"],
+        total_captured=chart_data["total_captured"],
+        facility_name=chart_data["facility_name"],
+    )
+
+
+def capture_data_message(chart_data):
+    if "start_date" in chart_data:
+        return service_pb2.CaptureEfficiencyData(
+            start_date=chart_data["start_date"],
+            day_offsets=chart_data["day_offsets"],
+            actual_values_f32=float32_bytes(chart_data["actual_values"]),
+            predicted_values_f32=float32_bytes(chart_data["predicted_values"]),
+            inefficiency_flag_bits=flag_bits(chart_data["inefficiency_flag"]),
+        )
+    return service_pb2.CaptureEfficiencyData(
+        labels=chart_data["labels"],
+        predicted_values=chart_data["predicted_values"],
+        actual_values=chart_data["actual_values"],
+        inefficiency_flag=chart_data["inefficiency_flag"]
+    )
+
+
+def storage_data_message(chart_data):
+    if "start_date" in chart_data:
+        return service_pb2.StorageEfficiencyData(
+            start_date=chart_data["start_date"],
+            day_offsets=chart_data["day_offsets"],
+            actual_stored_co2_f32=float32_bytes(chart_data["actual_stored_co2"]),
+            predicted_stored_co2_f32=float32_bytes(chart_data["predicted_stored_co2"]),
+            storage_issue_bits=flag_bits(chart_data["storage_issue_detected"]),
+        )
+    return service_pb2.StorageEfficiencyData(
+        labels=chart_data["labels"],
+        actual_stored_co2=chart_data["actual_stored_co2"],
+        predicted_stored_co2=chart_data["predicted_stored_co2"],
+        storage_issue_detected=chart_data["storage_issue_detected"]
+    )
+#___________________________
 
 
-        return service_pb2.GetInsightsResponse(
-            chart_data = chart_data_proto
-        )
+materializer = Materializer(registry, insight_cache, materialized_responses)
 
 
-    def GetCaptureEfficiencyData(self, request, context):
-        print("Received GetEfficiencyData request")
-        global csv_path, data
-        csv_path = fr".\csv_dataset.csv"
-        print(csv_path)
-        if os.path.exists(csv_path):
-            print("path exists")
-            data = pd.read_csv(csv_path)
-        else:
-            return {"error": "CSV not found on server. Please check the file name."}
+# The interceptors. aio_server.py has async versions of them, which share everything but the awaiting:
+# what to wrap (timed_handler, serialized_handler, compressed_handler) and what to do per call (rpc_finished,
+# compress_response, compress_message)_________________________
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Times every RPC into the co2_grpc_request_seconds histogram, by method and status code."""
 
-        if csv_path is None:
-            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details("CSV path not set. Use UploadCsv before anything.")
-            return service_pb2.GetCaptureEfficiencyDataResponse()
+    def intercept_service(self, continuation, handler_call_details):
+        return timed_handler(continuation(handler_call_details), handler_call_details, timed_rpc, timed_stream_rpc)
 
-        if data.empty:
-            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details("No csv loaded. Use /set_csv/ before anything.")
-            return service_pb2.GetCaptureEfficiencyDataResponse()
 
-        chart_data = detect_efficiency_pattern(data, facility_name=request.facility_name)
+class SerializedResponseInterceptor(grpc.ServerInterceptor):
+    """Lets handlers return already serialized response bytes (from the insight cache) as they are."""
 
-        if chart_data is None:
-            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details("No data available for this facility.")
-            return service_pb2.GetCaptureEfficiencyDataResponse()
+    def intercept_service(self, continuation, handler_call_details):
+        return serialized_handler(continuation(handler_call_details))
 
-        chart_data_proto = service_pb2.CaptureEfficiencyData(
-            labels=chart_data["labels"],
-            predicted_values=chart_data["predicted_values"],
-            actual_values=chart_data["actual_values"],
-            inefficiency_flag = chart_data["inefficiency_flag"]
-        )
 
-        print(chart_data_proto)
-        return service_pb2.GetCaptureEfficiencyDataResponse(
-            capture_data = chart_data_proto
-        )
+class CompressionInterceptor(grpc.ServerInterceptor):
+    """Gzips the responses of GZIP_MIN_BYTES and more (see grpc_settings.py), smaller ones are sent as they are."""
 
+    def intercept_service(self, continuation, handler_call_details):
+        return compressed_handler(continuation(handler_call_details), compressed_rpc, compressed_stream_rpc)
 
 
-    def GetStorageEfficiencyData(self, request, context):
-        print("Received GetStorageEfficiencyData request")
-        global csv_path, data
-        csv_path = fr".\csv_dataset.csv"
-        print(csv_path)
-        if os.path.exists(csv_path):
-            print("path exists")
-            data = pd.read_csv(csv_path)
-        else:
-            return {"error": "CSV not found on server. Please check the file name."}
+def wrapped_handler(handler, wrap, wrap_stream):
+    # the handler with its behavior wrapped: by wrap() if it sends one response, by wrap_stream() if it streams them
+    if handler.unary_unary is not None:
+        return handler._replace(unary_unary=wrap(handler.unary_unary))
+    if handler.stream_unary is not None:
+        return handler._replace(stream_unary=wrap(handler.stream_unary))
+    if handler.unary_stream is not None:
+        return handler._replace(unary_stream=wrap_stream(handler.unary_stream))
+    return handler._replace(stream_stream=wrap_stream(handler.stream_stream))
 
-        if csv_path is None:
-            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details("CSV path not set. Use UploadCsv before anything.")
-            return service_pb2.GetStorageEfficiencyDataResponse()
 
-        if data.empty:
-            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details("No csv loaded. Use /set_csv/ before anything.")
-            return service_pb2.GetStorageEfficiencyDataResponse()
+def timed_handler(handler, handler_call_details, timed, timed_stream):
+    if handler is None or not METRICS:
+        return handler
+    method = handler_call_details.method.rsplit("/", 1)[-1]
+    return wrapped_handler(handler, lambda behavior: timed(behavior, method), lambda behavior: timed_stream(behavior, method))
 
-        chart_data = storage_efficiency_pattern(data, facility_name=request.facility_name)
 
-        if chart_data is None:
-            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details("No data available for this facility.")
-            return service_pb2.GetStorageEfficiencyDataResponse()
+def serialized_handler(handler):
+    if handler is None or handler.response_serializer is None:
+        return handler
+    serialize = handler.response_serializer
+    return handler._replace(
+        response_serializer=lambda response: response if isinstance(response, bytes) else serialize(response)
+    )
 
-        chart_data_proto = service_pb2.StorageEfficiencyData(
-            labels=chart_data["labels"],
-            actual_stored_co2=chart_data["actual_stored_co2"],
-            predicted_stored_co2=chart_data["predicted_stored_co2"],
-            storage_issue_detected=chart_data["storage_issue_detected"]
-        )
 
-        return service_pb2.GetStorageEfficiencyDataResponse(
-            storage_data=chart_data_proto
-        )
+def compressed_handler(handler, compressed, compressed_stream):
+    if handler is None or GZIP_MIN_BYTES <= 0:
+        return handler
+    return wrapped_handler(handler, compressed, compressed_stream)
+
+
+def rpc_code(context, failed=False):
+    code = context.code()  # None when the handler never set one
+    if code is None:
+        code = grpc.StatusCode.UNKNOWN if failed else grpc.StatusCode.OK
+    return code.name
+
 
+def rpc_finished(started, method, context, failed):
+    RPC_SECONDS.observe(time.perf_counter() - started, method=method, code=rpc_code(context, failed))
 
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+def timed_rpc(behavior, method):
+    def timed(request, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = behavior(request, context)
+            failed = False
+            return response
+        finally:
+            rpc_finished(started, method, context, failed)
+    return timed
+
+
+def timed_stream_rpc(behavior, method):
+    # a streamed response is timed until its last message is sent
+    def timed(request, context):
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield from behavior(request, context)
+            failed = False
+        finally:
+            rpc_finished(started, method, context, failed)
+    return timed
+
+
+def response_size(response):
+    return len(response) if isinstance(response, bytes) else response.ByteSize()  # bytes: a cached serialized response
+
+
+def compress_response(context, response):
+    if response is not None and response_size(response) >= GZIP_MIN_BYTES:
+        context.set_compression(grpc.Compression.Gzip)
+    return response
+
+
+def compress_message(context, response):
+    # the compression of a stream is chosen for the whole call (see compressed_stream_rpc), small messages skip it
+    if response_size(response) < GZIP_MIN_BYTES:
+        context.disable_next_message_compression()
+    return response
+
+
+def compressed_rpc(behavior):
+    def compressed(request, context):
+        return compress_response(context, behavior(request, context))
+    return compressed
+
+
+def compressed_stream_rpc(behavior):
+    def compressed(request, context):
+        context.set_compression(grpc.Compression.Gzip)
+        for response in behavior(request, context):
+            yield compress_message(context, response)
+    return compressed
+
+
+def server_interceptors():
+    return [MetricsInterceptor(), SerializedResponseInterceptor(), CompressionInterceptor()]
+#___________________________
+
+
+def create_server(io_threads=IO_THREADS, address=f"[::]:{GRPC_PORT}", reuse_port=GRPC_PROCESSES > 1):
+    """A gRPC server of the service with the settings of grpc_settings.py, listening on `address`, and its port."""
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=io_threads),
+        interceptors=server_interceptors(),
+        options=server_options(reuse_port),
+        maximum_concurrent_rpcs=MAX_CONCURRENT_RPCS if MAX_CONCURRENT_RPCS > 0 else None,  # above it: RESOURCE_EXHAUSTED right away
+    )
     service_pb2_grpc.add_CO2AnalyticsServiceServicer_to_server(CO2AnalyticsService(), server)
-    server.add_insecure_port('[::]:50051')
-    print("Starting server on port 50051...")
-    server.start()
+    port = server.add_insecure_port(address)
+    return server, port
+
+
+def serve(io_threads=IO_THREADS, compute_workers=COMPUTE_WORKERS, processes=GRPC_PROCESSES, process_index=0):
+    # io_threads answer the requests; with compute_workers > 0 the insight calculations run in that many processes,
+    # so one container can use all its cores (e.g. CO2_COMPUTE_WORKERS=$(nproc))
+    # with processes > 1 the first process starts the others, they all listen on the same port (see grpc_settings.py)
+    # and only the first one serves /metrics and /ready. They all read the same dataset files, and every process keeps
+    # its own append log numbering and copy of the data, so none of them may write: uploads and updates are refused
+    # (two processes appending to one log, or saving into the same files, would lose rows)
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    mark("imports")
+    others = []
+    if process_index == 0:
+        spawn = multiprocessing.get_context("spawn")  # started before grpc, and not forked: grpc's threads do not survive a fork
+        for index in range(1, processes):
+            others.append(spawn.Process(target=serve, args=(io_threads, compute_workers, processes, index), name=f"grpc-server-{index}"))
+            others[-1].start()
+    if processes > 1:
+        registry.make_read_only()
+    compute_pool.start(compute_workers)
+    if MATERIALIZE:
+        materializer.start()  # insights are computed as data arrives, reads are served from the cache
+
+    def started(port):
+        logger.info("Started server on port %d (%s)", port, describe())
+        mark("port_open")
+        # the saved datasets are loaded in the background, /ready on the metrics port answers 200 once they are
+        warm_up(registry)
+        if process_index == 0 and METRICS and serve_metrics(METRICS_PORT, ready=lambda: readiness.ready):
+            logger.info("Serving metrics on port %d at /metrics, readiness at /ready", METRICS_PORT)
+
     try:
-        while True:
-            time.sleep(86400)  # Keep server alive for 1 day
+        if GRPC_ASYNC:
+            import aio_server  # (it imports this module, see the end of the file)
+            asyncio.run(aio_server.serve(io_threads, reuse_port=processes > 1, started=started))
+        else:
+            server, port = create_server(io_threads, reuse_port=processes > 1)
+            server.start()
+            started(port)
+            try:
+                while True:
+                    time.sleep(86400)  # Keep server alive for 1 day
+            except KeyboardInterrupt:
+                server.stop(0)
+                raise
     except KeyboardInterrupt:
-        print("Stopping server...")
-        server.stop(0)
+        logger.info("Stopping server...")
+    finally:
+        compute_pool.shutdown()
+        for process in others:
+            process.terminate()
+            process.join()
 
 if __name__ == '__main__':
-    serve()
-
+    # run from the imported module, so aio_server.py and the other server processes use the same one, not a copy of __main__
+    import server
+    server.serve()
@@ -1,15 +1,28 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from startup import mark, readiness, warm_up  # first, so the startup time is measured from (almost) the process start
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request
 from pydantic import BaseModel
-import pandas as pd
-import os
+import json
 import base64
 from io import BytesIO
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from datetime import datetime, timezone
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
 
+# When the app starts, the saved datasets are loaded in the background (see startup.py), GET /ready says when that is done
+@asynccontextmanager
+async def lifespan(app):
+    mark("app_started")
+    warm_up(registry)
+    yield
 
-app = FastAPI(title="CO2 Analytical insights AI service")
+
+app = FastAPI(title="CO2 Analytical insights AI service", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
@@ -19,13 +32,47 @@ app.add_middleware(
 )
 
 # Import the analytics function from the insights.py file
-from insights import CO2_emssion_pattern
+from insights import CO2_emssion_pattern, fleet_insights, fleet_scan, SCAN_TOP_DAYS, SCAN_TOP_FACILITIES
+# The datasets live in the registry shared with the gRPC server (nothing is loaded until a csv is uploaded)
+from dataset_store import entries_frame, entry_frame
+from dataset_registry import registry
+from insight_cache import insight_cache
+from materializer import MATERIALIZE, Materializer
+from window_index import date_range
+from metrics import CONTENT_TYPE, HTTP_SECONDS, METRICS, REGISTRY
+mark("imports")
+
+
+# Parsing, disk writes and model fitting block, so they run on a small pool of worker threads instead of the event loop,
+# this way one big upload or fit does not stall every other HTTP client___________
+WORKER_THREADS = 4        # blocking jobs running at the same time
+MAX_PENDING_JOBS = 32     # jobs running or waiting; above this new requests get a 503 instead of queueing up
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # uploads are copied to disk and parsed this many bytes at a time
+
+executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="co2-worker")
+pending_jobs = 0  # only changed from the event loop, so no lock is needed
+
+
+async def run_blocking(function, *args, **kwargs):
+    global pending_jobs
+    if pending_jobs >= MAX_PENDING_JOBS:
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly.")
+    pending_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(function, *args, **kwargs))
+    finally:
+        pending_jobs -= 1
+#___________________________
 
 
+# The chart data of /get_insights/ is computed as soon as a facility changes, so most requests are cache hits
+def materialized_insights(store, snapshot, facility_names):
+    results = fleet_insights(snapshot, facility_names)
+    return {("get_insights", name): result["chart_data"] for name, result in results.items() if result["chart_data"] is not None}
 
-#Initialize the csv as nothing___________
-data = pd.DataFrame()
-csv_path = None
+materializer = Materializer(registry, insight_cache, materialized_insights)
+if MATERIALIZE:
+    materializer.start()
 #___________________________
 
 
@@ -45,17 +92,25 @@ class GlobalInput(BaseModel):
 #___________________________
 
 
+# every endpoint takes ?dataset_id=<tenant> or <tenant>/<name> to work on a dataset of its own (see dataset_registry.py),
+# without it they use the default dataset
+def dataset(dataset_id):
+    try:
+        return registry.get(dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # endpoint to upload from frontend____________
 @app.post("/upload_csv/")
-async def upload_csv(file: UploadFile = File(...)):
-    global csv_path, data
-     
-    timestamp = datetime.now().astimezone().strftime("%Y-%m-%d_%H-%M-%S_%Z")
-    csv_path = f"./csv_dataset" #save file to local dir, using the same name to make sure that files replace one another and only one is saved each time
-    with open(csv_path, "wb") as f:
-        f.write(await file.read())
-
-    data = pd.read_csv(csv_path) #data is now the uploaded csv
+async def upload_csv(file: UploadFile = File(...), dataset_id: str = ""):
+    store = dataset(dataset_id)
+    csv_path = store.csv_path #save file to the dataset's dir, using the same name to make sure that files replace one another and only one is saved each time
+    chunks = iter(functools.partial(file.file.read, UPLOAD_CHUNK_BYTES), b"")
+    try:
+        await run_blocking(store.load_stream, chunks, csv_path) #data is now the uploaded csv, written and parsed chunk by chunk, then kept in memory
+    except ValueError as e: # an empty or unparsable csv
+        raise HTTPException(status_code=400, detail=f"Could not read the csv: {e}")
     """
     if "anomaly_flag" not in data.columns: #check if the anomaly_flag field even exists
         data["anomaly_flag"] = False
@@ -65,74 +120,91 @@ async def upload_csv(file: UploadFile = File(...)):
 #___________________________
 
 
-#we are setting the path and read the data, we call this function when getting insights
+#we read the data from the shared in-memory store, we call this function when getting insights
 
-def use_csv():
-    global csv_path, data
-    
-    csv_path = fr".\csv_dataset.csv"
-    if os.path.exists(csv_path):
-        data = pd.read_csv(csv_path)
-       # return {f"CSV data set to local path on server: {csv_path}"}
-    else:
-        return {"error": "CSV not found on server. Please check the file name."}
+async def use_csv(store):
+    # the first call after a restart (or after the dataset was unloaded) loads the saved dataset, on a worker thread
+    snapshot = store.snapshot() if store.loaded else await run_blocking(store.snapshot)
+    if not store.loaded:
+        raise HTTPException(status_code=400, detail="CSV path not set. Use /set_csv/ before anything.")
+    return snapshot
 
 #__________________________________
 
-# endpoint to a print a csv that exists the server___________
-    """
-    This is very slow right now, because a lot of rows need to be transformed or dropped
-    will try to find a bette way to do this.
-    """
+# endpoint to a print a csv that exists the server (only the dataset's own csv, 404 for any other name)___________
+# the rows are streamed as one JSON array, chunk by chunk, so the first rows go out right away
+# and the whole file is never turned into Python dicts at once
 @app.get("/get_csv/")
-async def get_csv(csv_name: str):
-    global csv_path, data
-    
-    csv_path = fr".\{csv_name}"
-    if os.path.exists(csv_path):
+async def get_csv(csv_name: str, dataset_id: str = ""):
+    chunks = await run_blocking(dataset(dataset_id).csv_chunks, csv_name)
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="CSV not found on server. Please check the file name.")
+
+    def json_array():
+        separator = "["
+        for chunk in chunks:
+            records = chunk.to_dict(orient="records")
+            if records:
+                yield separator + json.dumps(records)[1:-1]
+                separator = ","
+        yield "]" if separator == "," else "[]"
 
-        data = pd.read_csv(csv_path)
-        data = data.fillna("") 
-        return data.to_dict(orient="records")
-    else:
-        return {"error": "CSV not found on server. Please check the file name."}
+    return StreamingResponse(json_array(), media_type="application/json") # (a plain generator is run on a worker thread by starlette)
 
 #__________________________________
 
 # endpoint for updates
 @app.post("/update_csv/")
-async def update_csv(entry: GlobalInput):
-    global data, csv_path
-    if csv_path is None:
-        raise HTTPException(status_code=400, detail="CSV path not set. Use /set_csv/ before anythong.")
-
-    entry_dict = entry.dict()
-    entry_dict["anomaly_flag"] = any(value is None for value in entry_dict.values()) # Set the flag anomaly to True if any value is None
-    new_entry = pd.DataFrame([entry_dict])
-    data = pd.concat([data, new_entry], ignore_index=True) #append the pd df in memory
-    new_entry.to_csv(csv_path, mode="a", header=False, index=False) #append current CSV on disk
-
-    return {"status": "success", "message": f"Data added to {csv_path}", "anomaly_flag": entry_dict["anomaly_flag"]}
+async def update_csv(entry: GlobalInput, dataset_id: str = ""):
+    store = dataset(dataset_id)
+    await use_csv(store)
+
+    new_entry = entry_frame(entry.dict()) # Set the flag anomaly to True if any value is None
+    await run_blocking(store.append, new_entry) #append to the df in memory and to the dataset on disk
+
+    return {"status": "success", "message": f"Data added to {store.saved_to}", "anomaly_flag": bool(new_entry["anomaly_flag"].iloc[0])}
+#___________________________
+
+
+# endpoint for many updates at once (e.g. a gateway sending a batch of sensor readings), added in one step
+@app.post("/update_csv_batch/")
+async def update_csv_batch(entries: list[GlobalInput], dataset_id: str = ""):
+    store = dataset(dataset_id)
+    await use_csv(store)
+    if not entries:
+        return {"status": "success", "message": "Empty batch", "rows_added": 0, "anomalies": 0, "anomaly_flags": []}
+
+    rows = entries_frame([entry.dict() for entry in entries]) # the anomaly check runs on the whole batch at once
+    await run_blocking(store.append, rows)
+
+    flags = rows["anomaly_flag"].tolist()
+    return {"status": "success", "message": f"Data added to {store.saved_to}", "rows_added": len(rows), "anomalies": sum(flags), "anomaly_flags": flags}
 #___________________________
 
 
 # endpoint to get only the plot image
+# the latest month by default, or ?start=2024-01-01&end=2024-03-31 and/or ?window=7d (2w, 1m, quarter, 1y, ...) for other dates
 @app.get("/get_insights/")
-async def get_insights_plot(facility_name: str, scatter: bool = False):
-    use_csv()
-    global csv_path, data
-    if csv_path is None:
-        raise HTTPException(status_code=400, detail="CSV path not set. Use /set_csv/ before anything.")
-    
+async def get_insights_plot(facility_name: str, scatter: bool = False, start: str = "", end: str = "", window: str = "", dataset_id: str = ""):
+    data = await use_csv(dataset(dataset_id)) # snapshot of the in-memory dataset, with its per-facility index
     if data.empty:
         raise HTTPException(status_code=400, detail="No csv loaded. Use /set_csv/ before anything.")
+    dates = {"start": start, "end": end, "window": window} if start or end or window else {}
+    try:
+        date_range(**dates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Call the CO2_emssion_pattern. For now, only returning the plot. Might modify the response in future commits
    # model, graph = CO2_emssion_pattern(data, facility_name=facility_name, plot=True, scatter=scatter)
-    chart_data = CO2_emssion_pattern(data, facility_name=facility_name)
-
+    endpoint = f"get_insights@{start}|{end}|{window}" if dates else "get_insights" # every date range is cached apart
+    key = (dataset_id, endpoint, facility_name, data.facility_version(facility_name)) # same data, same result: reuse it
+    chart_data = insight_cache.get(key) # a cache hit is answered right away, only a miss needs a worker thread
     if chart_data is None:
-        raise HTTPException(status_code=404, detail=f"No data for {facility_name}.")
+        chart_data = await run_blocking(CO2_emssion_pattern, data, facility_name=facility_name, **dates)
+        if chart_data is None:
+            raise HTTPException(status_code=404, detail=f"No data for {facility_name}.")
+        insight_cache.put(key, chart_data)
     
     """
     Converting the img from the CO2_emssion_pattern() into b64, 
@@ -146,4 +218,65 @@ async def get_insights_plot(facility_name: str, scatter: bool = False):
     #plot_base64 = base64.b64encode(buf.getvalue()).decode("utf-8")
 
     return chart_data
-#___________________________
\ No newline at end of file
+#___________________________
+
+
+# endpoint to get the insights of many facilities at once, computed in one grouped pass over the data
+# use ?facility_names=A&facility_names=B for some facilities, or ?facility_names=all for every facility
+@app.get("/get_fleet_insights/")
+async def get_fleet_insights(facility_names: list[str] = Query(...), dataset_id: str = ""):
+    data = await use_csv(dataset(dataset_id))
+    if data.empty:
+        raise HTTPException(status_code=400, detail="No csv loaded. Use /set_csv/ before anything.")
+
+    facility_names = None if facility_names == ["all"] else list(dict.fromkeys(facility_names))
+    return await run_blocking(fleet_insights, data, facility_names) # facilities without usable data are left out
+#___________________________
+
+
+# endpoint for a health check of the whole fleet: capture inefficiencies and storage issues of every facility in every month,
+# found in one pass, with the worst facilities and days first. ?facility_names=A&facility_names=B to scan only some facilities
+@app.get("/fleet_scan/")
+async def scan_fleet(facility_names: list[str] | None = Query(None), top_facilities: int = SCAN_TOP_FACILITIES, top_days: int = SCAN_TOP_DAYS, dataset_id: str = ""):
+    data = await use_csv(dataset(dataset_id))
+    if data.empty:
+        raise HTTPException(status_code=400, detail="No csv loaded. Use /set_csv/ before anything.")
+
+    facility_names = list(dict.fromkeys(facility_names)) if facility_names else None
+    return await run_blocking(fleet_scan, data, facility_names, top_facilities=top_facilities, top_days=top_days)
+#___________________________
+
+
+# request durations for /metrics, by route (not by raw url, so ?facility_name=... does not make a new series per facility)
+if METRICS:
+    @app.middleware("http")
+    async def time_requests(request: Request, call_next):
+        started = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - started, path=route.path if route else "unmatched", status=response.status_code)
+        return response
+
+
+# endpoint for Prometheus: stage timings, request durations, rows processed, cache counters, dataset size and memory
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+#___________________________
+
+
+# endpoint for the readiness probe of the container: 503 while the saved datasets are loading, 200 once they are loaded
+# (requests sent before that still work, they just wait for the dataset)
+@app.get("/ready")
+async def ready():
+    if not readiness.ready:
+        return PlainTextResponse("starting", status_code=503)
+    return {"status": "ready", "startup_seconds": readiness.phases}
+#___________________________
+
+
+# endpoint to see how well the insight result cache is doing (hits, misses, evictions)
+@app.get("/cache_stats/")
+async def cache_stats():
+    return {**insight_cache.stats(), "materializer": materializer.stats(), "datasets": registry.stats()}
+#___________________________
@@ -0,0 +1,141 @@
+# Startup time and readiness of the servers
+# -------------------------------
+# A restarted or newly scaled container should open its port quickly and say when it can really answer: until the
+# saved dataset is loaded, the first insight request would have to wait for it.
+#   - server.py and service.py import this module first, so STARTED is (almost) the start of the process.
+#     readiness.mark() records how long each phase of the startup took (imports, port_open, ready), logs it and
+#     exports it as the co2_startup_seconds gauge; a phase over STARTUP_BUDGET_SECONDS is logged as a warning.
+#   - warm_up() loads the saved datasets (WARM_DATASETS, the default one unless configured) in the background once the
+#     port is open, then the process is ready: GET /ready answers 200 instead of 503 (on the FastAPI app, and on the
+#     metrics listener of the gRPC server), and the co2_ready gauge turns 1.
+#   - `python startup.py [server|service]` prints where the import time of a server goes (python -X importtime),
+#     to keep heavy libraries out of the startup path.
+
+import time
+
+STARTED = time.perf_counter()
+
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+from metrics import Gauge
+
+STARTUP_BUDGET_SECONDS = float(os.environ.get("CO2_STARTUP_BUDGET_SECONDS", "2"))  # per phase, slower ones are logged as warnings
+WARM_UP = os.environ.get("CO2_WARM_UP", "1") != "0"  # 0 = ready right away, datasets are loaded on first use
+WARM_DATASETS = [name.strip() for name in os.environ.get("CO2_WARM_DATASETS", "").split(",")]  # dataset ids, "" = the default one
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Startup phases of the process (seconds since STARTED) and whether it is ready to answer requests."""
+
+    def __init__(self):
+        self.phases = {}
+        self._ready = threading.Event()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def mark(self, phase):
+        seconds = self.phases[phase] = time.perf_counter() - STARTED
+        level = logging.WARNING if seconds > STARTUP_BUDGET_SECONDS else logging.INFO
+        logger.log(level, "Startup: %s after %.2fs (budget %.1fs)", phase, seconds, STARTUP_BUDGET_SECONDS)
+        return seconds
+
+    def set_ready(self):
+        if not self.ready:
+            self.mark("ready")
+            self._ready.set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+
+readiness = Readiness()
+
+Gauge("co2_ready", "1 once the saved datasets are loaded and the process answers without waiting for them",
+      function=lambda: int(readiness.ready))
+_phases = Gauge("co2_startup_seconds", "Seconds from the process start to each startup phase", ["phase"])
+
+
+def _record(phase):
+    _phases.set(readiness.phases[phase], phase=phase)
+
+
+def mark(phase):
+    """readiness.mark(phase), also exported as co2_startup_seconds{phase}."""
+    readiness.mark(phase)
+    _record(phase)
+
+
+def warm_up(registry, dataset_ids=None):
+    """Load the saved datasets `dataset_ids` (default WARM_DATASETS) on a background thread, then mark the process ready.
+
+    Datasets without saved files are skipped, so a fresh server is ready right away and waits for its first upload.
+    """
+    dataset_ids = WARM_DATASETS if dataset_ids is None else dataset_ids
+
+    def run():
+        for dataset_id in dataset_ids if WARM_UP else ():
+            try:
+                registry.get(dataset_id).snapshot()  # loads the dataset saved by a previous run, if there is one
+            except Exception:
+                logger.exception("Warm-up of dataset %r failed, it is loaded on its first use instead", dataset_id)
+        readiness.set_ready()
+        _record("ready")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_profile(module="server"):
+    """[(package, seconds)] of what `module` imports, from `python -X importtime -c "import module"`, slowest first.
+
+    Runs in a fresh interpreter, so nothing is imported yet. The time of a package includes everything it imports
+    itself, and a package is only counted where it is imported first (pandas is imported by insights, then only looked
+    up by the other modules). "(own)" is the time of the module's own code.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    packages, children = {}, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():  # the header line
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # nested imports are indented by two spaces a level
+        name = name.strip()
+        if depth == 1:
+            children.append((name.split(".")[0], int(cumulative) / 1e6))
+        elif depth == 0:  # imports are listed after what they import, so the children of `module` come right before it
+            if name == module:
+                for package, seconds in children:
+                    packages[package] = packages.get(package, 0.0) + seconds
+                packages["(own)"] = int(own) / 1e6
+            children = []
+    return sorted(packages.items(), key=lambda p: -p[1])
+
+
+def print_import_profile(module="server", top=20):
+    profile = import_profile(module)
+    total = sum(seconds for _, seconds in profile)
+    print(f"import {module}: {total:.3f}s (startup budget {STARTUP_BUDGET_SECONDS:.1f}s per phase)")
+    for name, seconds in profile[:top]:
+        print(f"{seconds:8.3f}s {100 * seconds / total if total else 0:5.1f}%  {name}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import time of a server module, slowest packages first")
+    parser.add_argument("module", nargs="?", default="server", help="module to import, e.g. server or service")
+    parser.add_argument("--top", type=int, default=20, help="packages to list")
+    args = parser.parse_args()
+    print_import_profile(args.module, args.top)
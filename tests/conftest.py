@@ -0,0 +1,70 @@
+# Shared fixtures of the tests
+# -------------------------------
+# The servers use the module-level registry of dataset_registry.py (with relative paths) and the shared insight cache.
+# Every test that talks to a server gets a registry of its own under tmp_path instead, and an empty cache, so nothing
+# leaks from one test into the next.
+
+import asyncio
+import queue
+import threading
+
+import grpc
+import pytest
+
+import aio_server
+import server
+from append_log import AppendLog
+from columnar_store import ColumnarStore, has_arrow
+from dataset_registry import DatasetRegistry
+from dataset_store import DatasetStore
+from insight_cache import insight_cache
+from protos import service_pb2_grpc
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """A registry of datasets under tmp_path, used by the servers instead of the module-level one."""
+    monkeypatch.chdir(tmp_path)
+    default = DatasetStore(str(tmp_path / "csv_dataset.csv"),
+                           columnar=ColumnarStore(str(tmp_path / "columns")) if has_arrow() else None,
+                           log=AppendLog(str(tmp_path / "log")))
+    datasets = DatasetRegistry(root=str(tmp_path / "datasets"), default=default)
+    datasets.add_listener(insight_cache.on_dataset_change)
+    monkeypatch.setattr(server, "registry", datasets)
+    insight_cache.clear()  # keys are (dataset_id, endpoint, facility, version): versions start again in every registry
+    yield datasets
+    insight_cache.clear()
+
+
+@pytest.fixture
+def stub(registry):
+    """A client of the threaded gRPC server of server.py, running in this process on a free local port."""
+    grpc_server, port = server.create_server(io_threads=4, address="127.0.0.1:0", reuse_port=False)
+    grpc_server.start()
+    channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+    yield service_pb2_grpc.CO2AnalyticsServiceStub(channel)
+    channel.close()
+    grpc_server.stop(0)
+
+
+@pytest.fixture
+def aio_stub(registry):
+    """A client of the asyncio gRPC server of aio_server.py, running on the event loop of a thread of its own."""
+    loop = asyncio.new_event_loop()
+    ports = queue.Queue()
+    task = loop.create_task(aio_server.serve(io_threads=4, address="127.0.0.1:0", reuse_port=False, started=ports.put))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    channel = grpc.insecure_channel(f"127.0.0.1:{ports.get(timeout=30)}")
+    yield service_pb2_grpc.CO2AnalyticsServiceStub(channel)
+    channel.close()
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join()
+    loop.close()
@@ -0,0 +1,67 @@
+# Checks of the asyncio gRPC server of aio_server.py: the same answers as the threaded server of server.py
+# -------------------------------
+#
+#   python -m pytest -q tests
+
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+import pytest
+
+from metrics import RPC_SECONDS
+from protos import service_pb2
+from tests.test_server import entry, fleet_csv
+
+
+def rpc_count(method, code):
+    # requests of `method` answered with `code`, as counted by the metrics interceptor
+    return sum(value for name, _, labels, value in RPC_SECONDS.samples()
+               if name.endswith("_count") and labels == (method, code))
+
+
+def test_uploads(aio_stub):
+    assert aio_stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv())).status == "success"
+    content = fleet_csv()
+    chunks = [service_pb2.UploadCSVChunk(data=content[i:i + 65536], dataset_id="other") for i in range(0, len(content), 65536)]
+    response = aio_stub.UploadCSVStream(iter(chunks))
+    assert response.status == "success"
+    assert response.rows == content.count(b"\n") - 1
+    assert response.bytes_received == len(content)
+
+
+def test_unreadable_csv_is_an_invalid_argument(aio_stub):
+    rejected = rpc_count("UploadCSV", "INVALID_ARGUMENT")
+    with pytest.raises(grpc.RpcError) as error:
+        aio_stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=b""))
+    assert error.value.code() == grpc.StatusCode.INVALID_ARGUMENT
+    assert "Could not read the csv" in error.value.details()
+    assert rpc_count("UploadCSV", "INVALID_ARGUMENT") == rejected + 1
+
+
+def test_same_answers_as_the_threaded_server(aio_stub, stub):
+    aio_stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv()))
+    update = aio_stub.UpdateCSV(entry("2024-03-01", "Facility 1", emitted=140.0))
+    assert update.status == "success" and not update.anomaly_flag
+
+    for compact in (False, True):
+        request = service_pb2.GetInsightsRequest(facility_name="Facility 1", compact=compact)
+        assert aio_stub.GetInsightsPlot(request) == stub.GetInsightsPlot(request)
+        assert aio_stub.GetInsightsPlot(request) == stub.GetInsightsPlot(request)  # from the cache
+    request = service_pb2.GetFleetInsightsRequest(all_facilities=True, compact=True)
+    streamed = list(aio_stub.StreamFleetInsights(request))
+    assert len(streamed) > 1 and streamed == list(stub.StreamFleetInsights(request))
+    request = service_pb2.GetCSVRequest()
+    assert list(aio_stub.StreamCSV(request)) == list(stub.StreamCSV(request))
+
+
+def test_concurrent_misses_share_one_computation(aio_stub):
+    aio_stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv()))
+    request = service_pb2.GetCaptureEfficiencyDataRequest(facility_name="Facility 2")
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(lambda _: aio_stub.GetCaptureEfficiencyData(request), range(16)))
+    assert all(response == responses[0] for response in responses)
+    assert responses[0].capture_data.labels
+
+    with pytest.raises(grpc.RpcError) as error:
+        aio_stub.GetCaptureEfficiencyData(service_pb2.GetCaptureEfficiencyDataRequest(facility_name="Nowhere"))
+    assert error.value.code() == grpc.StatusCode.INVALID_ARGUMENT
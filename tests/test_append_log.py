@@ -0,0 +1,221 @@
+# Checks of the append log (append_log.py) and of the dataset store's recovery from it
+# -------------------------------
+# Appended rows are only in the log until the store merges them into the dataset files. These tests restart the store
+# (a new DatasetStore on the same files, like a new server process) at different points and check that every
+# acknowledged row comes back, that nothing is replayed twice, and that rows the store rejects never reach the log.
+#
+#   python -m pytest -q tests
+
+import os
+
+import pandas as pd
+import pytest
+
+import append_log
+import dataset_store
+from append_log import AppendLog
+from columnar_store import ColumnarStore, has_arrow
+from dataset_store import DatasetStore, entries_frame, to_csv_frame
+from tests.test_ridge import fleet, reading
+
+STORAGE = ["csv", "columnar"]  # where the store saves merged rows
+
+
+def open_store(tmp_path, storage):
+    # a store on the files in tmp_path, as a newly started server would open them
+    if storage == "columnar" and not has_arrow():
+        pytest.skip("pyarrow is not installed")
+    columnar = ColumnarStore(str(tmp_path / "columns")) if storage == "columnar" else None
+    store = DatasetStore(str(tmp_path / "fleet.csv"), columnar=columnar, log=AppendLog(str(tmp_path / "log")))
+    if columnar is None:
+        store.columnar = None
+    return store
+
+
+def loaded_store(tmp_path, storage):
+    fleet().to_csv(tmp_path / "fleet.csv", index=False)
+    store = open_store(tmp_path, storage)
+    store.load_csv()
+    return store
+
+
+def assert_same_dataset(store, restarted):
+    live, again = store.snapshot(), restarted.snapshot()
+    assert again.rows == live.rows
+    assert again.log_seq == live.log_seq
+    pd.testing.assert_frame_equal(to_csv_frame(again.frame), to_csv_frame(live.frame))
+    assert {name: len(positions) for name, positions in again.facility_index.items()} == \
+           {name: len(positions) for name, positions in live.facility_index.items()}
+
+
+def appended_rows(i, count=1):
+    return entries_frame([reading(f"2024-03-{1 + (i + j) % 28:02d}", f"Facility {(i + j) % 3}", 100.0 + i, 80.0, 70.0, 80.0)
+                          for j in range(count)])
+
+
+@pytest.mark.parametrize("storage", STORAGE)
+def test_restart_replays_appended_rows(tmp_path, storage):
+    store = loaded_store(tmp_path, storage)
+    for i in range(5):
+        store.append(appended_rows(i))
+    store.append(appended_rows(5, count=100))
+    assert store.log.saved_seq() == 0  # nothing merged yet: every appended row is only in the log
+    assert_same_dataset(store, open_store(tmp_path, storage))
+
+
+@pytest.mark.parametrize("storage", STORAGE)
+def test_restart_after_merges(tmp_path, storage, monkeypatch):
+    monkeypatch.setattr(dataset_store, "MERGE_ROWS", 50)
+    monkeypatch.setattr(dataset_store, "MERGE_FRACTION", 1000)
+    store = loaded_store(tmp_path, storage)
+    for i, count in enumerate([1, 3, 80, 1, 60, 2, 1]):
+        store.append(appended_rows(i, count))
+        store.snapshot().frame  # a reader merging the appended chunks in memory must not keep them from being saved
+    assert 0 < store.log.saved_seq() < store.snapshot().log_seq
+    restarted = open_store(tmp_path, storage)
+    assert_same_dataset(store, restarted)
+    assert_same_dataset(store, open_store(tmp_path, storage))  # the first restart replayed the log into the files, not twice
+
+
+def test_rejected_rows_are_not_logged(tmp_path):
+    store = loaded_store(tmp_path, "csv")
+    store.append(appended_rows(0))
+    with pytest.raises(KeyError):
+        store.append(appended_rows(1).drop(columns=["date"]))
+    assert [seq for seq, _ in store.log.replay()] == [1]
+    assert_same_dataset(store, open_store(tmp_path, "csv"))
+
+
+def test_half_written_batch_is_ignored(tmp_path):
+    log = AppendLog(str(tmp_path / "log"))
+    for i in range(3):
+        log.wait(log.write(appended_rows(i)))
+    segment = sorted(os.listdir(tmp_path / "log"))[0]
+    with open(tmp_path / "log" / segment, "a") as f:
+        f.write('{"seq": 4, "rows": {"date": ["2024-')  # a crash in the middle of a flush
+
+    restarted = AppendLog(str(tmp_path / "log"))
+    assert [seq for seq, _ in restarted.replay()] == [1, 2, 3]
+    assert restarted.current_seq() == 3
+    pd.testing.assert_frame_equal(restarted.replay(2)[0][1], appended_rows(2), check_dtype=False)
+
+
+def test_checkpoint_drops_saved_batches(tmp_path):
+    log = AppendLog(str(tmp_path / "log"))
+    for i in range(3):
+        log.write(appended_rows(i))
+    log.checkpoint(3)
+    log.wait(log.write(appended_rows(3)))
+
+    restarted = AppendLog(str(tmp_path / "log"))
+    assert restarted.saved_seq() == 3
+    assert [seq for seq, _ in restarted.replay(restarted.saved_seq())] == [4]
+    assert restarted.write(appended_rows(4)) == 5  # numbering goes on after the saved batches
+
+
+def test_failed_flush_raises(tmp_path, monkeypatch):
+    def full_disk(fd):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(append_log.os, "fsync", full_disk)
+    log = AppendLog(str(tmp_path / "log"))
+    seq = log.write(appended_rows(0))
+    with pytest.raises(OSError, match="could not be written"):
+        log.wait(seq)
+    with pytest.raises(OSError, match="could not be written"):
+        log.write(appended_rows(1))
+
+
+@pytest.mark.parametrize("storage", STORAGE)
+def test_read_only_store_never_writes(tmp_path, storage):
+    # a second server process on the same files (CO2_GRPC_PROCESSES > 1): it must not save or checkpoint the batches
+    # the first one logged, nor log batches of its own under the same sequence numbers
+    store = loaded_store(tmp_path, storage)
+    for i in range(3):
+        store.append(appended_rows(i))
+    saved = {name: os.path.getmtime(os.path.join(root, name)) for root, _, names in os.walk(tmp_path) for name in names}
+
+    other = open_store(tmp_path, storage)
+    other.read_only = True
+    assert other.snapshot().rows == store.snapshot().rows  # the logged rows are replayed, in memory only
+    with pytest.raises(PermissionError):
+        other.append(appended_rows(3))
+    with pytest.raises(PermissionError):
+        other.load_csv()
+    assert {name: os.path.getmtime(os.path.join(root, name)) for root, _, names in os.walk(tmp_path) for name in names} == saved
+
+    store.append(appended_rows(3))
+    assert_same_dataset(store, open_store(tmp_path, storage))
+
+
+def test_replay_only_reads_new_batches(tmp_path, monkeypatch):
+    log = AppendLog(str(tmp_path / "log"))
+    for i in range(5):
+        log.wait(log.write(appended_rows(i)))
+    reader = AppendLog(str(tmp_path / "log"))
+    assert [seq for seq, _ in reader.replay(2)] == [3, 4, 5]
+    log.wait(log.write(appended_rows(5)))
+
+    parsed = []
+    loads = append_log.json.loads
+    monkeypatch.setattr(append_log.json, "loads", lambda line: parsed.append(line) or loads(line))
+    assert [seq for seq, _ in reader.replay(5)] == [6]
+    assert len(parsed) == 1
+    assert [seq for seq, _ in reader.replay(1)] == [2, 3, 4, 5, 6]  # an older start reads the segment again
+
+
+def test_replay_skips_saved_segments(tmp_path, monkeypatch):
+    log = AppendLog(str(tmp_path / "log"))
+    for i in range(3):
+        log.wait(log.write(appended_rows(i)))
+    log.checkpoint(2)  # closes the segment: the next batches go to a new one
+    for i in range(3, 5):
+        log.wait(log.write(appended_rows(i)))
+
+    opened = []
+    monkeypatch.setattr(append_log, "open", lambda path, *args: opened.append(path) or open(path, *args), raising=False)
+    assert [seq for seq, _ in AppendLog(str(tmp_path / "log")).replay(3)] == [4, 5]
+    assert opened == [str(tmp_path / "log" / "segment-000000000004.log")]
+
+
+@pytest.mark.parametrize("storage", STORAGE)
+def test_catch_up_follows_the_writer(tmp_path, storage, monkeypatch):
+    # the read-only copy of a compute worker (compute_pool.py) adds the batches the main process logged since its copy
+    monkeypatch.setattr(dataset_store, "MERGE_ROWS", 50)
+    monkeypatch.setattr(dataset_store, "MERGE_FRACTION", 1000)
+    store = loaded_store(tmp_path, storage)
+    store.append(appended_rows(0))
+    worker = open_store(tmp_path, storage)
+    worker.reload()
+
+    for i, count in enumerate([1, 3, 5], start=1):
+        store.append(appended_rows(i, count))
+        snapshot = store.snapshot()
+        assert worker.catch_up(snapshot.log_seq).log_seq == snapshot.log_seq
+        assert_same_dataset(store, worker)
+
+    store.append(appended_rows(4, count=80))  # merged into the files: the batches are not in the log anymore
+    assert store.log.saved_seq() == store.snapshot().log_seq
+    assert worker.catch_up(store.snapshot().log_seq) is None
+    worker.reload()
+    assert_same_dataset(store, worker)
+
+
+@pytest.mark.parametrize("storage", STORAGE)
+def test_anomaly_flags_are_saved(tmp_path, storage, monkeypatch):
+    monkeypatch.setattr(dataset_store, "MERGE_ROWS", 3)
+    monkeypatch.setattr(dataset_store, "MERGE_FRACTION", 1000)
+    store = loaded_store(tmp_path, storage)  # a csv without an anomaly_flag column
+    base_rows = store.snapshot().rows
+    store.append(entries_frame([reading("2024-03-01", "Facility 1", emitted=None)]))  # only in the log
+    replayed = open_store(tmp_path, storage)
+    replayed.read_only = True  # (a second writer on the same files would save the logged rows again)
+    for restarted in (replayed, store):
+        flags = restarted.snapshot().frame["anomaly_flag"]
+        assert flags.dtype == bool and flags.tolist() == [False] * base_rows + [True]
+    store.append(appended_rows(1, count=3))  # merged and saved into the files
+    assert store.log.saved_seq() == 2
+
+    restarted = open_store(tmp_path, storage)
+    assert restarted.snapshot().frame["anomaly_flag"].tolist() == [False] * base_rows + [True, False, False, False]
+    assert_same_dataset(store, restarted)
@@ -0,0 +1,64 @@
+# Checks of the Arrow files of columnar_store.py
+# -------------------------------
+#
+#   python -m pytest -q tests
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.generate_data import generate_fleet
+from columnar_store import ColumnarStore, has_arrow
+from dataset_schema import compact_frame
+from dataset_store import entries_frame, to_csv_frame
+from tests.test_ridge import reading
+
+pytestmark = pytest.mark.skipif(not has_arrow(), reason="pyarrow is not installed")
+
+
+def base_frame():
+    return compact_frame(generate_fleet(200, 3, days=30))
+
+
+def test_base_and_deltas_read_back(tmp_path):
+    columns = ColumnarStore(str(tmp_path / "columns"))
+    base = base_frame()
+    columns.write_base(base, log_seq=4)
+    columns.append(compact_frame(entries_frame([reading("2024-03-01", "Facility 1")])), None, log_seq=5)
+    columns.append(compact_frame(entries_frame([reading("2024-03-02", "New facility", emitted=1234.5678)])), None, log_seq=7)
+
+    again = ColumnarStore(str(tmp_path / "columns"))
+    frame = again.read()
+    assert again.log_seq == 7
+    assert len(frame) == len(base) + 2
+    pd.testing.assert_frame_equal(to_csv_frame(frame.iloc[:len(base)]), to_csv_frame(base))
+    assert list(frame["facility_name"].iloc[-2:]) == ["Facility 1", "New facility"]  # a new category in a delta
+    assert frame["co2_emitted_tonnes"].iloc[-1] == 1234.5678  # too precise for the base's float32: widened, not rounded
+    assert frame["date"].dtype == base["date"].dtype
+
+
+def test_read_selected_columns(tmp_path):
+    columns = ColumnarStore(str(tmp_path / "columns"))
+    base = base_frame()
+    columns.write_base(base)
+    columns.append(compact_frame(entries_frame([reading("2024-03-01", "Facility 1", emitted=90.5)])), None)
+    frame = columns.read(["facility_name", "co2_emitted_tonnes", "not a column"])
+    assert list(frame.columns) == ["facility_name", "co2_emitted_tonnes"]
+    assert frame["co2_emitted_tonnes"].iloc[-1] == 90.5
+    np.testing.assert_array_equal(frame["co2_emitted_tonnes"].iloc[:len(base)], base["co2_emitted_tonnes"])
+
+
+def test_deltas_are_compacted(tmp_path):
+    columns = ColumnarStore(str(tmp_path / "columns"), compact_every=3)
+    frame = base_frame()
+    columns.write_base(frame)
+    for i in range(3):
+        rows = compact_frame(entries_frame([reading(f"2024-03-0{i + 1}", "Facility 1")]))
+        frame = pd.concat([frame, rows], ignore_index=True)
+        columns.append(rows, lambda: frame, log_seq=i + 1)
+    assert sorted(os.listdir(tmp_path / "columns")) == ["base.arrow"]  # the third delta was merged into the base
+    again = ColumnarStore(str(tmp_path / "columns"))
+    assert len(again.read()) == len(frame)
+    assert again.log_seq == 3
@@ -0,0 +1,64 @@
+# Checks of the registry of named datasets (dataset_registry.py) and of its memory budgets
+# -------------------------------
+#
+#   python -m pytest -q tests
+
+import os
+
+import pytest
+
+from benchmarks.generate_data import generate_fleet
+from dataset_registry import DatasetRegistry
+from tests.test_append_log import appended_rows
+
+
+def fleet_csv(facilities):
+    return generate_fleet(facilities * 30, facilities, days=30).to_csv(index=False).encode()
+
+
+def loaded(registry, dataset_id, facilities=3):
+    store = registry.get(dataset_id)
+    store.load_stream([fleet_csv(facilities)])
+    return store
+
+
+def test_datasets_are_kept_apart(tmp_path):
+    registry = DatasetRegistry(root=str(tmp_path))
+    loaded(registry, "acme/north", facilities=2)
+    loaded(registry, "acme/south", facilities=5)
+    assert len(registry.get("acme/north").snapshot().facility_index) == 2
+    assert len(registry.get("acme/south").snapshot().facility_index) == 5
+    assert os.path.exists(tmp_path / "acme" / "north" / "csv_dataset.csv")
+    assert registry.get("acme/north") is registry.get("acme/north")
+    for dataset_id in ["../acme", "acme/north/old", "acme/..", "/acme", "acme north"]:
+        with pytest.raises(ValueError):
+            registry.get(dataset_id)
+
+
+def test_least_recently_used_datasets_are_unloaded(tmp_path):
+    registry = DatasetRegistry(root=str(tmp_path))
+    first = loaded(registry, "a")
+    size = registry.stats()["memory_bytes"]
+    registry.memory_budget = int(2.5 * size)  # room for two of them
+    first.append(appended_rows(0, count=5))  # only in the append log
+    rows = first.snapshot().rows
+    loaded(registry, "b")
+    registry.get("a")  # used: now "b" is the least recently used
+    loaded(registry, "c")
+    assert registry.loaded_datasets() == ["a", "c"]
+    assert registry.stats()["evictions"] == 1
+    assert not registry.get("b").loaded
+
+    loaded(registry, "d")
+    assert registry.loaded_datasets() == ["c", "d"]
+    assert registry.get("a").snapshot().rows == rows  # read again from its files and its append log
+    assert registry.loaded_datasets() == ["d", "a"]
+
+
+def test_tenant_budget(tmp_path):
+    registry = DatasetRegistry(root=str(tmp_path))
+    loaded(registry, "acme/one")
+    registry.tenant_budget = int(1.5 * registry.stats()["memory_bytes"])  # room for one dataset per tenant
+    loaded(registry, "other")
+    loaded(registry, "acme/two")
+    assert registry.loaded_datasets() == ["other", "acme/two"]
@@ -0,0 +1,57 @@
+# Checks of the compact column types (dataset_schema.py) and that they never change the numbers of the dataset
+# -------------------------------
+#
+#   python -m pytest -q tests
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_store
+from benchmarks.generate_data import generate_fleet
+from dataset_schema import ColumnTypes, compact_frame, concat_frames, expand_frame
+from dataset_store import entries_frame, to_csv_frame
+from tests.test_append_log import STORAGE, open_store
+from tests.test_ridge import reading
+
+
+def test_appended_values_keep_the_column_types():
+    types = ColumnTypes(compact_frame(pd.DataFrame({"facility_name": ["A", "B"], "co2_emitted_tonnes": [1.5, 2.25]})))
+    columns = types.columns(pd.DataFrame({"facility_name": ["B", "C", None], "co2_emitted_tonnes": [3.5, None, "x"]}))
+    assert columns["co2_emitted_tonnes"].dtype == np.float32
+    assert np.isnan(columns["co2_emitted_tonnes"][1:]).all()  # missing, and text that is not a number
+    assert list(columns["facility_name"].categories) == ["A", "B", "C"]
+    assert list(columns["facility_name"].codes) == [1, 2, -1]
+
+
+def test_values_with_more_digits_widen_the_column():
+    frame = compact_frame(pd.DataFrame({"co2_emitted_tonnes": [54.57, 86.32]}))
+    types = ColumnTypes(frame)
+    assert frame["co2_emitted_tonnes"].dtype == np.float32
+    appended = types.columns(pd.DataFrame({"co2_emitted_tonnes": [1234.5678, 987.654321]}))["co2_emitted_tonnes"]
+    assert appended.dtype == np.float64
+    assert appended.tolist() == [1234.5678, 987.654321]
+    assert types.columns(pd.DataFrame({"co2_emitted_tonnes": [1.5]}))["co2_emitted_tonnes"].dtype == np.float64  # from then on
+
+    merged = concat_frames([frame, pd.DataFrame({"co2_emitted_tonnes": appended})], ignore_index=True)
+    assert merged["co2_emitted_tonnes"].tolist() == [54.57, 86.32, 1234.5678, 987.654321]  # not 54.56999969482422
+
+
+@pytest.mark.parametrize("storage", STORAGE)
+def test_appended_values_are_saved_unrounded(tmp_path, storage, monkeypatch):
+    monkeypatch.setattr(dataset_store, "MERGE_ROWS", 2)
+    monkeypatch.setattr(dataset_store, "MERGE_FRACTION", 1000)
+    generate_fleet(300, 3, days=40).to_csv(tmp_path / "fleet.csv", index=False)  # every value with 2 decimals: float32
+    store = open_store(tmp_path, storage)
+    store.load_csv()
+    assert store.snapshot().frame["co2_emitted_tonnes"].dtype == np.float32
+    first = expand_frame(store.snapshot().frame)["co2_emitted_tonnes"].iloc[:5].tolist()
+    store.append(entries_frame([reading("2024-03-01", "Facility 1", emitted=1234.5678, captured=987.654321)]))
+    store.append(entries_frame([reading("2024-03-02", "Facility 1", emitted=100.25)]))
+    assert store.log.saved_seq() == 2  # merged and saved into the files
+
+    for dataset in (store, open_store(tmp_path, storage)):
+        frame = to_csv_frame(dataset.snapshot().frame)
+        assert frame["co2_emitted_tonnes"].iloc[-2:].tolist() == [1234.5678, 100.25]
+        assert frame["co2_captured_tonnes"].iloc[-2] == 987.654321
+        assert frame["co2_emitted_tonnes"].iloc[:5].tolist() == first
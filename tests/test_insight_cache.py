@@ -0,0 +1,59 @@
+# Checks of the insight result cache (insight_cache.py)
+# -------------------------------
+#
+#   python -m pytest -q tests
+
+import insight_cache
+from insight_cache import InsightCache
+from protos import service_pb2
+from tests.test_server import entry, fleet_csv
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = InsightCache(max_entries=2)
+    cache.put(("default", "plot", "A", 1), "a")
+    cache.put(("default", "plot", "B", 1), "b")
+    assert cache.get(("default", "plot", "A", 1)) == "a"  # now B is the least recently used
+    cache.put(("default", "plot", "C", 1), "c")
+    assert cache.get(("default", "plot", "B", 1)) is None
+    assert cache.get(("default", "plot", "A", 1)) == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_recomputed(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(insight_cache.time, "monotonic", lambda: now[0])
+    cache = InsightCache(ttl=10)
+    cache.put(("default", "plot", "A", 1), "a")
+    now[0] += 9
+    assert cache.get(("default", "plot", "A", 1)) == "a"
+    now[0] += 2
+    assert cache.get(("default", "plot", "A", 1)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_updates_leave_the_cache_alone():
+    # the facility version in the keys already keeps old results from being served: an update does not look for them
+    cache = InsightCache()
+    for i in range(100):
+        cache.put(("default", "plot", f"Facility {i}", 1), i)
+    cache.put(("other", "plot", "Facility 1", 1), "other")
+    cache.on_dataset_change("default", None, ["Facility 1", "Facility 2"])
+    assert cache.stats()["entries"] == 101
+    cache.on_dataset_change("default", None, None)  # a new csv
+    assert cache.stats()["entries"] == 1
+    assert cache.get(("other", "plot", "Facility 1", 1)) == "other"
+
+
+def test_updated_facility_is_never_served_from_the_cache(stub, registry):
+    stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv()))
+    request = service_pb2.GetInsightsRequest(facility_name="Facility 1")
+    first = stub.GetInsightsPlot(request).chart_data
+    assert stub.GetInsightsPlot(request).chart_data == first  # from the cache
+    hits = insight_cache.insight_cache.hits
+
+    stub.UpdateCSV(entry("2024-03-01", "Facility 1", emitted=140.0))
+    chart = stub.GetInsightsPlot(request).chart_data
+    assert chart.labels[-1] == "2024-03-01"
+    assert insight_cache.insight_cache.hits == hits  # computed again, for the new facility version
+    assert stub.GetInsightsPlot(service_pb2.GetInsightsRequest(facility_name="Facility 2")).chart_data.labels
@@ -0,0 +1,61 @@
+# Checks of the insights computed as data arrives (materializer.py)
+# -------------------------------
+#
+#   python -m pytest -q tests
+
+import time
+
+from dataset_registry import DatasetRegistry
+from dataset_store import entries_frame
+from insight_cache import InsightCache, insight_cache
+from materializer import Materializer
+from protos import service_pb2
+from server import materialized_responses
+from tests.test_dataset_registry import loaded
+from tests.test_ridge import reading
+from tests.test_server import entry, fleet_csv
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_bursts_of_changes_are_computed_once(tmp_path):
+    runs = []
+    registry = DatasetRegistry(root=str(tmp_path))
+    materializer = Materializer(registry, InsightCache(), lambda store, snapshot, names: runs.append(sorted(names)) or {},
+                                debounce_ms=100)
+    materializer.start()
+    store = loaded(registry, "acme", facilities=3)
+    wait_for(lambda: materializer.runs == 1)
+    assert runs == [["Facility 0", "Facility 1", "Facility 2"]]  # a new dataset: every facility
+
+    for facility_name in ["Facility 2", "Facility 0", "Facility 2"]:
+        store.append(entries_frame([reading("2024-03-01", facility_name)]))
+    wait_for(lambda: materializer.runs == 2)
+    assert runs[1] == ["Facility 0", "Facility 2"]
+    time.sleep(0.3)
+    assert materializer.runs == 2
+
+
+def test_reads_are_answered_with_the_materialized_results(stub, registry):
+    materializer = Materializer(registry, insight_cache, materialized_responses, debounce_ms=0)
+    materializer.start()
+    stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv()))
+    stub.UpdateCSV(entry("2024-03-01", "Facility 1", emitted=140.0))
+    wait_for(lambda: materializer.facilities_materialized >= len(registry.get("").snapshot().facility_index) + 1)
+
+    requests = [service_pb2.GetInsightsRequest(facility_name="Facility 1"),
+                service_pb2.GetInsightsRequest(facility_name="Facility 1", compact=True)]
+    misses = insight_cache.misses
+    materialized = [stub.GetInsightsPlot(request) for request in requests]
+    capture = stub.GetCaptureEfficiencyData(service_pb2.GetCaptureEfficiencyDataRequest(facility_name="Facility 2"))
+    assert insight_cache.misses == misses  # every read was a cache hit
+    assert materialized[0].chart_data.labels[-1] == "2024-03-01"
+
+    insight_cache.clear()  # computed on read instead: the same answers
+    assert [stub.GetInsightsPlot(request) for request in requests] == materialized
+    assert stub.GetCaptureEfficiencyData(service_pb2.GetCaptureEfficiencyDataRequest(facility_name="Facility 2")) == capture
@@ -0,0 +1,118 @@
+# Checks of the closed-form ridge regression in insights.py against scikit-learn's Ridge
+# -------------------------------
+# The insight functions fit Ridge(alpha=1.0) from grouped sums instead of calling scikit-learn (see sufficient_stats and
+# ridge_from_stats), and the dataset store keeps those sums up to date as rows are appended. These tests fit the same
+# models with scikit-learn and compare, on a generated fleet with the awkward cases added: columns that never change,
+# and facilities with only one or two rows in their latest month.
+#
+#   python -m pytest -q tests
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import Ridge
+
+from append_log import AppendLog
+from benchmarks.generate_data import generate_fleet
+from columnar_store import ColumnarStore, has_arrow
+from dataset_store import DatasetStore, entries_frame
+from insights import MODELS, RIDGE_ALPHA, fleet_insights, ridge_from_stats, sufficient_stats
+
+# the outputs of fleet_insights (compact form) with their predictions
+PREDICTIONS = {"chart_data": ("emission", "predicted_values"), "capture_data": ("capture", "predicted_values"),
+               "storage_data": ("storage", "predicted_stored_co2")}
+
+
+def sklearn_fit(x, y):
+    model = Ridge(alpha=RIDGE_ALPHA).fit(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return model.coef_, model.intercept_
+
+
+def reading(date, facility_name, emitted=100.0, captured=80.0, stored=75.0, efficiency=80.0, integrity=98.0):
+    return {"date": date, "facility_id": facility_name, "facility_name": facility_name, "country": "NO", "region": "EU",
+            "storage_site_type": "saline", "co2_emitted_tonnes": emitted, "co2_captured_tonnes": captured,
+            "co2_stored_tonnes": stored, "capture_efficiency_percent": efficiency, "storage_integrity_percent": integrity}
+
+
+def fleet():
+    # a generated fleet (with some missing values) plus facilities made for the edge cases
+    rng = np.random.default_rng(5)
+    days = pd.date_range("2024-02-01", "2024-02-20").strftime("%Y-%m-%d")
+    extra = [reading("2024-02-10", "Single row", 120.0, 90.0, 85.0, 75.0),
+             reading("2024-02-03", "Two rows", 110.0, 90.0, 80.0, 81.8),
+             reading("2024-02-04", "Two rows", 130.0, 95.0, 91.0, 73.1),
+             reading("2024-01-15", "Two rows", 999.0, 1.0, 1.0, 1.0)]  # an older month, not part of the fit
+    extra += [reading(day, "Constant input", 100.0, float(rng.uniform(60, 90)), float(rng.uniform(50, 60)),
+                      float(rng.uniform(60, 90))) for day in days]
+    extra += [reading(day, "Constant everything") for day in days]
+    extra += [reading(day, "Constant target", float(rng.uniform(50, 150)), 80.0, float(rng.uniform(50, 80)), 80.0)
+              for day in days]
+    return pd.concat([generate_fleet(2000, 8, days=60, start_date="2024-01-01"), pd.DataFrame(extra)], ignore_index=True)
+
+
+def latest_month_rows(frame, facility_name, model):
+    # the rows a model of the latest month is fitted on, as in insights.latest_month_frame
+    _, _, subset = MODELS[model]
+    rows = frame[frame["facility_name"] == facility_name].dropna(subset=subset)
+    months = pd.to_datetime(rows["date"]).dt.to_period("M")
+    return rows[months == months.max()]
+
+
+@pytest.mark.parametrize("inputs", [1, 2])
+def test_ridge_from_stats_matches_sklearn(inputs):
+    rng = np.random.default_rng(inputs)
+    sizes = [1, 2, 3, 10, 50, 7]
+    groups = np.repeat(np.arange(len(sizes)), sizes)
+    x = rng.uniform(0, 200, size=(len(groups), inputs))
+    y = x @ rng.uniform(-2, 2, size=inputs) + rng.normal(0, 5, size=len(groups))
+    x[groups == 4, 0] = 42.0  # a constant input
+    y[groups == 5] = 3.0      # a constant target
+    coef, intercept = ridge_from_stats(sufficient_stats(x, y, groups, len(sizes)))
+    for group in range(len(sizes)):
+        expected_coef, expected_intercept = sklearn_fit(x[groups == group], y[groups == group])
+        np.testing.assert_allclose(coef[group], expected_coef, rtol=1e-7, atol=1e-9)
+        np.testing.assert_allclose(intercept[group], expected_intercept, rtol=1e-7, atol=1e-7)
+
+
+def test_fleet_insights_matches_sklearn():
+    frame = fleet()
+    results = fleet_insights(frame, compact=True)
+    assert set(results) == set(frame["facility_name"])
+    for facility_name, outputs in results.items():
+        for output, (model, key) in PREDICTIONS.items():
+            inputs, target, _ = MODELS[model]
+            rows = latest_month_rows(frame, facility_name, model)
+            coef, intercept = sklearn_fit(rows[inputs], rows[target])
+            expected = rows[inputs].to_numpy(dtype=float) @ coef + intercept
+            np.testing.assert_allclose(outputs[output][key], expected, rtol=1e-7, atol=1e-7,
+                                       err_msg=f"{facility_name} {output}")
+
+
+def test_running_stats_match_sklearn(tmp_path):
+    # the sums the store keeps for every (facility, model, month), after a load and appends of one row and of many
+    csv_path = tmp_path / "fleet.csv"
+    fleet().to_csv(csv_path, index=False)
+    store = DatasetStore(str(csv_path), columnar=ColumnarStore(str(tmp_path / "columns")) if has_arrow() else None,
+                         log=AppendLog(str(tmp_path / "log")))
+    store.load_csv()
+    store.append(entries_frame([reading("2024-02-21", "Single row", 140.0, 99.0, 90.0, 70.7)]))
+    store.append(entries_frame([reading("2024-03-01", "New facility", 90.0, 70.0, 60.0, 77.7)]))
+    store.append(entries_frame([reading("2024-02-21", "Constant everything")] * 3))
+    store.append(entries_frame([reading("2024-02-22", name, 100.0 + i, 80.0 - i, 70.0, 80.0 - i)
+                                for i, name in enumerate(["Two rows", "Constant input", "Two rows"] * 30)]))
+    snapshot = store.snapshot()
+    frame = snapshot.frame
+    checked = 0
+    for facility_name, facility_stats in snapshot.model_stats.items():
+        rows = frame[frame["facility_name"] == facility_name]
+        for (model, month), stats in facility_stats.items():
+            inputs, target, subset = MODELS[model]
+            month_rows = rows[rows["month"] == month].dropna(subset=subset)
+            assert stats["n"][0] == len(month_rows)
+            coef, intercept = ridge_from_stats(stats)
+            expected_coef, expected_intercept = sklearn_fit(month_rows[inputs], month_rows[target])
+            np.testing.assert_allclose(coef[0], expected_coef, rtol=1e-6, atol=1e-7, err_msg=f"{facility_name} {model}")
+            np.testing.assert_allclose(intercept[0], expected_intercept, rtol=1e-6, atol=1e-5,
+                                       err_msg=f"{facility_name} {model}")
+            checked += 1
+    assert checked >= 3 * 13
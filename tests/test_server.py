@@ -0,0 +1,101 @@
+# Checks of the gRPC service of server.py, through a real server and client (see the fixtures in conftest.py)
+# -------------------------------
+#
+#   python -m pytest -q tests
+
+import os
+
+import grpc
+import pytest
+
+from protos import service_pb2
+from tests.test_ridge import fleet, reading
+
+
+def fleet_csv():
+    return fleet().to_csv(index=False).encode()
+
+
+def entry(date, facility_name, **values):
+    return service_pb2.GlobalInput(**reading(date, facility_name, **values))
+
+
+def files_of(directory):
+    # {path: (size, contents)} of every file under `directory`, to tell whether anything was written
+    found = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                found[path] = f.read()
+    return found
+
+
+def test_writes_are_refused_when_processes_share_the_files(stub, registry, tmp_path):
+    # several server processes (CO2_GRPC_PROCESSES > 1) each number their own append log batches: writing through
+    # them would lose rows, so their datasets are read-only
+    assert stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv())).status == "success"
+    stub.UpdateCSV(entry("2024-03-01", "Facility 1"))
+    registry.make_read_only()
+    saved = files_of(tmp_path)
+
+    with pytest.raises(grpc.RpcError) as error:
+        stub.UpdateCSV(entry("2024-03-02", "Facility 1"))
+    assert error.value.code() == grpc.StatusCode.FAILED_PRECONDITION
+    with pytest.raises(grpc.RpcError) as error:
+        stub.UpdateCSVBatch(service_pb2.UpdateCSVBatchRequest(entries=[entry("2024-03-02", "Facility 2")]))
+    assert error.value.code() == grpc.StatusCode.FAILED_PRECONDITION
+    with pytest.raises(grpc.RpcError) as error:
+        stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv(), dataset_id="other"))
+    assert error.value.code() == grpc.StatusCode.FAILED_PRECONDITION
+
+    chart = stub.GetInsightsPlot(service_pb2.GetInsightsRequest(facility_name="Facility 1")).chart_data
+    assert chart.labels[-1] == "2024-03-01"  # reads still work
+    assert files_of(tmp_path) == saved
+
+
+def test_batch_updates(stub, registry):
+    stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv()))
+    rows = registry.get("").snapshot().rows
+    response = stub.UpdateCSVBatch(service_pb2.UpdateCSVBatchRequest(
+        entries=[entry("2024-03-01", "Facility 1"), entry("2024-03-01", "Facility 2", captured=None)], batch_id=7))
+    assert (response.status, response.batch_id, response.rows_received, response.rows_added) == ("success", 7, 2, 2)
+    assert response.anomalies == 1 and list(response.anomaly_flags) == [False, True]
+
+    records = stub.GetCSV(service_pb2.GetCSVRequest()).records
+    assert len(records) == rows + 2
+    assert [record.fields["anomaly_flag"] for record in records[-3:]] == ["False", "False", "True"]
+    assert records[-1].fields["co2_captured_tonnes"] == ""  # missing, not 0
+
+
+def test_streamed_updates_are_acknowledged_in_order(stub, registry):
+    stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv()))
+    rows = registry.get("").snapshot().rows
+    batches = [service_pb2.UpdateCSVBatchRequest(entries=[entry(f"2024-03-{day:02d}", "Facility 3")] * day, batch_id=day)
+               for day in range(1, 5)]
+    responses = list(stub.StreamUpdateCSV(iter(batches)))
+    assert [(r.batch_id, r.rows_added) for r in responses] == [(1, 1), (2, 2), (3, 3), (4, 4)]
+    assert registry.get("").snapshot().rows == rows + 10
+    chart = stub.GetInsightsPlot(service_pb2.GetInsightsRequest(facility_name="Facility 3")).chart_data
+    assert chart.labels[-1] == "2024-03-04"
+
+
+def test_streamed_responses_match_the_unary_ones(stub, registry):
+    stub.UploadCSV(service_pb2.UploadCSVRequest(file_content=fleet_csv()))
+    records = stub.GetCSV(service_pb2.GetCSVRequest()).records
+    chunks = list(stub.StreamCSV(service_pb2.GetCSVRequest(csv_name="csv_dataset.csv")))
+    assert len(chunks) > 1
+    assert [record for chunk in chunks for record in chunk.records] == list(records)
+
+    request = service_pb2.GetFleetInsightsRequest(facility_names=["Facility 2", "Nowhere", "Facility 0"])
+    streamed = list(stub.StreamFleetInsights(request))
+    assert [facility.facility_name for facility in streamed] == ["Facility 2", "Nowhere", "Facility 0"]
+    assert not streamed[1].HasField("chart_data")  # a facility without data is sent with only its name
+    facilities = {facility.facility_name: facility for facility in stub.GetFleetInsights(request).facilities}
+    assert streamed[0] == facilities["Facility 2"] and streamed[2] == facilities["Facility 0"]
+    assert len(list(stub.StreamFleetInsights(service_pb2.GetFleetInsightsRequest(all_facilities=True)))) == \
+           len(registry.get("").snapshot().facility_index)
+
+    with pytest.raises(grpc.RpcError) as error:
+        list(stub.StreamCSV(service_pb2.GetCSVRequest(csv_name="../secrets.csv")))
+    assert error.value.code() == grpc.StatusCode.NOT_FOUND
@@ -0,0 +1,63 @@
+# Checks of the insights over any date range (window_index.py and insights.window_rows)
+# -------------------------------
+#
+#   python -m pytest -q tests
+
+import numpy as np
+import pytest
+
+from append_log import AppendLog
+from benchmarks.generate_data import generate_fleet
+from dataset_schema import day_labels
+from dataset_store import DatasetStore, entries_frame
+from insights import MODELS, CO2_emssion_pattern, detect_efficiency_pattern, latest_month_rows, storage_efficiency_pattern
+from tests.test_ridge import reading
+from window_index import date_range, parse_window, to_day
+
+PATTERNS = {"emission": (CO2_emssion_pattern, "predicted_values"), "capture": (detect_efficiency_pattern, "predicted_values"),
+            "storage": (storage_efficiency_pattern, "predicted_stored_co2")}
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    generate_fleet(300, 3, days=40, start_date="2024-01-01").to_csv(tmp_path / "fleet.csv", index=False)  # float32 columns
+    store = DatasetStore(str(tmp_path / "fleet.csv"), columnar=None, log=AppendLog(str(tmp_path / "log")))
+    store.columnar = None
+    store.load_csv()
+    store.append(entries_frame([reading("2024-02-10", "Facility 1", emitted=123.45, captured=98.76, stored=90.12)]))
+    return store.snapshot()
+
+
+def test_windows():
+    assert parse_window("") is None
+    assert parse_window("7d") == (7, "d") and parse_window("quarter") == (1, "q") and parse_window("2 Weeks") == (2, "w")
+    with pytest.raises(ValueError):
+        parse_window("7 fortnights")
+    latest = to_day("2024-03-31")
+    assert date_range(window="7d", latest_day=latest) == (to_day("2024-03-25"), latest)
+    assert date_range(window="1m", latest_day=latest) == (to_day("2024-03-01"), latest)
+    assert date_range(start="2024-01-15", window="1m") == (to_day("2024-01-15"), to_day("2024-02-14"))
+    assert date_range(start="2024-01-15") == (to_day("2024-01-15"), None)
+
+
+@pytest.mark.parametrize("model", list(MODELS))
+def test_latest_month_as_a_window_gives_the_same_model(snapshot, model):
+    # the date index and the running sums of the latest month are fitted on the same numbers
+    pattern, key = PATTERNS[model]
+    for facility_name in ["Facility 0", "Facility 1"]:
+        days = day_labels(latest_month_rows(snapshot, facility_name, MODELS[model][2])["date"].to_numpy())
+        latest = pattern(snapshot, facility_name, compact=True)
+        window = pattern(snapshot, facility_name, compact=True, start=days.min(), end=days.max())
+        np.testing.assert_allclose(window[key], latest[key], rtol=1e-10)
+
+
+def test_index_matches_filtering_the_rows(snapshot):
+    frame = snapshot.frame  # a plain DataFrame: rows filtered and fitted one request at a time
+    for window in ["7d", "2w", "1m", "1q"]:
+        indexed = CO2_emssion_pattern(snapshot, "Facility 2", window=window)
+        filtered = CO2_emssion_pattern(frame, "Facility 2", window=window)
+        assert indexed["labels"] == filtered["labels"]
+        assert indexed["actual_values"] == filtered["actual_values"]
+        np.testing.assert_allclose(indexed["predicted_values"], filtered["predicted_values"], rtol=1e-10)
+        assert (indexed["min_emissions"], indexed["max_emissions"]) == (filtered["min_emissions"], filtered["max_emissions"])
+        assert indexed["total_emissions"] == pytest.approx(filtered["total_emissions"], rel=1e-12)
@@ -0,0 +1,153 @@
+# Per-facility date index for insights over any date range
+# -------------------------------
+# The insight functions normally look at a facility's latest calendar month, which the dataset store keeps ready.
+# For any other range (a week, a quarter, start..end) the rows would have to be filtered and the model refitted
+# from scratch on every request. Instead, the first such request for a facility builds this index of its rows:
+#   - per model (see insights.MODELS), the rows without missing values for that model, sorted by date,
+#     so the rows of a date range are found with two binary searches
+#   - prefix sums of the regression statistics (n, sums, products) over those rows, so the model of any range
+#     is solved from two lookups, and prefix sums of every column for range totals
+#   - sparse tables of every column for range minimums and maximums, O(1) per range
+# The index belongs to one version of the facility's rows (see DatasetSnapshot.window_index), after new rows
+# arrive it is rebuilt on its next use.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import NO_DATE, plain_floats
+from insights import MODELS, model_values, sufficient_stats
+
+WINDOW_PATTERN = re.compile(r"^\s*(\d*)\s*(d|w|m|q|y|day|week|month|quarter|year)s?\s*$", re.IGNORECASE)
+WINDOW_UNITS = {"d": "d", "day": "d", "w": "w", "week": "w", "m": "m", "month": "m", "q": "q", "quarter": "q",
+                "y": "y", "year": "y"}
+
+
+def to_day(date):
+    """A date (text, Timestamp or datetime64) as a number of days since 1970-01-01."""
+    day = pd.Timestamp(date)
+    if day is pd.NaT:
+        raise ValueError(f"Invalid date: {date!r}")
+    return int(day.to_datetime64().astype("datetime64[D]").astype(np.int64))
+
+
+def parse_window(window):
+    """A window such as "7d", "2w", "month", "3m", "quarter", "1y" as (count, unit), or None for an empty window."""
+    if not window:
+        return None
+    match = WINDOW_PATTERN.match(window)
+    if match is None:
+        raise ValueError(f"Invalid window: {window!r}, expected e.g. 7d, 2w, 1m, 1q or 1y")
+    count = int(match.group(1) or 1)
+    if count <= 0:
+        raise ValueError(f"Invalid window: {window!r}")
+    return count, WINDOW_UNITS[match.group(2).lower()]
+
+
+def window_start(end_day, count, unit):
+    """First day of the window of `count` units that ends on end_day (both days included)."""
+    if unit == "d":
+        return end_day - count + 1
+    if unit == "w":
+        return end_day - 7 * count + 1
+    months = count * {"m": 1, "q": 3, "y": 12}[unit]
+    end = pd.Timestamp(np.datetime64(int(end_day), "D"))
+    return to_day(end - pd.DateOffset(months=months)) + 1
+
+
+def window_end(start_day, count, unit):
+    """Last day of the window of `count` units that starts on start_day."""
+    if unit in ("d", "w"):
+        return start_day + count * (7 if unit == "w" else 1) - 1
+    months = count * {"m": 1, "q": 3, "y": 12}[unit]
+    return to_day(pd.Timestamp(np.datetime64(int(start_day), "D")) + pd.DateOffset(months=months)) - 1
+
+
+def date_range(start=None, end=None, window=None, latest_day=None):
+    """(first day, last day) of a request, both included, as day numbers (see to_day).
+
+    start/end are dates (either may be left out for an open range). A window alone ends on `latest_day`
+    (the facility's latest reading); with end it ends there, with start it begins there.
+    """
+    first = to_day(start) if start else None
+    last = to_day(end) if end else None
+    spec = parse_window(window)
+    if spec is not None:
+        if first is not None and last is None:
+            last = window_end(first, *spec)
+        elif first is None:
+            if last is None:
+                last = latest_day
+            first = window_start(last, *spec) if last is not None else None
+    return first, last
+
+
+class SparseTable:
+    """Minimum or maximum of any range of a fixed array in O(1), after O(n log n) preparation."""
+
+    def __init__(self, values, function):
+        self.function = function
+        self.levels = [np.asarray(values, dtype=float)]  # levels[k][i] = function of values[i:i + 2**k]
+        width = 1
+        while 2 * width <= len(values):
+            previous = self.levels[-1]
+            self.levels.append(function(previous[:-width], previous[width:]))
+            width *= 2
+
+    def query(self, lo, hi):
+        # function of values[lo:hi], hi > lo
+        level = (hi - lo).bit_length() - 1
+        values = self.levels[level]
+        return float(self.function(values[lo], values[hi - (1 << level)]))
+
+
+class ModelWindows:
+    """The rows of one facility usable by one model, sorted by date, with their prefix sums and sparse tables."""
+
+    def __init__(self, model, rows, positions):
+        inputs, target, subset = MODELS[model]
+        usable = rows[subset].notna().all(axis=1).to_numpy() & (rows["date"].to_numpy() != NO_DATE)
+        rows = rows[usable]
+        days = rows["date"].to_numpy(dtype=np.int64)  # dates are day numbers (see dataset_schema.py)
+        order = np.argsort(days, kind="stable")  # rows of the same day stay in file order
+        self.days = days[order]
+        self.positions = np.asarray(positions)[usable][order]
+        fitted = {c: model_values(rows[c])[order] for c in subset}  # as in the latest month's models (see insights.py)
+        values = {c: plain_floats(rows[c])[order] for c in subset}  # as shown in the charts
+
+        # prefix sums: stats of rows lo..hi-1 = prefix[hi] - prefix[lo]
+        per_row = sufficient_stats(np.stack([fitted[c] for c in inputs], axis=1), fitted[target],
+                                   np.arange(len(order)), len(order))
+        self.prefix = {k: np.concatenate([np.zeros((1,) + v.shape[1:]), np.cumsum(v, axis=0)]) for k, v in per_row.items()}
+        self.totals = {c: np.concatenate([[0.0], np.cumsum(v)]) for c, v in values.items()}
+        self.minimum = {c: SparseTable(v, np.minimum) for c, v in values.items()}
+        self.maximum = {c: SparseTable(v, np.maximum) for c, v in values.items()}
+
+    def __len__(self):
+        return len(self.days)
+
+    def bounds(self, first_day, last_day):
+        """(lo, hi): the rows of days first_day..last_day (both included, None = open) are lo..hi-1. Two binary searches."""
+        lo = 0 if first_day is None else int(np.searchsorted(self.days, first_day, side="left"))
+        hi = len(self.days) if last_day is None else int(np.searchsorted(self.days, last_day, side="right"))
+        return lo, max(lo, hi)
+
+    def stats(self, lo, hi):
+        """Regression statistics of rows lo..hi-1, in the form insights.ridge_from_stats takes (one group)."""
+        return {k: (v[hi] - v[lo])[None] for k, v in self.prefix.items()}
+
+    def summary(self, lo, hi):
+        """{column: (total, min, max)} of rows lo..hi-1 for every column of the model."""
+        if hi <= lo:
+            return {}
+        return {c: (float(self.totals[c][hi] - self.totals[c][lo]), self.minimum[c].query(lo, hi),
+                    self.maximum[c].query(lo, hi)) for c in self.totals}
+
+
+class FacilityWindows:
+    """Date index of one facility's rows at one version of them: one ModelWindows per model."""
+
+    def __init__(self, rows, positions, version):
+        self.version = version
+        self.models = {model: ModelWindows(model, rows, positions) for model in MODELS}